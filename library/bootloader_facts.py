@@ -18,6 +18,97 @@ description:
     - "WARNING: Do not use this module directly! It is only for role internal use."
     - Gather information for kernels as Ansible facts
 
+options:
+    cache_file:
+        description:
+            - Path of a file to cache the facts in between runs.
+            - The cached facts are used as long as the mtime, size and inode of the BLS entries,
+              grubenv, the grub defaults and the grub configuration do not change, so that
+              nothing is read and grubby does not run. When some BLS entries change, only
+              those entries are read again.
+            - The cache is not written in check mode.
+        required: false
+        type: path
+    fields:
+        description:
+            - Keys of the kernel facts to return, all keys when not set.
+            - Kernel args are not parsed when neither C(args) nor C(root) is requested.
+        required: false
+        type: list
+        elements: str
+        choices: ["args", "default", "id", "index", "initrd", "kernel", "root", "title"]
+    kernels:
+        description:
+            - Kernels to return facts for, all kernels when not set.
+            - Each item is C(DEFAULT) for the default kernel, a kernel index, or a glob that
+              is matched against the kernel path and the title. A kernel is returned when any
+              item matches.
+            - The args of BLS entries of other kernels are not parsed.
+        required: false
+        type: list
+        elements: str
+    args_parsed:
+        description:
+            - Add C(args_parsed) with the args of each kernel split by the same parser that
+              bootloader_settings uses, so that the args do not have to be parsed again.
+            - Only kernels with C(args) get C(args_parsed), so I(fields) must include C(args)
+              when it is set.
+        required: false
+        type: bool
+        default: false
+    compact:
+        description:
+            - Store each distinct C(args), C(root) and C(args_parsed) once in
+              C(bootloader_facts_tables) and replace them in each kernel with C(args_ref),
+              C(root_ref) and C(args_parsed_ref), the index of the value in its table.
+        required: false
+        type: bool
+        default: false
+    running:
+        description:
+            - Add the C(bootloader_running) fact with the command line of the running kernel
+              from C(/proc/cmdline), the boot ID, the kernel that is running and the args that
+              differ between the running kernel and the default kernel.
+        required: false
+        type: bool
+        default: false
+    since:
+        description:
+            - Generation token that an earlier run returned in C(generation).
+            - Only the kernels that were added or changed since that generation are returned,
+              and the removed kernels are listed in C(removed). Use the same I(fields) and
+              I(kernels) as the earlier run.
+            - All kernels are returned when the token is not valid.
+        required: false
+        type: str
+    command_timeout:
+        description:
+            - Seconds that each grubby command may run before the module stops it and fails.
+            - C(0) means no limit.
+        required: false
+        type: int
+        default: 0
+    total_timeout:
+        description:
+            - Seconds that all grubby commands of the module may take before the module fails.
+            - Reads of BLS entries run in the module and cannot be stopped, so a hung
+              C(/boot) can still hold the module up.
+            - C(0) means no limit.
+        required: false
+        type: int
+        default: 0
+    instrumentation:
+        description:
+            - Return the external commands that the module runs with their wall time and
+              the time spent in parsing.
+        required: false
+        type: bool
+        default: false
+
+notes:
+    - Set the C(BOOTLOADER_LSR_PROFILE) environment variable of the task to a number N to
+      profile the module with cProfile and return the top N entries by cumulative time in
+      C(profile), or to a path to write the profile to as a C(.pstats) file.
 author:
     - Sergei Petrosian (@spetrosi)
 """
@@ -34,7 +125,10 @@ ansible_facts:
     type: complex
     contains:
         bootloader_facts:
-            description: Boot information for available kernels
+            description:
+                - Boot information for available kernels
+                - Only the kernels in I(kernels) with the keys in I(fields) when they are set
+                - Only the added and changed kernels when I(since) is a valid token
             type: list
             returned: always
             contains:
@@ -70,6 +164,22 @@ ansible_facts:
                     description: kernel title
                     returned: always
                     type: str
+                args_parsed:
+                    description:
+                        - The args as C(options), a list of dicts with the C(name) and the
+                          C(value) of each arg in the shape of bootloader_settings options,
+                          and C(values), a map of each name to its values in order
+                        - The value of an arg without a value is C(null) in C(values)
+                    returned: when args_parsed is true
+                    type: dict
+                    sample:
+                        options:
+                            - name: ro
+                            - name: console
+                              value: tty0
+                        values:
+                            ro: [null]
+                            console: [tty0]
             sample: |-
                 {
                     "bootloader_facts": [
@@ -95,39 +205,224 @@ ansible_facts:
                         }
                     ]
                 }
+bootloader_running:
+    description:
+        - Fact with the running kernel, returned in C(ansible_facts)
+        - C(cmdline) and C(boot_id) are read from C(/proc), C(release) is the running kernel release
+        - C(entry) has the index, id, kernel and title of the kernel that is running, matched
+          by the C(BOOT_IMAGE) arg or the release, C(null) when no kernel matches
+        - C(default) tells whether the running kernel is the default kernel
+        - C(diff) has the args that only the running kernel has in C(running_only) and the args
+          that only the default kernel has in C(configured_only), without C(BOOT_IMAGE) and
+          with grub variables expanded from grubenv
+        - C(drift) is true when the running kernel is not the default kernel or its args
+          differ, so that a reboot applies the configuration
+        - C(null) when C(/proc/cmdline) cannot be read
+    type: dict
+    returned: when running is true
+    sample:
+        cmdline: BOOT_IMAGE=(hd0,gpt2)/vmlinuz-6.6.4-100.fc38.x86_64 root=UUID=2b95a97a ro quiet
+        boot_id: 5b4c5bc4-8d6a-4d1a-9f0b-52d1f0b4f5a3
+        release: 6.6.4-100.fc38.x86_64
+        entry:
+            index: "0"
+            id: 890cea0fd7b140cf890eb0145b3caa72-6.6.4-100.fc38.x86_64
+            kernel: /boot/vmlinuz-6.6.4-100.fc38.x86_64
+            title: Fedora Linux (6.6.4-100.fc38.x86_64) 38 (Cloud Edition)
+        default: true
+        diff:
+            running_only: [quiet]
+            configured_only: [debug]
+        drift: true
+bootloader_facts_tables:
+    description:
+        - Fact with a list of the distinct values of C(args), C(root) and C(args_parsed)
+          of the returned kernels by key, that the C(_ref) keys of the kernels index
+        - Returned in C(ansible_facts)
+    type: dict
+    returned: when compact is true
+    sample:
+        args: ["ro rhgb quiet"]
+        root: ["UUID=2b95a97a-3f73-4566-b0a3-a11b4e9c3663"]
+generation:
+    description:
+        - Opaque token of the returned kernel facts to pass as I(since) to a later run
+    type: str
+    returned: always
+unchanged:
+    description: Whether no kernel was added, changed or removed since I(since)
+    type: bool
+    returned: when since is set
+removed:
+    description:
+        - Kernels removed since I(since), by their id, or by index or path when they
+          have no id
+    type: list
+    elements: str
+    returned: when since is set
+cache_hit:
+    description: Whether the facts came from I(cache_file)
+    type: bool
+    returned: when cache_file is set
+instrumentation:
+    description:
+        - Number of read and write commands, each command with its exit code and wall time,
+          the time per phase and the total time in seconds
+        - Time spent in external commands is counted in the C(commands) phase only
+    type: dict
+    returned: when instrumentation is true
+profile:
+    description:
+        - Top entries of the cProfile profile by cumulative time
+    type: list
+    elements: dict
+    returned: when BOOTLOADER_LSR_PROFILE is a number
+profile_file:
+    description:
+        - Path of the C(.pstats) file that the profile was written to
+    type: str
+    returned: when BOOTLOADER_LSR_PROFILE is a path
 """
 
 
-import re
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.bootloader_lsr.bls import get_bls_facts
+from ansible.module_utils.bootloader_lsr.cache import (
+    get_boot_fingerprint,
+    read_cache,
+    write_cache,
+)
+from ansible.module_utils.bootloader_lsr.compact import (
+    compact_facts,
+    expand_facts,
+)
+from ansible.module_utils.bootloader_lsr.facts_filter import FACT_FIELDS, filter_facts
+from ansible.module_utils.bootloader_lsr.generation import (
+    get_facts_since,
+    get_generation,
+)
+from ansible.module_utils.bootloader_lsr.grubby import check_grubby_read, get_facts
+from ansible.module_utils.bootloader_lsr.instrument import Instrumentation
+from ansible.module_utils.bootloader_lsr.kernel_args import KernelArgs
+from ansible.module_utils.bootloader_lsr.profiling import (
+    start_profiler,
+    stop_profiler,
+)
+from ansible.module_utils.bootloader_lsr.running import get_running_facts
+
+# External commands and phases of the module run
+instrumentation = Instrumentation()
+
+
+def get_bootloader_facts(module, result, entry_cache=None, kernels=None, fields=None):
+    """Get kernel facts from BLS entries or from grubby if they are not used
+
+    Only the kernels that match kernels with the keys in fields are
+    returned, see facts_filter.
+    """
+    bootloader_facts = get_bls_facts(
+        entry_cache=entry_cache, kernels=kernels, fields=fields
+    )
+    if bootloader_facts is not None:
+        return bootloader_facts
+    info, default_index = instrumentation.run_read_commands(
+        module, ["grubby --info=ALL", "grubby --default-index"]
+    )
+    check_grubby_read(module, "grubby --info=ALL", info, **result)
+    return filter_facts(get_facts(info[1], default_index[1]), kernels, fields)
 
 
-def get_facts(kernels_info, default_kernel):
-    """Get kernel facts"""
-    kernels_info_lines = kernels_info.strip().split("\n")
-    kernels = []
-    index_count = 0
-
-    for line in kernels_info_lines:
-        index = re.search(r"index=(\d+)", line)
-        if index:
-            is_default = index.group(1) == default_kernel.strip()
-            index_count += 1
-            kernels.append({})
-        search = re.search(r"(.*?)=(.*)", line)
-        if search:
-            key = search.group(1).strip('"')
-            value = search.group(2).strip('"')
-            kernels[index_count - 1].update({key: value})
-        else:
-            kernels[index_count - 1].update({"kernel": line})
-        kernels[index_count - 1].update({"default": is_default})
-    return kernels
+def get_cached_facts(module, result, kernels=None, fields=None):
+    """Get kernel facts from the cache when the boot configuration did not change
+
+    Otherwise the facts are read again, BLS entries whose files did not
+    change are taken from the cache, and the cache is updated. The cache
+    has the facts of all kernels with repeated args and roots stored once,
+    the kernels and fields filters are applied to the facts that are
+    returned.
+    """
+    cache_file = module.params["cache_file"]
+    if not cache_file:
+        return get_bootloader_facts(module, result, kernels=kernels, fields=fields)
+    cache = read_cache(cache_file)
+    fingerprint = get_boot_fingerprint()
+    result["cache_hit"] = cache.get("fingerprint") == fingerprint
+    if result["cache_hit"]:
+        bootloader_facts = expand_facts(cache["facts"], cache.get("tables", {}))
+        return filter_facts(bootloader_facts, kernels, fields)
+    entry_cache = cache.get("entries", {})
+    bootloader_facts = get_bootloader_facts(module, result, entry_cache)
+    if not module.check_mode:
+        facts, tables = compact_facts(bootloader_facts)
+        try:
+            write_cache(
+                cache_file,
+                {
+                    "fingerprint": fingerprint,
+                    "entries": entry_cache,
+                    "facts": facts,
+                    "tables": tables,
+                },
+            )
+        except (IOError, OSError) as exc:
+            module.warn("Failed to write cache %s: %s" % (cache_file, exc))
+    return filter_facts(bootloader_facts, kernels, fields)
+
+
+def add_args_parsed(bootloader_facts):
+    """Add args_parsed to the facts that have args"""
+    for fact in bootloader_facts:
+        if "args" in fact:
+            fact["args_parsed"] = KernelArgs.parse(fact["args"]).get_parsed()
+
+
+def get_facts_result(module, result):
+    """Get the kernel facts to return and set the generation of the facts
+
+    With since, only the facts that were added or changed since are
+    returned and the removed kernels are set in result. With running, the
+    facts of the running kernel are compared with all kernels before the
+    kernels and fields filters are applied.
+    """
+    kernels = module.params["kernels"]
+    fields = module.params["fields"]
+    if module.params["running"]:
+        bootloader_facts = get_cached_facts(module, result)
+        result["ansible_facts"]["bootloader_running"] = get_running_facts(
+            bootloader_facts
+        )
+        bootloader_facts = filter_facts(bootloader_facts, kernels, fields)
+    else:
+        bootloader_facts = get_cached_facts(module, result, kernels, fields)
+    if module.params["args_parsed"]:
+        add_args_parsed(bootloader_facts)
+    result["generation"] = get_generation(bootloader_facts)
+    since = module.params["since"]
+    if since is None:
+        return bootloader_facts
+    facts_since = get_facts_since(bootloader_facts, since)
+    if facts_since is None:
+        result.update(unchanged=False, removed=[])
+        return bootloader_facts
+    changed, removed = facts_since
+    result.update(unchanged=not changed and not removed, removed=removed)
+    return changed
 
 
 def run_module():
     # define available arguments/parameters a user can pass to the module
-    module_args = dict()
+    module_args = dict(
+        instrumentation=dict(type="bool", default=False),
+        command_timeout=dict(type="int", default=0),
+        total_timeout=dict(type="int", default=0),
+        cache_file=dict(type="path", required=False),
+        fields=dict(type="list", elements="str", choices=list(FACT_FIELDS)),
+        kernels=dict(type="list", elements="str"),
+        args_parsed=dict(type="bool", default=False),
+        compact=dict(type="bool", default=False),
+        running=dict(type="bool", default=False),
+        since=dict(type="str", required=False),
+    )
 
     # seed the result dict in the object
     # we primarily care about changed and state
@@ -142,13 +437,19 @@ def run_module():
     # supports check mode
     module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
 
-    rc, kernels_info, stderr = module.run_command("grubby --info=ALL")
-    if "Permission denied" in stderr:
-        module.fail_json(msg="You must run this as sudo", **result)
-    rc, default_kernel, stderr = module.run_command("grubby --default-index")
-    result["ansible_facts"]["bootloader_facts"] = get_facts(
-        kernels_info, default_kernel
+    profiler = start_profiler()
+    instrumentation.start(
+        module.params["command_timeout"], module.params["total_timeout"]
     )
+    with instrumentation.phase("parse"):
+        bootloader_facts = get_facts_result(module, result)
+        if module.params["compact"]:
+            bootloader_facts, tables = compact_facts(bootloader_facts)
+            result["ansible_facts"]["bootloader_facts_tables"] = tables
+        result["ansible_facts"]["bootloader_facts"] = bootloader_facts
+    if module.params["instrumentation"]:
+        result["instrumentation"] = instrumentation.get_result()
+    stop_profiler(module, profiler, result)
 
     # in the event of a successful module execution, you will want to
     # simple AnsibleModule.exit_json(), passing the key/value results
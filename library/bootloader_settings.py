@@ -18,11 +18,14 @@ version_added: "0.0.1"
 description:
     - "WARNING: Do not use this module directly! It is only for role internal use."
     - Configure grubby boot loader arguments for specified kernels
+    - In diff mode, shows the args, default flag and title of each changed kernel before and after
 
 options:
     bootloader_settings:
-        description: List of dict of kernels and their command line parameters that you want to set.
-        required: true
+        description:
+            - List of dict of kernels and their command line parameters that you want to set.
+            - Required unless I(apply_plan_file) is set.
+        required: false
         type: list
         elements: dict
         suboptions:
@@ -46,6 +49,93 @@ options:
                 required: false
                 type: bool
                 default: false
+    write_backend:
+        description:
+            - How to write args of existing kernels.
+            - With C(bls), args are written directly to the Boot Loader Specification entries,
+              each changed entry once, and the default kernel is written to C(saved_entry) in grubenv.
+              grubby is used when kernels do not have BLS entries.
+        required: false
+        type: str
+        choices: ["grubby", "bls"]
+        default: "grubby"
+    plan_file:
+        description:
+            - Path to write the plan of changes to as JSON.
+            - The plan is not written in check mode.
+        required: false
+        type: path
+    plan_only:
+        description:
+            - Only compute the plan, do not apply it.
+        required: false
+        type: bool
+        default: false
+    apply_plan_file:
+        description:
+            - Path of a plan that I(plan_file) wrote earlier to apply without computing it again.
+            - The module reads the boot configuration and fails when a kernel that the plan
+              modifies or removes no longer has the recorded path and args, when a kernel
+              that the plan creates exists already, or when the kernel that the plan sets as
+              default is missing. Kernels are looked up by their BLS id and addressed by their
+              current grubby index or unique path.
+        required: false
+        type: path
+    command_timeout:
+        description:
+            - Seconds that each grubby command may run before the module stops it and fails.
+            - C(0) means no limit.
+        required: false
+        type: int
+        default: 0
+    total_timeout:
+        description:
+            - Seconds that the module may take before it fails. The module fails before the
+              first grubby command or boot entry write that starts after the limit, and stops
+              a running grubby command at the limit.
+            - Reads of BLS entries and grubenv and writes of boot entries run in the module
+              and cannot be stopped, so a hung C(/boot) can still hold the module up.
+            - C(0) means no limit.
+        required: false
+        type: int
+        default: 0
+    lock_file:
+        description:
+            - File that the module locks with C(flock) while it reads, plans and writes
+              the boot configuration, so that runs of the role and other tools that take
+              the same lock do not change the boot configuration at the same time.
+            - The directory of the file is created when it does not exist. In check mode
+              nothing is created and the file is only locked when it exists.
+        required: false
+        type: path
+        default: /run/lock/bootloader_lsr.lock
+    lock_timeout:
+        description:
+            - Seconds to wait for another process to release I(lock_file) before failing.
+        required: false
+        type: int
+        default: 300
+    state_file:
+        description:
+            - Path of a file on the host to store a hash of I(bootloader_settings) and a
+              fingerprint of the boot configuration in after a successful run.
+            - When both match on the next run, the module returns without running grubby.
+              The fingerprint takes the mtime, size and inode of the BLS entries, grubenv,
+              the grub defaults and the grub configuration.
+            - Not used with I(plan_file) or I(plan_only), and not written in check mode.
+        required: false
+        type: path
+    instrumentation:
+        description:
+            - Return the external commands that the module runs with their wall time and
+              the time spent in parsing, validation, planning and applying.
+        required: false
+        type: bool
+        default: false
+notes:
+    - Set the C(BOOTLOADER_LSR_PROFILE) environment variable of the task to a number N to
+      profile the module with cProfile and return the top N entries by cumulative time in
+      C(profile), or to a path to write the profile to as a C(.pstats) file.
 author:
     - Sergei Petrosian (@spetrosi)
 """
@@ -63,40 +153,120 @@ actions:
     type: str
     returned: always
     # sample: 'hello world'
+plan:
+    description:
+        - Plan of changes per kernel with the current and desired args, the args to
+          remove and add, and the new default kernel
+    type: dict
+    returned: always
+    sample:
+        version: 1
+        all: ["0", "1"]
+        kernels:
+            - action: modify
+              index: "0"
+              kernel: /boot/vmlinuz-6.5.12-100.fc37.x86_64
+              title: Fedora Linux (6.5.12-100.fc37.x86_64) 37
+              current_args: ro rhgb quiet
+              desired_args: ro rhgb debug
+              remove_args: [quiet]
+              add_args: [debug]
+        default: null
+kernels:
+    description:
+        - Kernels with their args and default flag after the changes, in check mode
+          or with I(plan_only) as they would be after the changes
+        - Not returned with I(apply_plan_file) or when I(state_file) matches
+    type: list
+    elements: dict
+    returned: when bootloader_settings is set
+state_match:
+    description:
+        - Whether I(state_file) matched the settings and the boot configuration, so that
+          nothing was read or changed
+        - The plan is empty when it matched
+    type: bool
+    returned: when state_file is used
+instrumentation:
+    description:
+        - Number of read and write commands, each command with its exit code and wall time,
+          the time per phase and the total time in seconds
+        - Time spent in external commands is counted in the C(commands) phase only
+    type: dict
+    returned: when instrumentation is true
+    sample:
+        reads: 2
+        writes: 1
+        commands:
+            - cmd: grubby --info=ALL
+              write: false
+              rc: 0
+              time: 0.0312
+        phases:
+            parse: 0.0011
+            validate: 0.0002
+            plan: 0.0004
+            apply: 0.0001
+            commands: 0.0913
+        total: 0.0935
+profile:
+    description:
+        - Top entries of the cProfile profile by cumulative time
+    type: list
+    elements: dict
+    returned: when BOOTLOADER_LSR_PROFILE is a number
+profile_file:
+    description:
+        - Path of the C(.pstats) file that the profile was written to
+    type: str
+    returned: when BOOTLOADER_LSR_PROFILE is a path
 """
 
-import re
+import json
+import os
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.bootloader_lsr.bls import (
+    BLS_ENTRIES_DIR,
+    DEFAULT_GRUB,
+    get_bls_facts,
+    get_entry_options,
+    get_entry_path,
+    is_bls_enabled,
+    read_entry,
+    write_entry_options,
+)
+from ansible.module_utils.bootloader_lsr.cache import (
+    get_boot_fingerprint,
+    get_data_hash,
+    read_cache,
+    write_cache,
+)
+from ansible.module_utils.bootloader_lsr.fileutil import write_file_atomic
+from ansible.module_utils.bootloader_lsr.grubenv import (
+    GRUBENV,
+    get_grubenv_block,
+    read_grubenv,
+    write_grubenv_block,
+)
+from ansible.module_utils.bootloader_lsr.grubby import check_grubby_read, get_facts
+from ansible.module_utils.bootloader_lsr.instrument import Instrumentation
+from ansible.module_utils.bootloader_lsr.profiling import (
+    start_profiler,
+    stop_profiler,
+)
+from ansible.module_utils.bootloader_lsr.kernel_args import KernelArgs
+from ansible.module_utils.bootloader_lsr.lock import (
+    LOCK_FILE,
+    acquire_lock,
+    release_lock,
+)
 
 # This is a bit of a mystery - bug in pylint?
 # pylint: disable=import-error
 import ansible.module_utils.six.moves as ansible_six_moves
 
 
-def get_facts(kernels_info, default_kernel_index):
-    """Get kernel facts"""
-    kernels_info_lines = kernels_info.strip().split("\n")
-    kernels = []
-    index_count = 0
-
-    for line in kernels_info_lines:
-        index = re.search(r"index=(\d+)", line)
-        if index:
-            is_default = index.group(1) == default_kernel_index.strip()
-            index_count += 1
-            kernels.append({})
-        search = re.search(r"(.*?)=(.*)", line)
-        if search:
-            key = search.group(1).strip('"')
-            value = search.group(2).strip('"')
-            kernels[index_count - 1].update({key: value})
-        else:
-            kernels[index_count - 1].update({"kernel": line})
-        kernels[index_count - 1].update({"default": is_default})
-    return kernels
-
-
 def get_dict_same_keys(dict1, dict2):
     """Shorten dict2 to the same keys as in dict1"""
     return {key1: dict2[key1] for key1 in dict1 if key1 in dict2}
@@ -184,7 +354,75 @@ def validate_default_kernel(module, bootloader_settings):
         )
 
 
-def validate_kernels(module, bootloader_setting, bootloader_facts):
+# Keys that settings select kernels by and the fact keys with their values
+KERNEL_TABLE_KEYS = (
+    ("path", "kernel"),
+    ("title", "title"),
+    ("index", "index"),
+    ("id", "id"),
+    ("initrd", "initrd"),
+)
+
+# Version of the plans that export_plan() returns
+PLAN_VERSION = 2
+
+# External commands and phases of the module run
+instrumentation = Instrumentation()
+
+
+def get_kernel_table_keys(kernel_fact):
+    """Get the values of kernel_fact for the keys that settings select kernels by"""
+    return dict(
+        (key, kernel_fact[fact_key])
+        for key, fact_key in KERNEL_TABLE_KEYS
+        if fact_key in kernel_fact
+    )
+
+
+def get_default_facts(bootloader_facts):
+    """Get facts of the default kernels"""
+    return [fact for fact in bootloader_facts if fact.get("default")]
+
+
+def get_kernel_table(bootloader_facts):
+    """Index bootloader_facts by the keys that settings select kernels by
+
+    The table maps each key to a dict of values to the positions of the
+    kernels that have them. It is not changed after it is built, so it
+    must be built again when kernels are created or removed or when the
+    default kernel changes.
+    """
+    facts = tuple(bootloader_facts)
+    kernel_table = {
+        "facts": facts,
+        "all": tuple(fact for fact in facts if "args" in fact),
+        "default": tuple(get_default_facts(facts)),
+    }
+    positions = dict((key, {}) for key, _unused in KERNEL_TABLE_KEYS)
+    for position, fact in enumerate(facts):
+        for key, value in get_kernel_table_keys(fact).items():
+            positions[key].setdefault(value, []).append(position)
+    for key, values in positions.items():
+        kernel_table[key] = dict(
+            (value, tuple(value_positions)) for value, value_positions in values.items()
+        )
+    return kernel_table
+
+
+def find_kernel_candidates(kernel_table, bootloader_setting_kernel):
+    """Get facts that share at least one key with bootloader_setting_kernel in order"""
+    positions = set()
+    for key, value in bootloader_setting_kernel.items():
+        if key in dict(KERNEL_TABLE_KEYS):
+            try:
+                positions.update(kernel_table[key].get(value, ()))
+            except TypeError:
+                # unhashable values are rejected by validate_kernels
+                pass
+    return [kernel_table["facts"][position] for position in sorted(positions)]
+
+
+def validate_kernels(module, bootloader_setting, kernel_table):
     """Validate that user passes bootloader_setting correctly"""
     kernel_action = ""
     kernel = ""
@@ -248,11 +486,10 @@ def validate_kernels(module, bootloader_setting, bootloader_facts):
         return kernel_action, kernel
 
     # Validate with len(bootloader_setting["kernel"]) > 1
-    for fact in bootloader_facts:
-        # Rename kernel to path in fact dict
-        if "kernel" in fact:
-            fact["path"] = fact.pop("kernel")
-        fact_trunc = get_dict_same_keys(bootloader_setting["kernel"], fact)
+    for fact in find_kernel_candidates(kernel_table, bootloader_setting["kernel"]):
+        fact_trunc = get_dict_same_keys(
+            bootloader_setting["kernel"], get_kernel_table_keys(fact)
+        )
         diff, same = compare_dicts(bootloader_setting["kernel"], fact_trunc)
         if diff and same:
             module.fail_json(
@@ -290,37 +527,157 @@ def escapeval(val):
     return ansible_six_moves.shlex_quote(str(val))
 
 
-def get_boot_args(kernel_info):
-    """Get arguments from kernel info"""
-    args = re.search(r'args="(.*)"', kernel_info)
-    if not args:
+def get_boot_snapshot(module):
+    """Read all kernel entries and the default index from grubby once
+
+    The returned facts serve as the in-memory boot model for the whole run.
+    Each applied action updates it so that later settings see the new state
+    without re-reading it from grubby. Plain BLS entries are read directly
+    and grubby is only used for other boot configurations, with both reads
+    running at the same time. Returns the facts and whether their indexes
+    come from grubby.
+    """
+    bootloader_facts = get_bls_facts()
+    if bootloader_facts is not None:
+        return bootloader_facts, False
+    info, default_index = instrumentation.run_read_commands(
+        module, ["grubby --info=ALL", "grubby --default-index"]
+    )
+    check_grubby_read(module, "grubby --info=ALL", info)
+    return get_facts(info[1], default_index[1]), True
+
+
+def get_kernel_facts(kernel_table, bootloader_setting_kernel):
+    """Get facts of the kernels that grubby selects for bootloader_setting_kernel"""
+    if bootloader_setting_kernel == "ALL":
+        return list(kernel_table["all"])
+    if bootloader_setting_kernel == "DEFAULT":
+        return list(kernel_table["default"])
+    kernel_to_mod = get_kernel_to_mod(
+        bootloader_setting_kernel, ["path", "title", "index"]
+    )
+    if not kernel_to_mod:
+        return []
+    kernel_key, kernel_val = list(kernel_to_mod.items())[0]
+    return [
+        kernel_table["facts"][position]
+        for position in kernel_table[kernel_key].get(str(kernel_val), ())
+    ]
+
+
+def set_default_fact(bootloader_facts, default_fact):
+    """Mark default_fact as the only default kernel in bootloader_facts"""
+    for fact in bootloader_facts:
+        fact["default"] = fact is default_fact
+
+
+def get_boot_args(kernel_facts):
+    """Get arguments of the first kernel in kernel_facts"""
+    if not kernel_facts:
         return ""
-    return args.group(1).strip()
+    return kernel_facts[0].get("args", "").strip()
+
+
+def update_args(bootloader_args, remove_args, add_args):
+    """Return bootloader_args with remove_args and add_args applied like grubby does
+
+    grubby removes the first matching token for every arg in remove_args, an
+    arg without a value also matches the same name with any value. Then it
+    removes the first token with the same name for every arg in add_args and
+    appends add_args to the end.
+    """
+    return str(KernelArgs.parse(bootloader_args).update(remove_args, add_args))
+
+
+def update_kernel_args(kernel_facts, remove_args, add_args):
+    """Update args of kernel_facts in the in-memory boot model"""
+    for fact in kernel_facts:
+        fact["args"] = update_args(fact.get("args", ""), remove_args, add_args)
 
 
 def apply_command(module, result, cmd):
     """Run a grubby write command, or only record it in check mode.
 
     Read-only grubby commands (for example --info, --default-kernel) must
-    call module.run_command() directly so they still run in check mode.
+    call instrumentation.run_command() directly so they still run in check
+    mode. Fails when the command exits with a non-zero rc, the commands
+    before it have run.
     """
     result["actions"].append(cmd)
-    if not module.check_mode:
-        module.run_command(cmd)
+    if module.check_mode:
+        return
+    rc, stdout, stderr = instrumentation.run_command(module, cmd, write=True)
+    if rc != 0:
+        result["changed"] = len(result["actions"]) > 1
+        module.fail_json(
+            msg="Command '%s' failed with rc %s" % (cmd, rc),
+            rc=rc,
+            stdout=stdout,
+            stderr=stderr,
+            **result
+        )
 
 
-def rm_boot_args(module, result, kernel_info, kernel):
-    """Remove all existing args for a kernel"""
-    bootloader_args = get_boot_args(kernel_info)
-    if not bootloader_args:
-        return
-    cmd = (
-        "grubby --update-kernel="
-        + kernel
-        + " --remove-args="
-        + escapeval(bootloader_args)
-    )
-    apply_command(module, result, cmd)
+def get_args_delta(current_args, desired_args):
+    """Get the smallest remove and add args that make grubby turn current_args into desired_args"""
+    return KernelArgs.parse(current_args).get_delta(KernelArgs.parse(desired_args))
+
+
+def get_args_cmd(remove_args, add_args):
+    """Get --remove-args and --args for a grubby command"""
+    boot_mod_args = ""
+    if remove_args:
+        boot_mod_args = " --remove-args=" + escapeval(" ".join(remove_args))
+    if add_args:
+        boot_mod_args += " --args=" + escapeval(" ".join(add_args))
+    return boot_mod_args
+
+
+def new_plan(bootloader_facts, grubby_indexes=True):
+    """Get an empty plan of changes to the kernels in bootloader_facts
+
+    The plan collects changes of all bootloader_settings per kernel so that
+    they are written with the smallest number of grubby commands. Existing
+    kernels are referenced by their index in the snapshot because all
+    modifications run before kernels are removed or created. grubby_indexes
+    tells whether the indexes come from grubby, so that grubby writes can
+    use them, see get_kernel_target().
+    """
+    paths = {}
+    for fact in bootloader_facts:
+        paths[fact.get("kernel")] = paths.get(fact.get("kernel"), 0) + 1
+    return {
+        "kernels": [],
+        "default": None,
+        "indexes": dict((id(fact), fact.get("index")) for fact in bootloader_facts),
+        "grubby_indexes": grubby_indexes,
+        # Number of kernels with each path in the snapshot
+        "paths": paths,
+        # Indexes of the kernels that grubby --update-kernel=ALL updates
+        "all": [fact.get("index") for fact in bootloader_facts if "args" in fact],
+    }
+
+
+def find_plan_record(plan, kernel_fact):
+    """Find the plan record of kernel_fact"""
+    for record in plan["kernels"]:
+        if record["fact"] is kernel_fact:
+            return record
+    return None
+
+
+def get_plan_record(plan, kernel_fact):
+    """Get the plan record of kernel_fact, add a modify record when there is none"""
+    record = find_plan_record(plan, kernel_fact)
+    if record is None:
+        record = {
+            "action": "modify",
+            "fact": kernel_fact,
+            "index": plan["indexes"].get(id(kernel_fact)),
+            "args": kernel_fact.get("args", ""),
+        }
+        plan["kernels"].append(record)
+    return record
 
 
 def get_setting_name(kernel_setting):
@@ -331,7 +688,11 @@ def get_setting_name(kernel_setting):
     ):
         return ""
     if "value" in kernel_setting:
-        return kernel_setting["name"] + "=" + str(kernel_setting["value"])
+        value = str(kernel_setting["value"])
+        # The kernel splits unquoted values with whitespace into separate args
+        if any(char.isspace() for char in value) and not value.startswith('"'):
+            value = '"%s"' % value
+        return kernel_setting["name"] + "=" + value
     else:
         return kernel_setting["name"]
 
@@ -353,44 +714,57 @@ def get_duplicate_present_option_names(bootloader_setting_options):
     return {name for name in set(present_names) if present_names.count(name) > 1}
 
 
-def find_boot_arg_tokens(bootloader_args, name):
-    """Find kernel argument tokens for an option name in bootloader_args."""
-    if not bootloader_args:
-        return []
-    # Match existing mod_boot_args regex style
-    pattern = r"(?:^| )(" + re.escape(name) + r"(?:=[^\s]+)?)"
-    return [match.group(1) for match in re.finditer(pattern, bootloader_args)]
-
-
-def add_kernel(module, result, bootloader_setting, kernel):
+def add_kernel(plan, bootloader_setting, kernel, bootloader_facts):
     """Add a kernel with specified args"""
     bootloader_setting_options = bootloader_setting.get("options", [])
     bootloader_setting_default = bootloader_setting.get("default", False)
-    boot_args = ""
-    args = ""
-    for kernel_setting in bootloader_setting_options:
-        setting_name = get_setting_name(kernel_setting)
-        boot_args += setting_name + " "
-    if len(boot_args) > 0:
-        args = "--args=" + escapeval(boot_args.strip())
-    if {"copy_default": True} in bootloader_setting_options:
-        args += " --copy-default"
+    copy_default = {"copy_default": True} in bootloader_setting_options
+    boot_args = [
+        setting_name
+        for setting_name in map(get_setting_name, bootloader_setting_options)
+        if setting_name
+    ]
+
+    new_args = ""
+    set_default_before = None
+    if copy_default:
+        new_args = get_boot_args(get_default_facts(bootloader_facts))
+        # grubby copies the args of its own default kernel, so a default
+        # kernel that the plan sets earlier must be set before the creation
+        if plan["default"] is not None and plan["default"].get("default"):
+            set_default_before = plan["default"]
+    new_fact = {
+        "args": update_args(new_args, [], boot_args),
+        "default": False,
+        "initrd": str(bootloader_setting["kernel"]["initrd"]),
+        "kernel": str(bootloader_setting["kernel"]["path"]),
+        "title": str(bootloader_setting["kernel"]["title"]),
+    }
+    plan["kernels"].append(
+        {
+            "action": "create",
+            "fact": new_fact,
+            "kernel": kernel,
+            "args": " ".join(boot_args),
+            "created_args": new_fact["args"],
+            "copy_default": copy_default,
+            "make_default": bootloader_setting_default,
+            "set_default_before": set_default_before,
+        }
+    )
+    bootloader_facts.append(new_fact)
     if bootloader_setting_default:
-        args += " --make-default"
-    cmd = "grubby %s %s" % (kernel, args.strip())
-    apply_command(module, result, cmd)
+        set_default_fact(bootloader_facts, new_fact)
 
 
-def mod_boot_args(module, result, bootloader_setting, kernel, kernel_info):
-    """Build cmd to modify args for a kernel"""
-    bootloader_setting_options = bootloader_setting.get("options", [])
-    boot_absent_args = ""
-    boot_present_args = ""
-    boot_mod_args = ""
-    bootloader_args = get_boot_args(kernel_info)
+def get_boot_args_delta(bootloader_setting_options, bootloader_args):
+    """Get args to remove and to add to apply options to bootloader_args"""
+    boot_absent_args = []
+    boot_present_args = []
+    current_args = KernelArgs.parse(bootloader_args)
     duplicate_names = get_duplicate_present_option_names(bootloader_setting_options)
 
-    for name in duplicate_names:
+    for name in sorted(duplicate_names):
         expected_tokens = []
         seen_tokens = set()
         for kernel_setting in bootloader_setting_options:
@@ -402,12 +776,10 @@ def mod_boot_args(module, result, bootloader_setting, kernel, kernel_info):
                 if token not in seen_tokens:
                     seen_tokens.add(token)
                     expected_tokens.append(token)
-        existing_tokens = find_boot_arg_tokens(bootloader_args, name)
+        existing_tokens = current_args.get_tokens(name)
         if existing_tokens != expected_tokens:
-            for token in existing_tokens:
-                boot_absent_args += token + " "
-            for token in expected_tokens:
-                boot_present_args += token + " "
+            boot_absent_args.extend(existing_tokens)
+            boot_present_args.extend(expected_tokens)
 
     for kernel_setting in bootloader_setting_options:
         setting_name = get_setting_name(kernel_setting)
@@ -419,57 +791,536 @@ def mod_boot_args(module, result, bootloader_setting, kernel, kernel_info):
         ):
             continue
         if "state" in kernel_setting and kernel_setting["state"] == "absent":
-            if re.search(
-                r"(^|$| )" + kernel_setting["name"] + r"($| |=)", bootloader_args
-            ):
-                boot_absent_args += setting_name + " "
+            if current_args.has_name(kernel_setting["name"]):
+                boot_absent_args.append(setting_name)
         else:
-            if not re.search(r"(^|$| )" + setting_name + r"(^|$| )", bootloader_args):
-                boot_present_args += setting_name + " "
-    if boot_absent_args:
-        boot_mod_args = " --remove-args=" + escapeval(boot_absent_args.strip())
-    if len(boot_present_args) > 0:
-        boot_mod_args += " --args=" + escapeval(boot_present_args.strip())
-    if boot_mod_args:
-        cmd = "grubby --update-kernel=" + kernel + boot_mod_args
-        apply_command(module, result, cmd)
+            if setting_name not in current_args:
+                boot_present_args.append(setting_name)
+    return boot_absent_args, boot_present_args
+
+
+def mod_boot_args(plan, bootloader_setting, kernel_facts):
+    """Plan to modify args for kernels"""
+    bootloader_setting_options = bootloader_setting.get("options", [])
+    for kernel_fact in kernel_facts:
+        boot_absent_args, boot_present_args = get_boot_args_delta(
+            bootloader_setting_options, kernel_fact.get("args", "")
+        )
+        if boot_absent_args or boot_present_args:
+            get_plan_record(plan, kernel_fact)
+            update_kernel_args([kernel_fact], boot_absent_args, boot_present_args)
 
 
-def mod_default_kernel(module, result, bootloader_setting, kernel_info):
+def mod_default_kernel(plan, bootloader_setting, kernel_facts, bootloader_facts):
     """Modify default kernel"""
     bootloader_setting_default = bootloader_setting.get("default", False)
     if not bootloader_setting_default:
         return
 
-    kernel_match = re.search(r'^kernel="([^"]*)"', kernel_info, re.MULTILINE)
-    if not kernel_match:
+    if not kernel_facts or "kernel" not in kernel_facts[0]:
         return
 
-    kernel = kernel_match.group(1)
-    current_default = get_default_kernel(module, "kernel")
-    if current_default == kernel:
+    kernel = kernel_facts[0]["kernel"]
+    current_default = get_default_facts(bootloader_facts)
+    if current_default and current_default[0].get("kernel") == kernel:
         return
 
-    cmd = "grubby --set-default=" + kernel
-    apply_command(module, result, cmd)
+    # grubby makes the first entry with this kernel path the default
+    plan["default"] = [
+        fact for fact in bootloader_facts if fact.get("kernel") == kernel
+    ][0]
+    set_default_fact(bootloader_facts, plan["default"])
+
+
+def rm_kernel(plan, kernel_facts, bootloader_facts):
+    """Remove kernels"""
+    for kernel_fact in kernel_facts:
+        record = get_plan_record(plan, kernel_fact)
+        if record["action"] == "create":
+            plan["kernels"].remove(record)
+        else:
+            record["action"] = "remove"
+
+    # grubby renumbers the remaining entries
+    bootloader_facts[:] = [
+        fact
+        for fact in bootloader_facts
+        if not any(fact is kernel_fact for kernel_fact in kernel_facts)
+    ]
+    index = 0
+    for fact in bootloader_facts:
+        if "index" in fact:
+            fact["index"] = str(index)
+            index += 1
+
+
+def get_plan_default(plan):
+    """Get the fact of the kernel to set as default, None if it is not changed"""
+    default_fact = plan["default"]
+    if default_fact is None or not default_fact.get("default"):
+        # a kernel created later with make_default is the default
+        return None
+    record = find_plan_record(plan, default_fact)
+    if record is not None and record["action"] == "remove":
+        return None
+    return default_fact
+
+
+def get_plan_kernel(kernel_fact, keys):
+    """Get the keys of kernel_fact that kernel_fact has"""
+    return dict((key, kernel_fact[key]) for key in keys if key in kernel_fact)
 
 
-def rm_kernel(module, result, kernel):
-    """Remove a kernel"""
-    cmd = "grubby --remove-kernel=%s" % kernel
-    apply_command(module, result, cmd)
+def export_plan(plan):
+    """Get the plan as data that can be written as JSON and applied later
 
+    Each kernel lists its current and desired args and the args that grubby
+    removes and adds. Existing kernels are referenced by their index in the
+    snapshot, the path, id and title are for reference. Kernels whose args
+    end up unchanged are left out. The exported plan is all that
+    get_plan_commands() and apply_plan() need.
+    """
+    kernels = []
+    for record in plan["kernels"]:
+        kernel = get_plan_kernel(record["fact"], ("kernel", "id", "title"))
+        kernel["action"] = record["action"]
+        desired_args = record["fact"].get("args", "")
+        if record["action"] == "create":
+            remove_args, add_args = [], []
+            if record["copy_default"]:
+                remove_args, add_args = get_args_delta(
+                    record["created_args"], desired_args
+                )
+            kernel.update(
+                initrd=record["fact"]["initrd"],
+                # Args planned after creating the kernel are added with the kernel
+                args=record["args"] if record["copy_default"] else desired_args,
+                copy_default=record["copy_default"],
+                make_default=record["make_default"],
+                set_default_before=(
+                    record["set_default_before"]["kernel"]
+                    if record["set_default_before"] is not None
+                    else None
+                ),
+                desired_args=desired_args,
+                remove_args=remove_args,
+                add_args=add_args,
+            )
+        else:
+            kernel.update(
+                index=record["index"],
+                target=get_kernel_target(plan, record),
+                current_args=record["args"],
+            )
+        if record["action"] == "modify":
+            remove_args, add_args = get_args_delta(record["args"], desired_args)
+            if not remove_args and not add_args:
+                continue
+            kernel.update(
+                desired_args=desired_args, remove_args=remove_args, add_args=add_args
+            )
+        kernels.append(kernel)
+
+    default_fact = get_plan_default(plan)
+    if default_fact is not None:
+        default_fact = get_plan_kernel(default_fact, ("kernel", "id", "title"))
+    return {
+        "version": PLAN_VERSION,
+        "all": list(plan["all"]),
+        "kernels": kernels,
+        "default": default_fact,
+    }
+
+
+def get_kernel_target(plan, record):
+    """Get the index or path that grubby writes to the kernel of a plan record
+
+    BLS entries read without grubby are ordered like sort -V, while grubby
+    may order them with rpm-sort, so their indexes are only used for reads.
+    Those kernels are addressed by their path when no other kernel has it,
+    else the target is None and resolve_kernel_targets() looks up the
+    grubby index by the id.
+    """
+    if plan["grubby_indexes"]:
+        return record["index"]
+    path = record["fact"].get("kernel")
+    if path and plan["paths"].get(path) == 1:
+        return path
+    return None
 
-def get_default_kernel(module, type):
-    if type not in ["kernel", "title", "index"]:
-        module.fail_json(msg="Type must be one of 'kernel', 'title', or 'index'")
-    cmd = "grubby --default-" + type
-    _unused, stdout, _unused = module.run_command(cmd)
-    return stdout.strip()
 
+def get_kernel_selector(kernel):
+    """Get the --update-kernel or --remove-kernel value of an existing kernel
+
+    Kernels whose target is not resolved yet are shown by their snapshot
+    index, for example in check mode output of plan_only.
+    """
+    if kernel["target"] is not None:
+        return kernel["target"]
+    return kernel["index"]
 
-def get_replaced_args(bootloader_setting_options):
-    """Get the sorted list of desired arg tokens for a replacement check."""
+
+def resolve_kernel_targets(module, plan):
+    """Set grubby indexes as targets of kernels that have no unique path
+
+    The indexes are taken from grubby --info=ALL by the id of the kernel.
+    Only runs grubby when a kernel needs it.
+    """
+    unresolved = [
+        kernel
+        for kernel in plan["kernels"]
+        if kernel["action"] != "create" and kernel["target"] is None
+    ]
+    if not unresolved:
+        return
+    info = instrumentation.run_command(module, "grubby --info=ALL")
+    check_grubby_read(module, "grubby --info=ALL", info)
+    grubby_indexes = dict(
+        (fact.get("id"), fact["index"]) for fact in get_facts(info[1], "")
+    )
+    for kernel in unresolved:
+        if kernel.get("id") not in grubby_indexes:
+            module.fail_json(
+                msg="grubby does not list the kernel with id %s" % kernel["id"]
+            )
+        kernel["target"] = grubby_indexes[kernel["id"]]
+
+
+def get_plan_updates(plan):
+    """Get the kernels of an exported plan whose args are modified"""
+    return [kernel for kernel in plan["kernels"] if kernel["action"] == "modify"]
+
+
+def get_kernel_delta(kernel):
+    """Get the remove and add args of a kernel of an exported plan"""
+    return tuple(kernel["remove_args"]), tuple(kernel["add_args"])
+
+
+def get_bulk_delta(plan, updates):
+    """Get the remove and add args that all kernels are updated with, if any
+
+    Kernels that the plan removes do not need to be updated, so they do not
+    prevent a bulk update.
+    """
+    removed = set(
+        kernel["index"] for kernel in plan["kernels"] if kernel["action"] == "remove"
+    )
+    deltas = {}
+    for kernel in updates:
+        deltas.setdefault(get_kernel_delta(kernel), set()).add(kernel["index"])
+    for delta, indexes in deltas.items():
+        if len(indexes) > 1 and removed.union(indexes).issuperset(plan["all"]):
+            return delta
+    return None
+
+
+def get_update_commands(plan):
+    """Get grubby commands that modify args of existing kernels
+
+    Each kernel is updated with a single --update-kernel. When all kernels
+    need the same args removed and added, they are updated together with
+    --update-kernel=ALL.
+    """
+    commands = []
+    updates = get_plan_updates(plan)
+    bulk_delta = get_bulk_delta(plan, updates)
+    if bulk_delta is not None:
+        commands.append("grubby --update-kernel=ALL" + get_args_cmd(*bulk_delta))
+    for kernel in updates:
+        if get_kernel_delta(kernel) == bulk_delta:
+            continue
+        commands.append(
+            "grubby --update-kernel="
+            + escapeval(get_kernel_selector(kernel))
+            + get_args_cmd(kernel["remove_args"], kernel["add_args"])
+        )
+    return commands
+
+
+def get_removal_key(kernel):
+    """Sort key that removes kernels addressed by index from the highest index"""
+    selector = str(get_kernel_selector(kernel))
+    if selector.isdigit():
+        return (0, -int(selector))
+    return (1, 0)
+
+
+def get_plan_commands(plan, update_commands=True, default_command=True):
+    """Get the smallest list of grubby commands that apply an exported plan
+
+    Args of existing kernels are modified first, each kernel with a single
+    --update-kernel, while the indexes are still valid. Existing kernels
+    are addressed by their path when it is unique, else by their grubby
+    index, see resolve_kernel_targets(). Then kernels are removed, those
+    addressed by index from the highest index, kernels are created, and
+    the default kernel is set once at the end. grubby --copy-default copies
+    the args of the kernel that is default at that time, so when the plan
+    sets the default kernel before a kernel is created with copy_default,
+    the default kernel is set before that creation instead. With
+    update_commands=False or default_command=False, the args of existing
+    kernels or the default kernel are left to the caller.
+    """
+    commands = []
+    if update_commands:
+        commands.extend(get_update_commands(plan))
+
+    removed = [kernel for kernel in plan["kernels"] if kernel["action"] == "remove"]
+    for kernel in sorted(removed, key=get_removal_key):
+        commands.append(
+            "grubby --remove-kernel=" + escapeval(get_kernel_selector(kernel))
+        )
+
+    # Kernel path of the default kernel that a command of the plan set
+    current_default = None
+    for kernel in plan["kernels"]:
+        if kernel["action"] != "create":
+            continue
+        set_default_before = kernel.get("set_default_before")
+        if set_default_before and set_default_before != current_default:
+            commands.append("grubby --set-default=" + escapeval(set_default_before))
+            current_default = set_default_before
+        if kernel["make_default"]:
+            current_default = kernel["kernel"]
+        args = ""
+        if kernel["args"]:
+            args = "--args=" + escapeval(kernel["args"])
+        if kernel["copy_default"]:
+            args += " --copy-default"
+        if kernel["make_default"]:
+            args += " --make-default"
+        create_kernel = get_create_kernel(
+            {
+                "path": kernel["kernel"],
+                "title": kernel["title"],
+                "initrd": kernel["initrd"],
+            }
+        )
+        commands.append("grubby %s %s" % (create_kernel, args.strip()))
+        if kernel["remove_args"] or kernel["add_args"]:
+            commands.append(
+                "grubby --update-kernel="
+                + escapeval(kernel["kernel"])
+                + get_args_cmd(kernel["remove_args"], kernel["add_args"])
+            )
+
+    if (
+        default_command
+        and plan["default"] is not None
+        and plan["default"]["kernel"] != current_default
+    ):
+        commands.append("grubby --set-default=" + escapeval(plan["default"]["kernel"]))
+    return commands
+
+
+def get_bls_entry_updates(plan):
+    """Get the BLS entries to write for modified kernels of an exported plan
+
+    Returns None when a modified kernel has no BLS entry so that the plan is
+    applied with grubby only.
+    """
+    if not is_bls_enabled(BLS_ENTRIES_DIR, DEFAULT_GRUB):
+        return None
+    entry_updates = []
+    for kernel in get_plan_updates(plan):
+        if not kernel.get("id"):
+            return None
+        entry_path = get_entry_path(kernel["id"], BLS_ENTRIES_DIR)
+        if not os.path.isfile(entry_path):
+            return None
+        entry_updates.append((entry_path, kernel["remove_args"], kernel["add_args"]))
+    return entry_updates
+
+
+def write_bls_entries(module, result, entry_updates):
+    """Write args of modified kernels directly to their BLS entries
+
+    grubby applies --remove-args and --args to the options of the entry
+    including root=, so the same args are applied to the entry options
+    rather than to the args from the facts.
+    """
+    kernelopts = read_grubenv(GRUBENV).get("kernelopts", "")
+    for entry_path, remove_args, add_args in entry_updates:
+        result["actions"].append(
+            "write " + entry_path + get_args_cmd(remove_args, add_args)
+        )
+        if module.check_mode:
+            continue
+        instrumentation.check_deadline(module, "writing " + entry_path)
+        try:
+            options = get_entry_options(read_entry(entry_path), kernelopts)
+            write_entry_options(entry_path, update_args(options, remove_args, add_args))
+        except (IOError, OSError) as exc:
+            module.fail_json(
+                msg="Failed to write boot entry %s: %s" % (entry_path, exc), **result
+            )
+
+
+def get_saved_entry_block(plan):
+    """Get the grubenv block that sets the default kernel of an exported plan
+
+    Returns None when the default kernel is not changed or it cannot be set
+    through saved_entry so that it is set with grubby.
+    """
+    default_kernel = plan["default"]
+    if default_kernel is None or not default_kernel.get("id"):
+        return None
+    if any(kernel.get("set_default_before") for kernel in plan["kernels"]):
+        # grubby sets the default kernel before a kernel is created
+        return None
+    if not is_bls_enabled(BLS_ENTRIES_DIR, DEFAULT_GRUB):
+        return None
+    if not os.path.isfile(get_entry_path(default_kernel["id"], BLS_ENTRIES_DIR)):
+        return None
+    try:
+        return get_grubenv_block(GRUBENV, "saved_entry", default_kernel["id"])
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def write_saved_entry(module, result, plan, block):
+    """Set the default kernel with a single rewrite of the grubenv block"""
+    result["actions"].append(
+        "write " + GRUBENV + " saved_entry=" + escapeval(plan["default"]["id"])
+    )
+    if module.check_mode:
+        return
+    instrumentation.check_deadline(module, "writing " + GRUBENV)
+    try:
+        write_grubenv_block(GRUBENV, block)
+    except (IOError, OSError) as exc:
+        module.fail_json(msg="Failed to write %s: %s" % (GRUBENV, exc), **result)
+
+
+def apply_plan(module, result, plan):
+    """Apply an exported plan with grubby commands
+
+    Plans read from a file are checked against the boot configuration by
+    verify_plan() first. With the bls write backend, args of existing
+    kernels are written directly to their BLS entries, each changed entry
+    once, and the default kernel is written to saved_entry in grubenv.
+    Kernels are still created and removed with grubby.
+    """
+    update_commands = True
+    default_command = True
+    resolve_kernel_targets(module, plan)
+    if module.params["write_backend"] == "bls":
+        entry_updates = get_bls_entry_updates(plan)
+        if entry_updates is not None:
+            write_bls_entries(module, result, entry_updates)
+            update_commands = False
+        block = get_saved_entry_block(plan)
+        if block is not None:
+            write_saved_entry(module, result, plan, block)
+            default_command = False
+    for cmd in get_plan_commands(plan, update_commands, default_command):
+        apply_command(module, result, cmd)
+
+
+def write_plan(module, plan_file, plan):
+    """Write an exported plan to plan_file as JSON"""
+    try:
+        write_file_atomic(plan_file, json.dumps(plan, indent=2, sort_keys=True) + "\n")
+    except (IOError, OSError) as exc:
+        module.fail_json(msg="Failed to write plan %s: %s" % (plan_file, exc))
+
+
+def read_plan(module, plan_file):
+    """Read a plan that write_plan() exported"""
+    try:
+        with open(plan_file, "r") as plan_fd:
+            plan = json.load(plan_fd)
+    except (IOError, OSError, ValueError) as exc:
+        module.fail_json(msg="Failed to read plan %s: %s" % (plan_file, exc))
+    if not isinstance(plan, dict) or plan.get("version") != PLAN_VERSION:
+        module.fail_json(
+            msg="Plan %s is not a version %d bootloader plan"
+            % (plan_file, PLAN_VERSION)
+        )
+    return plan
+
+
+def verify_plan(module, plan):
+    """Check that the kernels of a plan read from a file did not change
+
+    Each kernel that the plan modifies or removes is looked up in the
+    current boot configuration by its id, or by its index when it has no
+    id, and must still have the recorded path and args. Kernels are then
+    addressed by their current grubby index or unique path, so installing
+    another kernel before the plan is applied does not shift the writes to
+    other kernels. Kernels that the plan creates must not exist yet, and
+    the kernel that the plan sets as default must exist unless the plan
+    creates it.
+    """
+    bootloader_facts, grubby_indexes = get_boot_snapshot(module)
+    facts_by_id = dict(
+        (fact["id"], fact) for fact in bootloader_facts if fact.get("id")
+    )
+    facts_by_index = dict((fact["index"], fact) for fact in bootloader_facts)
+    paths = {}
+    for fact in bootloader_facts:
+        paths[fact.get("kernel")] = paths.get(fact.get("kernel"), 0) + 1
+    created = set()
+    for kernel in plan["kernels"]:
+        if kernel["action"] == "create":
+            if kernel["kernel"] in paths:
+                module.fail_json(
+                    msg="Kernel %s that the plan creates exists already"
+                    % kernel["kernel"]
+                )
+            set_default_before = kernel.get("set_default_before")
+            if set_default_before and set_default_before not in created | set(paths):
+                module.fail_json(
+                    msg="Default kernel %s of the plan does not exist"
+                    % set_default_before
+                )
+            created.add(kernel["kernel"])
+            continue
+        if kernel.get("id"):
+            fact = facts_by_id.get(kernel["id"])
+        else:
+            fact = facts_by_index.get(kernel["index"])
+        if (
+            fact is None
+            or fact.get("kernel") != kernel.get("kernel")
+            or fact.get("args") != kernel["current_args"]
+        ):
+            module.fail_json(
+                msg="Kernel %s changed since the plan was computed"
+                % (kernel.get("id") or kernel.get("kernel") or kernel["index"])
+            )
+        if kernel["target"] == kernel.get("kernel"):
+            if paths[fact["kernel"]] > 1:
+                kernel["target"] = None
+        elif grubby_indexes:
+            kernel["target"] = fact["index"]
+        else:
+            kernel["target"] = None
+        if kernel["target"] is None and not kernel.get("id"):
+            module.fail_json(
+                msg="Kernel %s cannot be addressed by index or path" % kernel["kernel"]
+            )
+    default_kernel = plan["default"]
+    if default_kernel is not None and default_kernel["kernel"] not in created:
+        if default_kernel.get("id"):
+            fact = facts_by_id.get(default_kernel["id"])
+            exists = fact is not None and fact.get("kernel") == default_kernel["kernel"]
+        else:
+            exists = default_kernel["kernel"] in paths
+        if not exists:
+            module.fail_json(
+                msg="Default kernel %s of the plan does not exist"
+                % (default_kernel.get("id") or default_kernel["kernel"])
+            )
+    bulk_update = get_bulk_delta(plan, get_plan_updates(plan)) is not None
+    current_all = [fact for fact in bootloader_facts if "args" in fact]
+    if bulk_update and len(current_all) != len(plan["all"]):
+        module.fail_json(
+            msg="Kernels were created or removed since the plan was computed"
+        )
+
+
+def get_replacement_args(bootloader_setting_options):
+    """Get the desired arg tokens of a 'previous: replaced' setting in order."""
     tokens = []
     duplicate_names = get_duplicate_present_option_names(bootloader_setting_options)
     seen_dup_tokens = set()
@@ -486,78 +1337,275 @@ def get_replaced_args(bootloader_setting_options):
                 tokens.append(setting_name)
         else:
             tokens.append(setting_name)
-    return sorted(tokens)
+    return tokens
 
 
-def needs_replacement(bootloader_setting_options, kernel_info):
+def needs_replacement(bootloader_setting_options, bootloader_args):
     """Check if a 'previous: replaced' operation would actually change the args."""
-    current_args = get_boot_args(kernel_info)
-    current_tokens = sorted(current_args.split()) if current_args else []
-    desired_tokens = get_replaced_args(bootloader_setting_options)
-    return current_tokens != desired_tokens
+    desired_args = KernelArgs(get_replacement_args(bootloader_setting_options))
+    return KernelArgs.parse(bootloader_args) != desired_args
 
 
-def run_module():
-    # define available arguments/parameters a user can pass to the module
-    module_args = dict(
-        bootloader_settings=dict(type="list", required=True, elements="dict")
-    )
+def replace_boot_args(plan, bootloader_setting_options, kernel_facts):
+    """Replace args of kernels with the args of options
 
-    # seed the result dict in the object
-    # we primarily care about changed and state
-    # changed is if this module effectively modified the target
-    # state will include any data that you want your module to pass back
-    # for consumption, for example, in a subsequent task
-    result = dict(changed=False, actions=list())
+    Only the args that differ are removed or added, args that are both in
+    the current and in the desired args stay in place. Kernels that already
+    have the desired args, in any order, are not changed.
+    """
+    desired_args = KernelArgs(get_replacement_args(bootloader_setting_options))
+    for kernel_fact in kernel_facts:
+        bootloader_args = kernel_fact.get("args", "")
+        if not needs_replacement(bootloader_setting_options, bootloader_args):
+            continue
+        remove_args, add_args = KernelArgs.parse(bootloader_args).get_delta(
+            desired_args
+        )
+        get_plan_record(plan, kernel_fact)
+        update_kernel_args([kernel_fact], remove_args, add_args)
 
-    # the AnsibleModule object will be our abstraction working with Ansible
-    # this includes instantiation, a couple of common attr would be the
-    # args/params passed to the execution, as well as if the module
-    # supports check mode
-    module = AnsibleModule(argument_spec=module_args, supports_check_mode=True)
 
-    validate_default_kernel(module, module.params["bootloader_settings"])
+def get_end_state(bootloader_facts):
+    """Get the kernels of the in-memory boot model as they are after the plan
 
-    for bootloader_setting in module.params["bootloader_settings"]:
-        _unused, kernels_info, stderr = module.run_command("grubby --info=ALL")
-        if "Permission denied" in stderr:
-            module.fail_json(msg="You must run this as sudo")
+    Settings are planned by applying each of them to the boot model, so in
+    check mode this is the predicted end state without any extra reads.
+    Kernels that the plan creates do not have an index yet.
+    """
+    return [dict(fact) for fact in bootloader_facts]
 
-        default_kernel_index = get_default_kernel(module, "index")
-        bootloader_facts = get_facts(kernels_info, default_kernel_index)
 
-        kernel_action, kernel = validate_kernels(
-            module, bootloader_setting, bootloader_facts
-        )
+# Keys of the kernels that diff mode shows
+DIFF_KEYS = ("args", "default", "title")
+
+
+def get_diff_label(kernel_fact):
+    """Get the label of a kernel in diff mode, the BLS id or the kernel path"""
+    return kernel_fact.get("id") or kernel_fact.get("kernel", "")
+
+
+def get_diff(snapshot, bootloader_facts):
+    """Get the before and after args, default flag and title of changed kernels
+
+    snapshot has pairs of each fact of the boot model and a copy of it made
+    before planning, so the diff comes from the boot model only.
+    """
+    before = {}
+    after = {}
+    kept = set(id(fact) for fact in bootloader_facts)
+    snapshot_ids = set(id(fact) for fact, _unused in snapshot)
+    for fact, old_fact in snapshot:
+        old_keys = get_plan_kernel(old_fact, DIFF_KEYS)
+        new_keys = get_plan_kernel(fact, DIFF_KEYS) if id(fact) in kept else None
+        if old_keys != new_keys:
+            before[get_diff_label(old_fact)] = old_keys
+            if new_keys is not None:
+                after[get_diff_label(fact)] = new_keys
+    for fact in bootloader_facts:
+        if id(fact) not in snapshot_ids:
+            after[get_diff_label(fact)] = get_plan_kernel(fact, DIFF_KEYS)
+    return {"before": before, "after": after}
 
-        # Remove all existing boot settings
+
+def process_bootloader_settings(module, bootloader_facts, grubby_indexes=True):
+    """Plan changes of all bootloader_settings against the in-memory boot model
+
+    Fails when a setting modifies a kernel that is not in the model. Created
+    kernels have no index in the model, so later settings cannot select
+    them by index.
+    """
+    plan = new_plan(bootloader_facts, grubby_indexes)
+    kernel_table = get_kernel_table(bootloader_facts)
+    for bootloader_setting in module.params["bootloader_settings"]:
+        with instrumentation.phase("validate"):
+            kernel_action, kernel = validate_kernels(
+                module, bootloader_setting, kernel_table
+            )
+        kernel_facts = []
+        if kernel_action != "create":
+            kernel_facts = get_kernel_facts(kernel_table, bootloader_setting["kernel"])
+        if (
+            kernel_action == "modify"
+            and isinstance(bootloader_setting["kernel"], dict)
+            and not kernel_facts
+        ):
+            # A kernel that is absent is already removed
+            module.fail_json(msg="No kernel matches %s" % bootloader_setting["kernel"])
+
+        # Replace all existing boot settings
         if (
             "options" in bootloader_setting
             and {"previous": "replaced"} in bootloader_setting["options"]
         ) and (kernel_action != "remove"):
-            rc, kernel_info, stderr = module.run_command("grubby --info=" + kernel)
-            if needs_replacement(bootloader_setting.get("options", []), kernel_info):
-                rm_boot_args(module, result, kernel_info, kernel)
+            replace_boot_args(plan, bootloader_setting["options"], kernel_facts)
 
         # Create a kernel with provided options
         if kernel_action == "create":
-            add_kernel(module, result, bootloader_setting, kernel)
+            add_kernel(plan, bootloader_setting, kernel, bootloader_facts)
 
         # Modify boot settings
         if kernel_action == "modify":
-            _unused, kernel_info, _unused = module.run_command(
-                "grubby --info=" + kernel
-            )
-            mod_boot_args(module, result, bootloader_setting, kernel, kernel_info)
+            mod_boot_args(plan, bootloader_setting, kernel_facts)
 
             # Modify default kernel
-            mod_default_kernel(module, result, bootloader_setting, kernel_info)
+            mod_default_kernel(plan, bootloader_setting, kernel_facts, bootloader_facts)
 
         # Remove a kernel
         if kernel_action == "remove":
-            rm_kernel(module, result, kernel)
+            rm_kernel(plan, kernel_facts, bootloader_facts)
+
+        # Kernels or the default kernel changed in the boot model
+        if kernel_action in ["create", "remove"] or bootloader_setting.get(
+            "default", False
+        ):
+            kernel_table = get_kernel_table(bootloader_facts)
+    return plan
+
+
+def lock_boot_config(module):
+    """Take the host lock for the read, plan and write cycle
+
+    Waits for at most lock_timeout seconds, or for the rest of total_timeout
+    when that is shorter, and fails when another process holds the lock.
+    In check mode nothing is created on the host, so the lock is only taken
+    when lock_file exists, else None is returned.
+    """
+    lock_file = module.params["lock_file"]
+    timeout = module.params["lock_timeout"]
+    if module.check_mode and not os.path.exists(lock_file):
+        return None
+    remaining = instrumentation.check_deadline(module, "waiting for " + lock_file)
+    if remaining is not None:
+        timeout = min(timeout, remaining)
+    try:
+        lock_fd = acquire_lock(lock_file, timeout)
+    except (IOError, OSError) as exc:
+        module.fail_json(msg="Failed to lock %s: %s" % (lock_file, exc))
+    if lock_fd is None:
+        module.fail_json(
+            msg="Another process held the lock %s for more than %d seconds"
+            % (lock_file, timeout)
+        )
+    return lock_fd
+
+
+def get_state_file(module):
+    """Get the state_file to skip and record runs with, None if it is not used"""
+    params = module.params
+    if params["bootloader_settings"] is None:
+        return None
+    if params["plan_only"] or params["plan_file"]:
+        return None
+    return params["state_file"]
+
+
+def is_state_unchanged(state_file, settings_hash):
+    """Check whether the last successful run had the same settings and result
+
+    The boot configuration is only fingerprinted when the settings match.
+    """
+    state = read_cache(state_file)
+    if state.get("settings") != settings_hash:
+        return False
+    return state.get("fingerprint") == get_data_hash(get_boot_fingerprint())
+
+
+def write_state(module, state_file, settings_hash):
+    """Record the settings and the boot configuration after a successful run"""
+    try:
+        write_cache(
+            state_file,
+            {
+                "settings": settings_hash,
+                "fingerprint": get_data_hash(get_boot_fingerprint()),
+            },
+        )
+    except (IOError, OSError) as exc:
+        module.warn("Failed to write state %s: %s" % (state_file, exc))
+
+
+def run_module():
+    # define available arguments/parameters a user can pass to the module
+    module_args = dict(
+        bootloader_settings=dict(type="list", required=False, elements="dict"),
+        write_backend=dict(type="str", choices=["grubby", "bls"], default="grubby"),
+        plan_file=dict(type="path", required=False),
+        plan_only=dict(type="bool", default=False),
+        apply_plan_file=dict(type="path", required=False),
+        instrumentation=dict(type="bool", default=False),
+        command_timeout=dict(type="int", default=0),
+        total_timeout=dict(type="int", default=0),
+        lock_file=dict(type="path", default=LOCK_FILE),
+        lock_timeout=dict(type="int", default=300),
+        state_file=dict(type="path", required=False),
+    )
+
+    # seed the result dict in the object
+    # we primarily care about changed and state
+    # changed is if this module effectively modified the target
+    # state will include any data that you want your module to pass back
+    # for consumption, for example, in a subsequent task
+    result = dict(changed=False, actions=list())
+
+    # the AnsibleModule object will be our abstraction working with Ansible
+    # this includes instantiation, a couple of common attr would be the
+    # args/params passed to the execution, as well as if the module
+    # supports check mode
+    module = AnsibleModule(
+        argument_spec=module_args,
+        mutually_exclusive=[["bootloader_settings", "apply_plan_file"]],
+        required_one_of=[["bootloader_settings", "apply_plan_file"]],
+        supports_check_mode=True,
+    )
+
+    profiler = start_profiler()
+    instrumentation.start(
+        module.params["command_timeout"], module.params["total_timeout"]
+    )
+    with instrumentation.phase("lock"):
+        lock_fd = lock_boot_config(module)
+    state_file = get_state_file(module)
+    if state_file:
+        with instrumentation.phase("state"):
+            settings_hash = get_data_hash(module.params["bootloader_settings"])
+            result["state_match"] = is_state_unchanged(state_file, settings_hash)
+    if result.get("state_match"):
+        plan = {"version": PLAN_VERSION, "all": [], "kernels": [], "default": None}
+    elif module.params["apply_plan_file"]:
+        with instrumentation.phase("parse"):
+            plan = read_plan(module, module.params["apply_plan_file"])
+            verify_plan(module, plan)
+    else:
+        with instrumentation.phase("validate"):
+            validate_default_kernel(module, module.params["bootloader_settings"])
+        with instrumentation.phase("parse"):
+            bootloader_facts, grubby_indexes = get_boot_snapshot(module)
+        with instrumentation.phase("plan"):
+            snapshot = [(fact, dict(fact)) for fact in bootloader_facts]
+            plan = export_plan(
+                process_bootloader_settings(module, bootloader_facts, grubby_indexes)
+            )
+            result["kernels"] = get_end_state(bootloader_facts)
+            if module._diff:
+                result["diff"] = get_diff(snapshot, bootloader_facts)
+        if module.params["plan_file"] and not module.check_mode:
+            with instrumentation.phase("apply"):
+                write_plan(module, module.params["plan_file"], plan)
+    result["plan"] = plan
+
+    if not module.params["plan_only"]:
+        with instrumentation.phase("apply"):
+            apply_plan(module, result, plan)
+    if state_file and not result["state_match"] and not module.check_mode:
+        with instrumentation.phase("state"):
+            write_state(module, state_file, settings_hash)
+    if lock_fd is not None:
+        release_lock(lock_fd)
 
     result["changed"] = len(result["actions"]) > 0
+    if module.params["instrumentation"]:
+        result["instrumentation"] = instrumentation.get_result()
+    stop_profiler(module, profiler, result)
     module.exit_json(**result)
 
 
@@ -74,6 +74,13 @@ options:
             C({{ ansible_facts["distribution_version"] }}).
         type: str
         default: ""
+    instrumentation:
+        description: >-
+            If C(true), return the time spent collecting, logging and writing
+            the record as C(instrumentation).
+            The module runs no external commands.
+        type: bool
+        default: false
 """
 
 EXAMPLES = """
@@ -125,6 +132,13 @@ log_file:
     description: Path to the log file that would be written.
     returned: check mode and O(write_log_file=true)
     type: str
+instrumentation:
+    description: >-
+        C(reads) and C(writes), the number of external commands, which are
+        always 0, the empty list C(commands), the seconds per phase in
+        C(phases) and the total seconds in C(total).
+    returned: O(instrumentation=true)
+    type: dict
 """
 
 from ansible.module_utils.basic import AnsibleModule
@@ -136,6 +150,7 @@ import json
 import os
 import stat
 import tempfile
+import time
 
 FINGERPRINT_FIELDS = (
     "date",
@@ -150,14 +165,15 @@ FINGERPRINT_FIELDS = (
 
 FINGERPRINT_SYSLOG_SEPARATOR = " "
 
+# time.monotonic is not available on Python 2
+_timer = getattr(time, "monotonic", time.time)
+
 
 def _local_iso8601_no_microseconds():
     """System local wall clock with local tz offset, ISO 8601, seconds only."""
     try:
         utc = datetime.timezone.utc
     except AttributeError:
-        import time
-
         return time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime())
     # Prefer the local clock interpreted in the system timezone (not UTC displayed).
     now = datetime.datetime.now()
@@ -300,7 +316,33 @@ def _format_fingerprint_syslog(record):
     return FINGERPRINT_SYSLOG_SEPARATOR.join(pairs)
 
 
+class _PhaseTimer(object):
+    """Time the phases of the module run for the instrumentation result."""
+
+    def __init__(self):
+        self.started = _timer()
+        self.mark = self.started
+        self.phases = {}
+
+    def end_phase(self, name):
+        now = _timer()
+        self.phases[name] = self.phases.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+    def add_result(self, module, result):
+        if module.params.get("instrumentation"):
+            result["instrumentation"] = dict(
+                reads=0,
+                writes=0,
+                commands=[],
+                phases=dict(self.phases),
+                total=_timer() - self.started,
+            )
+        return result
+
+
 def _handle_fingerprint(module):
+    phase_timer = _PhaseTimer()
     max_log_size = module.params["max_log_size"]
     if max_log_size < 0:
         module.fail_json(
@@ -309,6 +351,7 @@ def _handle_fingerprint(module):
 
     fingerprint_record = _collect_fingerprint_record(module, module.params["status"])
     log_message = _format_fingerprint_syslog(fingerprint_record)
+    phase_timer.end_phase("collect")
 
     if module.check_mode:
         result = dict(
@@ -319,9 +362,10 @@ def _handle_fingerprint(module):
         if module.params["write_log_file"]:
             result["jsonl_row"] = _format_fingerprint_jsonl(fingerprint_record)
             result["log_file"] = module.params["log_file"]
-        module.exit_json(**result)
+        module.exit_json(**phase_timer.add_result(module, result))
 
     module.log(log_message)
+    phase_timer.end_phase("log")
 
     if module.params["write_log_file"]:
         log_file = module.params["log_file"]
@@ -333,8 +377,13 @@ def _handle_fingerprint(module):
             module.fail_json(
                 msg="Failed to write fingerprint log file %s: %s" % (log_file, exc)
             )
+        phase_timer.end_phase("write")
 
-    module.exit_json(changed=False, fingerprint=fingerprint_record)
+    module.exit_json(
+        **phase_timer.add_result(
+            module, dict(changed=False, fingerprint=fingerprint_record)
+        )
+    )
 
 
 def run_module():
@@ -348,6 +397,7 @@ def run_module():
         ansible_play_hosts_all=dict(type="list", elements="str", required=True),
         distribution=dict(type="str", default=""),
         distribution_version=dict(type="str", default=""),
+        instrumentation=dict(type="bool", default=False),
     )
 
     module = AnsibleModule(
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Read kernel facts from Boot Loader Specification entries
+
+grubby-bls builds its --info=ALL output from /boot/loader/entries/*.conf and
+the grub environment block. Reading those files directly gives the same facts
+without running grubby.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import re
+
+from ansible.module_utils.bootloader_lsr.facts_filter import (
+    match_kernel,
+    needs_args,
+    select_fields,
+)
+from ansible.module_utils.bootloader_lsr.fileutil import (
+    get_stat_key,
+    write_file_atomic,
+)
+from ansible.module_utils.bootloader_lsr.grubenv import (
+    GRUBENV,
+    get_saved_entry_index,
+    read_grubenv,
+)
+from ansible.module_utils.bootloader_lsr.kernel_args import tokenize_args
+
+BLS_ENTRIES_DIR = "/boot/loader/entries"
+DEFAULT_GRUB = "/etc/default/grub"
+BOOT_DIR = "/boot"
+
+VERSION_PART = re.compile(r"(\d+)|(\D+)")
+
+
+def version_key(text):
+    """Get a sort key that orders text like sort -V"""
+    return [
+        (0, int(number), "") if number else (1, 0, other)
+        for number, other in VERSION_PART.findall(text)
+    ]
+
+
+def list_entry_ids(entries_dir):
+    """Get ids of the *.conf entries in entries_dir ordered like grubby"""
+    scandir = getattr(os, "scandir", None)
+    if scandir is not None:
+        names = [entry.name for entry in scandir(entries_dir) if entry.is_file()]
+    else:
+        names = [
+            name
+            for name in os.listdir(entries_dir)
+            if os.path.isfile(os.path.join(entries_dir, name))
+        ]
+    entry_ids = [name[: -len(".conf")] for name in names if name.endswith(".conf")]
+    return sorted(entry_ids, key=version_key, reverse=True)
+
+
+def read_entry(entry_path):
+    """Get keys of a BLS entry, repeated keys are joined with a space"""
+    entry = {}
+    with open(entry_path, "r") as entry_fd:
+        for line in entry_fd:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            key_value = line.split(None, 1)
+            value = key_value[1].strip() if len(key_value) > 1 else ""
+            if key_value[0] in entry:
+                entry[key_value[0]] += " " + value
+            else:
+                entry[key_value[0]] = value
+    return entry
+
+
+def is_bls_enabled(entries_dir, default_grub):
+    """Check that kernels are configured with plain BLS entries"""
+    try:
+        with open(default_grub, "r") as default_grub_fd:
+            for line in default_grub_fd:
+                if re.match(r"\s*GRUB_ENABLE_BLSCFG=[\"']?false", line):
+                    return False
+    except (IOError, OSError):
+        # grub defaults are optional
+        pass
+    return os.path.isdir(entries_dir)
+
+
+def add_boot_prefix(paths, boot_prefix):
+    """Prefix absolute paths with the /boot mount point as grubby prints them"""
+    return " ".join(
+        boot_prefix + path if path.startswith("/") else path for path in paths.split()
+    )
+
+
+def get_entry_options(entry, kernelopts):
+    """Get the options of a BLS entry with $kernelopts expanded like grubby does"""
+    return " ".join(
+        tokenize_args(entry.get("options", "").replace("$kernelopts", kernelopts))
+    )
+
+
+def add_entry_args(fact, entry, kernelopts):
+    """Add the args and root that the options of a BLS entry set to fact"""
+    args = tokenize_args(get_entry_options(entry, kernelopts))
+    for arg in args:
+        if arg.startswith("root="):
+            fact["root"] = arg.split("=", 1)[1]
+            args.remove(arg)
+            break
+    fact["args"] = " ".join(args)
+
+
+def get_entry_fact(entry, boot_prefix, kernelopts, with_args=True):
+    """Get the fact of a single BLS entry in the shape of grubby --info
+
+    With with_args=False, the options are not parsed and the fact has no
+    args and root.
+    """
+    fact = {
+        "kernel": add_boot_prefix(entry.get("linux", ""), boot_prefix),
+        "initrd": add_boot_prefix(entry.get("initrd", ""), boot_prefix),
+        "title": entry.get("title", ""),
+        "id": entry["id"],
+    }
+    if with_args:
+        add_entry_args(fact, entry, kernelopts)
+    return fact
+
+
+def read_entries(entries_dir, entry_cache=None):
+    """Read the entries of entries_dir ordered like grubby
+
+    entry_cache maps entry ids to the stat key and the content of entries
+    read earlier. Entries whose file did not change since are not read
+    again. entry_cache is updated to the entries that are read.
+    """
+    entries = []
+    cached = dict(entry_cache or {})
+    if entry_cache is not None:
+        entry_cache.clear()
+    for entry_id in list_entry_ids(entries_dir):
+        entry_path = os.path.join(entries_dir, entry_id + ".conf")
+        stat_key = get_stat_key(entry_path)
+        cached_entry = cached.get(entry_id)
+        if stat_key is not None and cached_entry and cached_entry["stat"] == stat_key:
+            entry = dict(cached_entry["entry"])
+        else:
+            entry = read_entry(entry_path)
+        if entry_cache is not None:
+            entry_cache[entry_id] = {"stat": stat_key, "entry": dict(entry)}
+        entry["id"] = entry_id
+        entries.append(entry)
+    return entries
+
+
+def get_bls_facts(
+    entries_dir=BLS_ENTRIES_DIR,
+    grubenv=GRUBENV,
+    default_grub=DEFAULT_GRUB,
+    boot_dir=BOOT_DIR,
+    entry_cache=None,
+    kernels=None,
+    fields=None,
+):
+    """Get kernel facts from BLS entries
+
+    Returns None when the boot configuration is not plain BLS or the entries
+    cannot be read so that the caller falls back to grubby. See
+    read_entries() for entry_cache. Only the kernels that match the kernels
+    patterns are returned, with the keys in fields, see facts_filter. The
+    options of other kernels are not parsed, nor any options when fields
+    has neither args nor root.
+    """
+    if not is_bls_enabled(entries_dir, default_grub):
+        return None
+    try:
+        entries = read_entries(entries_dir, entry_cache)
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+    if not entries:
+        return None
+    grubenv_vars = read_grubenv(grubenv)
+    boot_prefix = boot_dir if os.path.ismount(boot_dir) else ""
+    default_index = get_saved_entry_index(entries, grubenv_vars.get("saved_entry"))
+    kernelopts = grubenv_vars.get("kernelopts", "")
+    facts = []
+    for index, entry in enumerate(entries):
+        fact = get_entry_fact(entry, boot_prefix, kernelopts, with_args=False)
+        fact["index"] = str(index)
+        fact["default"] = index == default_index
+        if not match_kernel(fact, kernels):
+            continue
+        if needs_args(fields):
+            add_entry_args(fact, entry, kernelopts)
+        facts.append(select_fields(fact, fields))
+    return facts
+
+
+def get_entry_path(entry_id, entries_dir=BLS_ENTRIES_DIR):
+    """Get the path of the BLS entry with entry_id"""
+    return os.path.join(entries_dir, entry_id + ".conf")
+
+
+def write_entry_options(entry_path, options):
+    """Write options to a BLS entry as a single options line
+
+    The entry is only rewritten when its content changes. Returns whether
+    the entry changed.
+    """
+    with open(entry_path, "r") as entry_fd:
+        lines = entry_fd.readlines()
+    new_lines = []
+    options_line = "options %s\n" % options if options else ""
+    for line in lines:
+        if line.split(None, 1)[:1] != ["options"]:
+            new_lines.append(line)
+        elif options_line:
+            new_lines.append(options_line)
+            options_line = ""
+    if options_line:
+        if new_lines and not new_lines[-1].endswith("\n"):
+            new_lines[-1] += "\n"
+        new_lines.append(options_line)
+    if new_lines == lines:
+        return False
+    write_file_atomic(entry_path, "".join(new_lines))
+    return True
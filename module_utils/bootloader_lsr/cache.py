@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Cache kernel facts and the result of settings on the host between runs
+
+The cache is valid as long as the fingerprint of the boot configuration
+does not change. The fingerprint only takes stat() calls: the mtime, size
+and inode of the BLS entries directory, each entry, grubenv, the grub
+defaults and the grub configuration that grubby reads without BLS.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import hashlib
+import json
+import os
+
+from ansible.module_utils.bootloader_lsr.bls import (
+    BLS_ENTRIES_DIR,
+    BOOT_DIR,
+    DEFAULT_GRUB,
+)
+from ansible.module_utils.bootloader_lsr.fileutil import (
+    get_stat_key,
+    write_file_atomic,
+)
+from ansible.module_utils.bootloader_lsr.grubenv import GRUBENV
+
+CACHE_VERSION = 2
+
+# grub configuration files that grubby reads when BLS is not used
+GRUB_CONFIGS = ("/etc/grub2.cfg", "/etc/grub2-efi.cfg", "/boot/grub2/grub.cfg")
+
+
+def list_entry_files(entries_dir):
+    """Get names of the *.conf files in entries_dir, empty if it is missing"""
+    try:
+        names = os.listdir(entries_dir)
+    except OSError:
+        return []
+    return sorted(name for name in names if name.endswith(".conf"))
+
+
+def get_boot_fingerprint(
+    entries_dir=BLS_ENTRIES_DIR,
+    grubenv=GRUBENV,
+    default_grub=DEFAULT_GRUB,
+    boot_dir=BOOT_DIR,
+    grub_configs=GRUB_CONFIGS,
+):
+    """Get stat keys of the files that kernel facts are read from"""
+    files = [entries_dir, grubenv, default_grub]
+    files.extend(grub_configs)
+    return {
+        "files": dict((path, get_stat_key(path)) for path in files),
+        "entries": dict(
+            (name, get_stat_key(os.path.join(entries_dir, name)))
+            for name in list_entry_files(entries_dir)
+        ),
+        # grubby prints paths with the /boot prefix when /boot is a mount point
+        "boot_mount": os.path.ismount(boot_dir),
+    }
+
+
+def get_data_hash(data):
+    """Get the SHA-256 hex digest of data normalized as JSON with sorted keys"""
+    normalized = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+def read_cache(cache_file):
+    """Read the cache, an empty cache when it is missing, invalid or outdated"""
+    try:
+        with open(cache_file, "r") as cache_fd:
+            cache = json.load(cache_fd)
+    except (IOError, OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict) or cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache
+
+
+def write_cache(cache_file, cache):
+    """Write the cache, creating its directory when needed"""
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, 0o700)
+    cache = dict(cache, version=CACHE_VERSION)
+    write_file_atomic(cache_file, json.dumps(cache, sort_keys=True))
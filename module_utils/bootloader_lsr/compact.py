@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Store repeated values of kernel facts once
+
+Most kernels share the same args and root, so compact facts replace each of
+those values with a reference into a table that has each distinct value
+once. Key K of a fact becomes K_ref, the index of its value in table K.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import json
+
+# Keys of kernel facts whose values are stored in tables
+COMPACT_KEYS = ("args", "root", "args_parsed")
+
+REF_SUFFIX = "_ref"
+
+
+def get_value_key(value):
+    """Get a hashable key of a value of a fact"""
+    if isinstance(value, dict):
+        return json.dumps(value, sort_keys=True)
+    return value
+
+
+def compact_facts(facts, keys=COMPACT_KEYS):
+    """Get compact facts and the tables that they reference
+
+    The facts are not modified. Only tables of keys that the facts have are
+    returned.
+    """
+    tables = {}
+    refs = {}
+    compacted = []
+    for fact in facts:
+        fact = dict(fact)
+        for key in keys:
+            if key not in fact:
+                continue
+            value = fact.pop(key)
+            key_refs = refs.setdefault(key, {})
+            value_key = get_value_key(value)
+            if value_key not in key_refs:
+                key_refs[value_key] = len(key_refs)
+                tables.setdefault(key, []).append(value)
+            fact[key + REF_SUFFIX] = key_refs[value_key]
+        compacted.append(fact)
+    return compacted, tables
+
+
+def expand_facts(facts, tables):
+    """Get the full facts of compact facts and their tables"""
+    expanded = []
+    for fact in facts:
+        fact = dict(fact)
+        for key, table in tables.items():
+            ref = fact.pop(key + REF_SUFFIX, None)
+            if ref is not None:
+                fact[key] = table[ref]
+        expanded.append(fact)
+    return expanded
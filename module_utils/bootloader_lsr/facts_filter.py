@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Select the kernels and the keys of kernel facts to return
+
+A kernel filter is a list of patterns, a kernel is selected when any of them
+matches: DEFAULT matches the default kernel, a number matches the index and
+any other pattern is a glob matched against the kernel path and the title.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import fnmatch
+
+FACT_FIELDS = ("args", "default", "id", "index", "initrd", "kernel", "root", "title")
+
+# Fields that take parsing the kernel args
+ARGS_FIELDS = ("args", "root")
+
+
+def match_kernel(fact, kernels):
+    """Check whether the kernel of fact matches any of the kernels patterns
+
+    All kernels match when kernels is None.
+    """
+    if kernels is None:
+        return True
+    for pattern in kernels:
+        if pattern == "DEFAULT":
+            if fact.get("default"):
+                return True
+        elif pattern.isdigit():
+            if fact.get("index") == pattern:
+                return True
+        elif fnmatch.fnmatchcase(fact.get("kernel", ""), pattern):
+            return True
+        elif fnmatch.fnmatchcase(fact.get("title", ""), pattern):
+            return True
+    return False
+
+
+def needs_args(fields):
+    """Check whether the fields to return need the kernel args"""
+    return fields is None or any(field in fields for field in ARGS_FIELDS)
+
+
+def select_fields(fact, fields):
+    """Get the fields of fact to return, all of them when fields is None"""
+    if fields is None:
+        return fact
+    return dict((key, value) for key, value in fact.items() if key in fields)
+
+
+def filter_facts(facts, kernels=None, fields=None):
+    """Get the selected fields of the facts of the selected kernels"""
+    return [
+        select_fields(fact, fields) for fact in facts if match_kernel(fact, kernels)
+    ]
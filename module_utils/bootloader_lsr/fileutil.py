@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Write boot configuration files atomically and detect changed files"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import errno
+import os
+import stat
+import tempfile
+
+
+def write_file_atomic(path, content, mode="w"):
+    """Replace path with content through a synced temporary file and a rename
+
+    The temporary file gets the mode and owner of path, a new file keeps
+    the 0600 mode of the temporary file. The directory is synced after the
+    rename so that the new content survives a crash.
+    """
+    try:
+        orig_stat = os.stat(path)
+    except OSError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
+        orig_stat = None
+    dir_name = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=dir_name, suffix=".tmp")
+    try:
+        if orig_stat is not None:
+            try:
+                os.fchmod(fd, stat.S_IMODE(orig_stat.st_mode))
+                os.fchown(fd, orig_stat.st_uid, orig_stat.st_gid)
+            except OSError:
+                # not running as root or a file system without permissions
+                pass
+        with os.fdopen(fd, mode) as tmp_fd:
+            tmp_fd.write(content)
+            tmp_fd.flush()
+            os.fsync(tmp_fd.fileno())
+        os.rename(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            # already removed or never created
+            pass
+        raise
+    dir_fd = os.open(dir_name, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def get_stat_key(path):
+    """Get the mtime, size and inode of path to detect changes, None if it is missing"""
+    try:
+        path_stat = os.stat(path)
+    except OSError:
+        return None
+    mtime_ns = getattr(path_stat, "st_mtime_ns", None)
+    if mtime_ns is None:
+        mtime_ns = int(path_stat.st_mtime * 1000000000)
+    return [mtime_ns, path_stat.st_size, path_stat.st_ino]
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Generation tokens of kernel facts for incremental polling
+
+A generation token carries a short digest of each kernel fact, so that the
+facts that changed since an earlier token can be found without keeping any
+state on the host. Callers treat the token as opaque.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import base64
+import binascii
+import json
+
+from ansible.module_utils.bootloader_lsr.cache import get_data_hash
+
+GENERATION_VERSION = "1"
+
+# Hex digits of the digest of each fact in a token
+DIGEST_LENGTH = 16
+
+
+def get_fact_keys(facts):
+    """Get a unique key for each fact: the BLS id, else the index or path"""
+    keys = []
+    seen = set()
+    for fact in facts:
+        key = fact.get("id") or fact.get("index") or fact.get("kernel", "")
+        unique_key = key
+        count = 1
+        while unique_key in seen:
+            count += 1
+            unique_key = "%s#%d" % (key, count)
+        seen.add(unique_key)
+        keys.append(unique_key)
+    return keys
+
+
+def get_fact_digests(facts):
+    """Get the digest of each fact by its key"""
+    return dict(
+        (key, get_data_hash(fact)[:DIGEST_LENGTH])
+        for key, fact in zip(get_fact_keys(facts), facts)
+    )
+
+
+def get_generation(facts):
+    """Get the generation token of facts"""
+    digests = json.dumps(get_fact_digests(facts), sort_keys=True, separators=(",", ":"))
+    encoded = base64.urlsafe_b64encode(digests.encode("utf-8")).decode("ascii")
+    return GENERATION_VERSION + "." + encoded
+
+
+def read_generation(token):
+    """Get the fact digests of a token, None when it is not a valid token"""
+    version, _sep, encoded = token.partition(".")
+    if version != GENERATION_VERSION:
+        return None
+    try:
+        decoded = base64.urlsafe_b64decode(encoded.encode("ascii"))
+        digests = json.loads(decoded.decode("utf-8"))
+    except (binascii.Error, TypeError, UnicodeError, ValueError):
+        return None
+    if not isinstance(digests, dict):
+        return None
+    return digests
+
+
+def get_facts_since(facts, since):
+    """Get the facts that were added or changed since the since token
+
+    Returns the added or changed facts and the keys of the removed facts,
+    None when since is not a valid token.
+    """
+    old_digests = read_generation(since)
+    if old_digests is None:
+        return None
+    keys = get_fact_keys(facts)
+    changed = [
+        fact
+        for key, fact in zip(keys, facts)
+        if old_digests.get(key) != get_data_hash(fact)[:DIGEST_LENGTH]
+    ]
+    removed = sorted(set(old_digests) - set(keys))
+    return changed, removed
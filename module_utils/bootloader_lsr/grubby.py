@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Parse the output of grubby --info
+
+grubby prints each kernel as key=value lines that start with index=N.
+Lines without a value, like the "non linux entry" that RHEL 7 prints for
+other boot entries, are the kernel of the entry.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import re
+
+INDEX_LINE = re.compile(r"index=(\d+)$")
+
+
+class GrubbyEntry(object):
+    """Keys of a kernel that grubby --info prints
+
+    Keys that are not in KEYS are kept in extra. Keys that grubby did not
+    print are None.
+    """
+
+    KEYS = ("index", "kernel", "args", "root", "initrd", "title", "id")
+
+    __slots__ = KEYS + ("default", "extra")
+
+    def __init__(self, index, default=False):
+        for key in self.KEYS:
+            setattr(self, key, None)
+        self.index = index
+        self.default = default
+        self.extra = None
+
+    def set(self, key, value):
+        """Set key to value, the last value wins like in the grubby output"""
+        if key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def as_dict(self):
+        """Get the entry as a kernel fact"""
+        fact = dict(
+            (key, getattr(self, key))
+            for key in self.KEYS
+            if getattr(self, key) is not None
+        )
+        if self.extra:
+            fact.update(self.extra)
+        fact["default"] = self.default
+        return fact
+
+
+def unquote(value):
+    """Remove one pair of double quotes around value
+
+    Only the enclosing pair is removed, so that args="ro a="x y"" keeps the
+    closing quote of the last arg.
+    """
+    if len(value) >= 2 and value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    return value
+
+
+def parse_grubby_info(kernels_info, default_index):
+    """Get a GrubbyEntry for each kernel of grubby --info output in one pass
+
+    Lines before the first index= line and empty lines are skipped.
+    """
+    default_index = default_index.strip()
+    entries = []
+    entry = None
+    for line in kernels_info.splitlines():
+        index = INDEX_LINE.match(line)
+        if index:
+            entry = GrubbyEntry(index.group(1), index.group(1) == default_index)
+            entries.append(entry)
+            continue
+        if entry is None or not line.strip():
+            continue
+        key, sep, value = line.partition("=")
+        if sep:
+            entry.set(key.strip('"'), unquote(value))
+        else:
+            entry.kernel = line
+    return entries
+
+
+def get_facts(kernels_info, default_index):
+    """Get kernel facts of grubby --info output"""
+    return [entry.as_dict() for entry in parse_grubby_info(kernels_info, default_index)]
+
+
+def check_grubby_read(module, cmd, cmd_result, **result):
+    """Fail when the grubby read cmd failed
+
+    A failed grubby --info prints no kernels, which would look like an
+    empty boot configuration and plan nothing. result is added to the
+    failure.
+    """
+    rc, stdout, stderr = cmd_result
+    if "Permission denied" in stderr:
+        module.fail_json(msg="You must run this as sudo", **result)
+    if rc != 0:
+        module.fail_json(
+            msg="Command '%s' failed with rc %s: %s" % (cmd, rc, stderr.strip()),
+            rc=rc,
+            stdout=stdout,
+            stderr=stderr,
+            **result
+        )
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Read and write the grub environment block
+
+grub reads the environment block with its own file system drivers, so the
+file must stay a block of exactly 1024 bytes that starts with a fixed header
+and is padded with "#".
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+
+from ansible.module_utils.bootloader_lsr.fileutil import write_file_atomic
+
+GRUBENV = "/boot/grub2/grubenv"
+GRUBENV_HEADER = b"# GRUB Environment Block\n"
+GRUBENV_SIZE = 1024
+
+
+def parse_grubenv(block):
+    """Get the variable lines of a grub environment block"""
+    lines = []
+    for line in block.decode("utf-8").split("\n"):
+        # the header and the padding are comments
+        if line.startswith("#") or "=" not in line:
+            continue
+        lines.append(line)
+    return lines
+
+
+def read_grubenv(grubenv=GRUBENV):
+    """Get variables of the grub environment block"""
+    variables = {}
+    try:
+        with open(grubenv, "rb") as grubenv_fd:
+            block = grubenv_fd.read()
+    except (IOError, OSError):
+        # no grubenv means no saved_entry and no kernelopts
+        return variables
+    for line in parse_grubenv(block):
+        key, value = line.split("=", 1)
+        variables[key] = value
+    return variables
+
+
+def get_saved_entry_index(entries, saved_entry):
+    """Get the index of the entry that saved_entry selects
+
+    saved_entry is an index, an entry id or an entry title, grub boots the
+    first entry when it does not select any.
+    """
+    if not saved_entry:
+        return 0
+    if saved_entry.isdigit():
+        return int(saved_entry)
+    for index, entry in enumerate(entries):
+        if saved_entry in (entry.get("id"), entry.get("title")):
+            return index
+    return 0
+
+
+def get_grubenv_block(grubenv, name, value):
+    """Get the grub environment block in grubenv with name set to value
+
+    Raises ValueError when grubenv is not a valid environment block or the
+    variables do not fit into it.
+    """
+    with open(grubenv, "rb") as grubenv_fd:
+        block = grubenv_fd.read()
+    if len(block) != GRUBENV_SIZE or not block.startswith(GRUBENV_HEADER):
+        raise ValueError("%s is not a grub environment block" % grubenv)
+    lines = []
+    is_set = False
+    for line in parse_grubenv(block):
+        if line.split("=", 1)[0] == name:
+            if is_set:
+                continue
+            line = name + "=" + value
+            is_set = True
+        lines.append(line)
+    if not is_set:
+        lines.append(name + "=" + value)
+    new_block = GRUBENV_HEADER + "".join(line + "\n" for line in lines).encode("utf-8")
+    if len(new_block) > GRUBENV_SIZE:
+        raise ValueError("Variables do not fit into %s" % grubenv)
+    return new_block + b"#" * (GRUBENV_SIZE - len(new_block))
+
+
+def write_grubenv_block(grubenv, block):
+    """Write the grub environment block with a single atomic rewrite
+
+    grubenv can be a symlink to the EFI system partition, the block replaces
+    the file that it points to.
+    """
+    write_file_atomic(os.path.realpath(grubenv), block, "wb")
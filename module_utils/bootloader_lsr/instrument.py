@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Count and time external commands and phases of a module run"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import inspect
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# time.monotonic is not available on Python 2
+timer = getattr(time, "monotonic", time.time)
+
+# Phase that the time of external commands is accounted to
+COMMANDS_PHASE = "commands"
+
+# Largest number of read-only commands that run at the same time
+MAX_READ_WORKERS = 4
+
+# Exit codes of timeout(1) when it stopped or killed the command
+TIMEOUT_RCS = (124, 137)
+
+# Seconds that timeout(1) waits for the command to stop before killing it
+KILL_AFTER = 5
+
+
+class CommandTimeout(Exception):
+    """A command or the whole run went over its time limit
+
+    result has the fail_json() arguments. Worker threads raise it rather
+    than calling fail_json() themselves, so that the module fails once.
+    """
+
+    def __init__(self, **result):
+        super(CommandTimeout, self).__init__(result["msg"])
+        self.result = result
+
+
+def can_raise_errors(module):
+    """Check whether module.run_command() takes handle_exceptions=False
+
+    With it, run_command() raises errors of starting the command rather
+    than calling fail_json() from the thread that runs it. Older Ansible
+    versions do not have it.
+    """
+    try:
+        if hasattr(inspect, "signature"):
+            return any(
+                param.name == "handle_exceptions" or param.kind == param.VAR_KEYWORD
+                for param in inspect.signature(module.run_command).parameters.values()
+            )
+        argspec = inspect.getargspec(module.run_command)
+        return "handle_exceptions" in argspec.args or argspec.keywords is not None
+    except (TypeError, ValueError):
+        return False
+
+
+class Instrumentation(object):
+    """Collect the external commands and the time per phase of a module run
+
+    Phases do not overlap, time spent in a nested phase or in an external
+    command is not accounted to the enclosing phase. Commands are always run
+    through run_command() so that they are counted whether the result is
+    reported or not, and so that they are stopped when they run out of time.
+    """
+
+    def __init__(self):
+        self.start()
+
+    def start(self, command_timeout=0, total_timeout=0):
+        """Forget collected commands and phases and start timing the run
+
+        Each command may run for command_timeout seconds and the whole run
+        for total_timeout seconds, 0 means no limit.
+        """
+        self.command_timeout = command_timeout
+        self.total_timeout = total_timeout
+        self.commands = []
+        self.phases = {}
+        self.stack = []
+        self.started = timer()
+        self.mark = self.started
+
+    def _switch(self):
+        """Account the time since the last switch to the current phase"""
+        now = timer()
+        if self.stack:
+            name = self.stack[-1]
+            self.phases[name] = self.phases.get(name, 0.0) + now - self.mark
+        self.mark = now
+
+    @contextmanager
+    def phase(self, name):
+        """Account the time spent in the with block to phase name"""
+        self._switch()
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self.stack.pop()
+
+    def _get_remaining(self, action):
+        """Get the seconds left of total_timeout, raise CommandTimeout if none"""
+        if not self.total_timeout:
+            return None
+        remaining = self.total_timeout - (timer() - self.started)
+        if remaining <= 0:
+            raise CommandTimeout(
+                msg="The module did not finish within %d seconds, stopped before %s"
+                % (self.total_timeout, action)
+            )
+        return remaining
+
+    def check_deadline(self, module, action):
+        """Fail before action when the run has used up total_timeout
+
+        Returns the seconds that are left, None when there is no limit.
+        """
+        try:
+            return self._get_remaining(action)
+        except CommandTimeout as exc:
+            module.fail_json(**exc.result)
+
+    def _run(self, module, cmd, **kwargs):
+        """Run cmd with timeout(1) when it has a time limit
+
+        Raises CommandTimeout instead of failing the module, so it can run
+        in worker threads. kwargs are passed to module.run_command().
+        """
+        timeouts = [self._get_remaining("'%s'" % cmd), self.command_timeout]
+        timeouts = [timeout for timeout in timeouts if timeout]
+        if not timeouts:
+            return module.run_command(cmd, **kwargs)
+        timeout = int(math.ceil(min(timeouts)))
+        rc, stdout, stderr = module.run_command(
+            "timeout -k %d %d %s" % (KILL_AFTER, timeout, cmd), **kwargs
+        )
+        if rc in TIMEOUT_RCS:
+            raise CommandTimeout(
+                msg="Command '%s' did not finish within %d seconds" % (cmd, timeout),
+                rc=rc,
+                stdout=stdout,
+                stderr=stderr,
+            )
+        return rc, stdout, stderr
+
+    def run_command(self, module, cmd, write=False):
+        """Run cmd with module.run_command() and record its wall time
+
+        write tells whether cmd changes the system or only reads from it.
+        """
+        started = timer()
+        with self.phase(COMMANDS_PHASE):
+            try:
+                rc, stdout, stderr = self._run(module, cmd)
+            except CommandTimeout as exc:
+                module.fail_json(**exc.result)
+        self.commands.append(
+            {"cmd": cmd, "write": write, "rc": rc, "time": timer() - started}
+        )
+        return rc, stdout, stderr
+
+    def run_read_commands(self, module, cmds, max_workers=MAX_READ_WORKERS):
+        """Run independent read-only cmds at the same time
+
+        Most of the time of a grubby read goes to starting the process, so
+        the reads run in at most max_workers threads and take about as long
+        as the slowest of them. Returns the rc, stdout and stderr of each
+        command in the order of cmds. When commands time out or cannot be
+        started, the module fails once after all threads finished. With an
+        Ansible version whose run_command() cannot raise errors instead of
+        failing the module, the reads run one after another. Commands that
+        write must be run with run_command() one after another.
+        """
+        if len(cmds) < 2 or not can_raise_errors(module):
+            return [self.run_command(module, cmd) for cmd in cmds]
+        results = [None] * len(cmds)
+        records = [None] * len(cmds)
+        errors = []
+        positions = iter(range(len(cmds)))
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                with lock:
+                    position = next(positions, None)
+                if position is None:
+                    return
+                started = timer()
+                try:
+                    results[position] = self._run(
+                        module, cmds[position], handle_exceptions=False
+                    )
+                except BaseException:
+                    # Re-raised or reported with fail_json() in the caller
+                    errors.append((cmds[position], sys.exc_info()[1]))
+                    return
+                records[position] = {
+                    "cmd": cmds[position],
+                    "write": False,
+                    "rc": results[position][0],
+                    "time": timer() - started,
+                }
+
+        with self.phase(COMMANDS_PHASE):
+            threads = [
+                threading.Thread(target=worker)
+                for _unused in range(min(max_workers, len(cmds)))
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.commands.extend(record for record in records if record is not None)
+        for _unused, error in errors:
+            if not isinstance(error, Exception):
+                raise error
+        if errors:
+            cmd, error = errors[0]
+            if isinstance(error, CommandTimeout):
+                module.fail_json(**error.result)
+            module.fail_json(
+                msg="Failed to run '%s': %s" % (cmd, error),
+                rc=getattr(error, "errno", None) or 257,
+                stdout="",
+                stderr="",
+            )
+        return results
+
+    def get_result(self):
+        """Get the collected data as the instrumentation module result"""
+        writes = len([command for command in self.commands if command["write"]])
+        return {
+            "reads": len(self.commands) - writes,
+            "writes": writes,
+            "commands": list(self.commands),
+            "phases": dict(self.phases),
+            "total": timer() - self.started,
+        }
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Parse and compare kernel command line arguments"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+from collections import Counter
+
+
+def tokenize_args(args):
+    """Split a kernel command line into tokens in a single pass
+
+    Like the kernel, whitespace inside double quotes does not split a token,
+    so name="a b" is a single token. Tokens keep their quotes.
+    """
+    tokens = []
+    token = []
+    in_quotes = False
+    for char in args:
+        if char == '"':
+            in_quotes = not in_quotes
+        elif not in_quotes and char.isspace():
+            if token:
+                tokens.append("".join(token))
+                token = []
+            continue
+        token.append(char)
+    if token:
+        tokens.append("".join(token))
+    return tokens
+
+
+def get_arg_name(token):
+    """Get the name of a kernel argument token"""
+    return token.split("=", 1)[0]
+
+
+def get_arg_value(token):
+    """Get the value of a kernel argument token, None when it has no value"""
+    name_value = token.split("=", 1)
+    return name_value[1] if len(name_value) > 1 else None
+
+
+class KernelArgs(object):
+    """Ordered multiset of kernel arguments keyed by argument name"""
+
+    def __init__(self, tokens=()):
+        self.tokens = list(tokens)
+        self.counts = Counter(self.tokens)
+        self.names = {}
+        for token in self.tokens:
+            self.names.setdefault(get_arg_name(token), []).append(token)
+
+    @classmethod
+    def parse(cls, args):
+        """Get KernelArgs of a kernel command line"""
+        return cls(tokenize_args(args or ""))
+
+    def __str__(self):
+        return " ".join(self.tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, token):
+        return token in self.counts
+
+    def __eq__(self, other):
+        """Compare as multisets, the order of arguments does not matter"""
+        return isinstance(other, KernelArgs) and self.counts == other.counts
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def has_name(self, name):
+        """Check if any argument has name, with or without a value"""
+        return name in self.names
+
+    def get_tokens(self, name):
+        """Get arguments with name in order"""
+        return list(self.names.get(name, []))
+
+    def get_parsed(self):
+        """Get the args as options in the shape of bootloader_settings options
+
+        Returns the options in order, each with a name and a value unless
+        the arg has none, and a map of each name to its values in order,
+        None for an arg without a value. Values keep their quotes.
+        """
+        options = []
+        values = {}
+        for token in self.tokens:
+            name = get_arg_name(token)
+            value = get_arg_value(token)
+            option = {"name": name}
+            if value is not None:
+                option["value"] = value
+            options.append(option)
+            values.setdefault(name, []).append(value)
+        return {"options": options, "values": values}
+
+    def get_delta(self, desired):
+        """Get the smallest remove and add args that make grubby turn self into desired
+
+        grubby replaces an existing arg when an arg with the same name is
+        added, so when only some of the args with the same name differ, all
+        of them are removed and added again in the desired order.
+        """
+        remove_args = []
+        add_args = []
+        names = list(self.names)
+        names.extend(name for name in desired.names if name not in self.names)
+        for name in names:
+            current_tokens = self.names.get(name, [])
+            desired_tokens = desired.names.get(name, [])
+            if current_tokens != desired_tokens:
+                remove_args.extend(current_tokens)
+                add_args.extend(desired_tokens)
+        return remove_args, add_args
+
+    def update(self, remove_args, add_args):
+        """Get KernelArgs with remove_args and add_args applied like grubby does
+
+        grubby removes the first matching token for every arg in remove_args,
+        an arg without a value also matches the same name with any value.
+        Then it removes the first token with the same name for every arg in
+        add_args and appends add_args to the end.
+        """
+        names = dict((name, list(tokens)) for name, tokens in self.names.items())
+        removed = Counter()
+        for arg in remove_args:
+            name_tokens = names.get(get_arg_name(arg), [])
+            for token in name_tokens:
+                if token == arg or "=" not in arg:
+                    name_tokens.remove(token)
+                    removed[token] += 1
+                    break
+        for arg in add_args:
+            name_tokens = names.get(get_arg_name(arg), [])
+            if name_tokens:
+                removed[name_tokens.pop(0)] += 1
+        tokens = []
+        for token in self.tokens:
+            if removed[token]:
+                removed[token] -= 1
+            else:
+                tokens.append(token)
+        return KernelArgs(tokens + list(add_args))
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Serialize changes of the boot configuration on the host
+
+The lock is an advisory fcntl.flock() lock, so it only serializes processes
+that take the same lock, like other runs of the role or other roles that
+edit boot entries and use LOCK_FILE.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import errno
+import fcntl
+import os
+import time
+
+LOCK_FILE = "/run/lock/bootloader_lsr.lock"
+
+# Seconds between attempts to take a lock that another process holds
+LOCK_POLL_INTERVAL = 0.1
+
+
+def _ensure_parent_dir(path):
+    """Create the directory of path, /run/lock is missing in some containers"""
+    parent = os.path.dirname(path)
+    if not parent or os.path.isdir(parent):
+        return
+    try:
+        os.makedirs(parent)
+    except OSError as exc:
+        # another process may have created the directory
+        if exc.errno != errno.EEXIST or not os.path.isdir(parent):
+            raise
+
+
+def acquire_lock(lock_file, timeout):
+    """Take an exclusive lock on lock_file, waiting for at most timeout seconds
+
+    The directory of lock_file is created when it does not exist. Returns
+    the open lock file that holds the lock, None when another process held
+    the lock for the whole time. The lock is released by release_lock() or
+    when the process exits.
+    """
+    _ensure_parent_dir(lock_file)
+    lock_fd = open(lock_file, "a")
+    deadline = time.time() + timeout
+    while True:
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_fd
+        except (IOError, OSError) as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                lock_fd.close()
+                raise
+        if time.time() >= deadline:
+            lock_fd.close()
+            return None
+        time.sleep(LOCK_POLL_INTERVAL)
+
+
+def release_lock(lock_fd):
+    """Release a lock that acquire_lock() took"""
+    fcntl.flock(lock_fd, fcntl.LOCK_UN)
+    lock_fd.close()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Profile a module run with cProfile on request
+
+Set the BOOTLOADER_LSR_PROFILE environment variable of the task to a number
+N to return the top N entries by cumulative time in the module result, or
+to a path to dump the profile as a .pstats file on the managed node.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import cProfile
+import os
+import pstats
+
+PROFILE_ENV = "BOOTLOADER_LSR_PROFILE"
+
+
+def start_profiler(environ=None):
+    """Start profiling when PROFILE_ENV is set, return the profiler or None"""
+    if not (os.environ if environ is None else environ).get(PROFILE_ENV):
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def get_top_entries(profiler, count):
+    """Get the count entries of profiler with the highest cumulative time"""
+    stats = pstats.Stats(profiler).sort_stats("cumulative")
+    entries = []
+    for func in stats.fcn_list[:count]:
+        _unused, ncalls, tottime, cumtime, _unused = stats.stats[func]
+        entries.append(
+            {
+                "function": "%s:%d(%s)" % func,
+                "ncalls": ncalls,
+                "tottime": tottime,
+                "cumtime": cumtime,
+            }
+        )
+    return entries
+
+
+def stop_profiler(module, profiler, result, environ=None):
+    """Stop profiler and add the profile to result or dump it to a file"""
+    if profiler is None:
+        return
+    profiler.disable()
+    value = (os.environ if environ is None else environ)[PROFILE_ENV]
+    if value.isdigit():
+        result["profile"] = get_top_entries(profiler, int(value))
+        return
+    try:
+        profiler.dump_stats(value)
+    except (IOError, OSError) as exc:
+        module.warn("Failed to write profile %s: %s" % (value, exc))
+        return
+    result["profile_file"] = value
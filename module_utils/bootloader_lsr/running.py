@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Compare the running kernel command line with the configured default
+
+The running kernel reports its command line in /proc/cmdline, so it can be
+compared with the args of the default kernel to find hosts that still run
+with other args than configured, without running any command.
+"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import re
+
+from ansible.module_utils.bootloader_lsr.grubenv import GRUBENV, read_grubenv
+from ansible.module_utils.bootloader_lsr.kernel_args import (
+    KernelArgs,
+    get_arg_name,
+    get_arg_value,
+    tokenize_args,
+)
+
+PROC_CMDLINE = "/proc/cmdline"
+BOOT_ID = "/proc/sys/kernel/random/boot_id"
+
+# Arg that grub adds with the path of the kernel image it booted
+BOOT_IMAGE_ARG = "BOOT_IMAGE"
+
+# grub variables in args, expanded from the grub environment block at boot
+GRUB_VARIABLE = re.compile(r"\$(\w+)|\$\{(\w+)\}")
+
+# Keys of the kernel fact that identify the running entry
+ENTRY_KEYS = ("index", "id", "kernel", "title")
+
+
+def read_proc_file(path):
+    """Get the stripped content of a /proc file, None when it cannot be read"""
+    try:
+        with open(path, "r") as proc_fd:
+            return proc_fd.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def expand_grub_variables(args, grubenv_vars):
+    """Expand grub variables in args like grub does, unset variables are empty"""
+    return GRUB_VARIABLE.sub(
+        lambda match: grubenv_vars.get(match.group(1) or match.group(2), ""), args
+    )
+
+
+def get_configured_args(kernel_fact, grubenv_vars):
+    """Get the args that kernel_fact boots with, including root"""
+    tokens = tokenize_args(
+        expand_grub_variables(kernel_fact.get("args", ""), grubenv_vars)
+    )
+    if kernel_fact.get("root"):
+        tokens.insert(0, "root=" + kernel_fact["root"])
+    return KernelArgs(tokens)
+
+
+def get_image_name(path):
+    """Get the file name of a kernel image path, without a grub device"""
+    return os.path.basename(re.sub(r"^\([^)]*\)", "", path or ""))
+
+
+def find_running_kernel(facts, boot_image, release):
+    """Get the fact of the running kernel, None if no kernel matches
+
+    The kernel is matched by the BOOT_IMAGE that grub passed or else by the
+    kernel release. When several kernels use the same image, the default
+    kernel wins.
+    """
+    names = [get_image_name(boot_image)] if boot_image else []
+    names.append("vmlinuz-" + release)
+    for name in names:
+        matches = [fact for fact in facts if get_image_name(fact.get("kernel")) == name]
+        if matches:
+            defaults = [fact for fact in matches if fact.get("default")]
+            return (defaults or matches)[0]
+    return None
+
+
+def get_only_tokens(args, other):
+    """Get the tokens of args that other does not have, in order"""
+    extra = args.counts - other.counts
+    tokens = []
+    for token in args:
+        if extra[token]:
+            extra[token] -= 1
+            tokens.append(token)
+    return tokens
+
+
+def get_running_facts(
+    facts,
+    proc_cmdline=PROC_CMDLINE,
+    boot_id=BOOT_ID,
+    grubenv=GRUBENV,
+    release=None,
+):
+    """Get facts of the running kernel compared with the default kernel in facts
+
+    Returns None when the running command line cannot be read. The diff
+    lists the args that the running kernel has and the default kernel
+    does not have in running_only, and the other way round in
+    configured_only. BOOT_IMAGE is not compared, grub variables in the
+    configured args are expanded from the grub environment block.
+    """
+    cmdline = read_proc_file(proc_cmdline)
+    if cmdline is None:
+        return None
+    if release is None:
+        release = os.uname()[2]
+    boot_image = None
+    running_tokens = []
+    for token in tokenize_args(cmdline):
+        if get_arg_name(token) == BOOT_IMAGE_ARG:
+            boot_image = boot_image or get_arg_value(token)
+        else:
+            running_tokens.append(token)
+    running_args = KernelArgs(running_tokens)
+
+    running_kernel = find_running_kernel(facts, boot_image, release)
+    default_kernel = next((fact for fact in facts if fact.get("default")), None)
+    running_facts = {
+        "cmdline": cmdline,
+        "boot_id": read_proc_file(boot_id),
+        "release": release,
+        "entry": None,
+        "default": bool(running_kernel and running_kernel.get("default")),
+        "diff": None,
+    }
+    if running_kernel is not None:
+        running_facts["entry"] = dict(
+            (key, running_kernel[key]) for key in ENTRY_KEYS if key in running_kernel
+        )
+    drift = not running_facts["default"]
+    if default_kernel is not None:
+        configured_args = get_configured_args(default_kernel, read_grubenv(grubenv))
+        running_facts["diff"] = {
+            "running_only": get_only_tokens(running_args, configured_args),
+            "configured_only": get_only_tokens(configured_args, running_args),
+        }
+        drift = drift or running_args != configured_args
+    running_facts["drift"] = drift
+    return running_facts
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.bls module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from ansible.module_utils.bootloader_lsr import bls
+
+MACHINE_ID = "c44543d15b2c4e898912c2497f734e67"
+ROOT = "UUID=65c70529-e9ad-4778-9001-18fe8c525285"
+ARGS = "ro rootflags=subvol=root rhgb quiet"
+
+ENTRIES = {
+    MACHINE_ID
+    + "-6.5.12-100.fc37.x86_64": """title Fedora Linux (6.5.12-100.fc37.x86_64) 37
+version 6.5.12-100.fc37.x86_64
+linux /boot/vmlinuz-6.5.12-100.fc37.x86_64
+initrd /boot/initramfs-6.5.12-100.fc37.x86_64.img $tuned_initrd
+options root=%s %s $tuned_params
+grub_users $grub_users
+grub_arg --unrestricted
+grub_class fedora
+"""
+    % (ROOT, ARGS),
+    MACHINE_ID
+    + "-6.5.7-100.fc37.x86_64": """# entry without the root argument
+title Fedora Linux (6.5.7-100.fc37.x86_64) 37
+version 6.5.7-100.fc37.x86_64
+linux /boot/vmlinuz-6.5.7-100.fc37.x86_64
+initrd /boot/initramfs-6.5.7-100.fc37.x86_64.img
+options $kernelopts debug
+""",
+    MACHINE_ID
+    + "-0-rescue": """title Fedora Linux (0-rescue-%s) 36
+linux /boot/vmlinuz-0-rescue-%s
+initrd /boot/initramfs-0-rescue-%s.img
+options root=%s %s
+"""
+    % (MACHINE_ID, MACHINE_ID, MACHINE_ID, ROOT, ARGS),
+}
+
+FACTS = [
+    {
+        "args": ARGS + " $tuned_params",
+        "default": False,
+        "id": MACHINE_ID + "-6.5.12-100.fc37.x86_64",
+        "index": "0",
+        "initrd": "/boot/initramfs-6.5.12-100.fc37.x86_64.img $tuned_initrd",
+        "kernel": "/boot/vmlinuz-6.5.12-100.fc37.x86_64",
+        "root": ROOT,
+        "title": "Fedora Linux (6.5.12-100.fc37.x86_64) 37",
+    },
+    {
+        "args": "rhgb quiet debug",
+        "default": True,
+        "id": MACHINE_ID + "-6.5.7-100.fc37.x86_64",
+        "index": "1",
+        "initrd": "/boot/initramfs-6.5.7-100.fc37.x86_64.img",
+        "kernel": "/boot/vmlinuz-6.5.7-100.fc37.x86_64",
+        "root": ROOT,
+        "title": "Fedora Linux (6.5.7-100.fc37.x86_64) 37",
+    },
+    {
+        "args": ARGS,
+        "default": False,
+        "id": MACHINE_ID + "-0-rescue",
+        "index": "2",
+        "initrd": "/boot/initramfs-0-rescue-%s.img" % MACHINE_ID,
+        "kernel": "/boot/vmlinuz-0-rescue-%s" % MACHINE_ID,
+        "root": ROOT,
+        "title": "Fedora Linux (0-rescue-%s) 36" % MACHINE_ID,
+    },
+]
+
+GRUBENV = """# GRUB Environment Block
+saved_entry=%s-6.5.7-100.fc37.x86_64
+kernelopts=root=%s rhgb quiet
+boot_success=1
+""" % (
+    MACHINE_ID,
+    ROOT,
+)
+
+
+class BlsReader(unittest.TestCase):
+    """test reading and writing BLS entries"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.entries_dir = os.path.join(self.tmpdir, "entries")
+        self.grubenv = os.path.join(self.tmpdir, "grubenv")
+        self.default_grub = os.path.join(self.tmpdir, "grub")
+        os.mkdir(self.entries_dir)
+        for entry_id, content in ENTRIES.items():
+            with open(
+                os.path.join(self.entries_dir, entry_id + ".conf"), "w"
+            ) as file_fd:
+                file_fd.write(content)
+        with open(os.path.join(self.entries_dir, "README"), "w") as file_fd:
+            file_fd.write("not an entry\n")
+        with open(self.grubenv, "w") as file_fd:
+            file_fd.write(GRUBENV + "#" * 100)
+        with open(self.default_grub, "w") as file_fd:
+            file_fd.write('GRUB_TIMEOUT=5\nGRUB_ENABLE_BLSCFG="true"\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_bls_facts(self):
+        return bls.get_bls_facts(
+            self.entries_dir, self.grubenv, self.default_grub, self.tmpdir
+        )
+
+    def test_get_bls_facts(self):
+        self.assertEqual(self.get_bls_facts(), FACTS)
+
+    def test_get_bls_facts_default(self):
+        with open(self.grubenv, "w") as file_fd:
+            file_fd.write("saved_entry=2\n")
+        facts = self.get_bls_facts()
+        self.assertEqual([fact["default"] for fact in facts], [False, False, True])
+        self.assertEqual(facts[1]["args"], "debug")
+        os.unlink(self.grubenv)
+        facts = self.get_bls_facts()
+        self.assertEqual([fact["default"] for fact in facts], [True, False, False])
+        with open(self.grubenv, "w") as file_fd:
+            file_fd.write("saved_entry=%s\n" % FACTS[2]["title"])
+        facts = self.get_bls_facts()
+        self.assertEqual([fact["default"] for fact in facts], [False, False, True])
+
+    def test_get_bls_facts_filter(self):
+        facts = bls.get_bls_facts(
+            self.entries_dir,
+            self.grubenv,
+            self.default_grub,
+            self.tmpdir,
+            kernels=["DEFAULT", "2"],
+            fields=["index", "args"],
+        )
+        self.assertEqual(
+            facts,
+            [
+                {"index": fact["index"], "args": fact["args"]}
+                for fact in FACTS
+                if fact["default"] or fact["index"] == "2"
+            ],
+        )
+        with patch.object(bls, "tokenize_args") as tokenize_args:
+            facts = bls.get_bls_facts(
+                self.entries_dir,
+                self.grubenv,
+                self.default_grub,
+                self.tmpdir,
+                kernels=[FACTS[1]["kernel"]],
+                fields=["id", "title"],
+            )
+        tokenize_args.assert_not_called()
+        self.assertEqual(facts, [{"id": FACTS[1]["id"], "title": FACTS[1]["title"]}])
+
+    def test_get_bls_facts_fallback(self):
+        with open(self.default_grub, "w") as file_fd:
+            file_fd.write("GRUB_ENABLE_BLSCFG=false\n")
+        self.assertIsNone(self.get_bls_facts())
+        os.unlink(self.default_grub)
+        self.assertEqual(self.get_bls_facts(), FACTS)
+        shutil.rmtree(self.entries_dir)
+        self.assertIsNone(self.get_bls_facts())
+        os.mkdir(self.entries_dir)
+        self.assertIsNone(self.get_bls_facts())
+
+    def test_version_key(self):
+        entry_ids = ["m-0-rescue", "m-6.5.10-100", "m-6.5.7-100", "m-6.5.12-100"]
+        self.assertEqual(
+            sorted(entry_ids, key=bls.version_key, reverse=True),
+            ["m-6.5.12-100", "m-6.5.10-100", "m-6.5.7-100", "m-0-rescue"],
+        )
+
+    def test_add_boot_prefix(self):
+        self.assertEqual(
+            bls.add_boot_prefix("/initramfs.img $tuned_initrd", "/boot"),
+            "/boot/initramfs.img $tuned_initrd",
+        )
+        self.assertEqual(bls.add_boot_prefix("/vmlinuz", ""), "/vmlinuz")
+
+    def test_write_entry_options(self):
+        entry_path = os.path.join(self.entries_dir, FACTS[1]["id"] + ".conf")
+        os.chmod(entry_path, 0o600)
+        with open(entry_path) as entry_fd:
+            content = entry_fd.read()
+        self.assertFalse(
+            bls.write_entry_options(entry_path, "$kernelopts debug"),
+        )
+        self.assertTrue(bls.write_entry_options(entry_path, "ro debug"))
+        with open(entry_path) as entry_fd:
+            self.assertEqual(
+                entry_fd.read(), content.replace("$kernelopts debug", "ro debug")
+            )
+        self.assertEqual(os.stat(entry_path).st_mode & 0o777, 0o600)
+        self.assertEqual(
+            sorted(os.listdir(self.entries_dir)),
+            sorted([entry_id + ".conf" for entry_id in ENTRIES] + ["README"]),
+        )
+
+    def test_write_entry_options_lines(self):
+        entry_path = os.path.join(self.tmpdir, "entry.conf")
+        with open(entry_path, "w") as file_fd:
+            file_fd.write("title a\noptions ro\nlinux /vmlinuz\noptions quiet")
+        self.assertTrue(bls.write_entry_options(entry_path, "ro quiet debug"))
+        with open(entry_path) as entry_fd:
+            self.assertEqual(
+                entry_fd.read(), "title a\noptions ro quiet debug\nlinux /vmlinuz\n"
+            )
+        self.assertTrue(bls.write_entry_options(entry_path, ""))
+        with open(entry_path) as entry_fd:
+            self.assertEqual(entry_fd.read(), "title a\nlinux /vmlinuz\n")
+        self.assertTrue(bls.write_entry_options(entry_path, "quiet"))
+        with open(entry_path) as entry_fd:
+            self.assertEqual(
+                entry_fd.read(), "title a\nlinux /vmlinuz\noptions quiet\n"
+            )
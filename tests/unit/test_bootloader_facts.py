@@ -9,8 +9,16 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import os
+import shutil
+import tempfile
 import unittest
 
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
 import bootloader_facts
 import bootloader_settings
 
@@ -107,3 +115,55 @@ class InputValidator(unittest.TestCase):
             FACTS,
             kernels,
         )
+
+    def test_add_args_parsed(self):
+        facts = [{"args": "ro quiet console=tty0", "index": "0"}, {"index": "1"}]
+        bootloader_facts.add_args_parsed(facts)
+        self.assertEqual(
+            facts[0]["args_parsed"]["values"],
+            {"ro": [None], "quiet": [None], "console": ["tty0"]},
+        )
+        self.assertEqual(
+            facts[0]["args_parsed"]["options"][2], {"name": "console", "value": "tty0"}
+        )
+        self.assertNotIn("args_parsed", facts[1])
+
+    def test_get_cached_facts(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        cache_file = os.path.join(tmpdir, "facts.json")
+        mock_module = MagicMock(
+            params={"cache_file": cache_file},
+            check_mode=False,
+            run_command=MagicMock(return_value=(0, "", "")),
+        )
+        fingerprint = {"files": {"/boot/grub2/grubenv": [1, 2, 3]}}
+        with patch.object(
+            bootloader_facts, "get_boot_fingerprint", return_value=fingerprint
+        ), patch.object(
+            bootloader_facts, "get_bls_facts", return_value=FACTS
+        ) as get_bls_facts:
+            result = {}
+            self.assertEqual(
+                bootloader_facts.get_cached_facts(mock_module, result), FACTS
+            )
+            self.assertEqual(result, {"cache_hit": False})
+            self.assertEqual(
+                bootloader_facts.get_cached_facts(mock_module, result), FACTS
+            )
+            self.assertEqual(result, {"cache_hit": True})
+            self.assertEqual(get_bls_facts.call_count, 1)
+
+            fingerprint["files"]["/boot/grub2/grubenv"] = [4, 2, 3]
+            bootloader_facts.get_cached_facts(mock_module, result)
+            self.assertEqual(result, {"cache_hit": False})
+            self.assertEqual(get_bls_facts.call_count, 2)
+
+            self.assertEqual(
+                bootloader_facts.get_cached_facts(
+                    mock_module, result, ["DEFAULT"], ["index", "kernel"]
+                ),
+                [{"index": "2", "kernel": "/boot/vmlinuz-6.5.7-100.fc37.x86_64"}],
+            )
+            self.assertEqual(result, {"cache_hit": True})
+        mock_module.run_command.assert_not_called()
@@ -9,12 +9,16 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import copy
+import os
+import shutil
+import tempfile
 import unittest
 
 try:
-    from unittest.mock import MagicMock
+    from unittest.mock import MagicMock, patch
 except ImportError:
-    from mock import MagicMock
+    from mock import MagicMock, patch
 
 import bootloader_settings
 
@@ -139,7 +143,8 @@ KERNELS = [
 ]
 
 changed_args = "arg_with_str_value_absent=test_value arg_with_int_value_absent=1 arg_without_val_absent"
-INFO = """
+INFO = (
+    """
 index=0
 kernel="/boot/vmlinuz-6.5.12-100.fc37.x86_64"
 args="%s"
@@ -147,10 +152,13 @@ root="UUID=65c70529-e9ad-4778-9001-18fe8c525285"
 initrd="/boot/initramfs-6.5.12-100.fc37.x86_64.img $tuned_initrd"
 title="Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)"
 id="c44543d15b2c4e898912c2497f734e67-6.5.12-100.fc37.x86_64"
-""" % changed_args
+"""
+    % changed_args
+)
 
 same_args = "arg_with_str_value=test_value arg_with_int_value=1 arg_without_val"
-INFO_SAME_ARGS = """
+INFO_SAME_ARGS = (
+    """
 index=0
 kernel="/boot/vmlinuz-6.5.12-100.fc37.x86_64"
 args="%s"
@@ -158,9 +166,12 @@ root="UUID=65c70529-e9ad-4778-9001-18fe8c525285"
 initrd="/boot/initramfs-6.5.12-100.fc37.x86_64.img $tuned_initrd"
 title="Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)"
 id="c44543d15b2c4e898912c2497f734e67-6.5.12-100.fc37.x86_64"
-""" % same_args
+"""
+    % same_args
+)
 
-INFO_RHEL7 = """
+INFO_RHEL7 = (
+    """
 index=0
 kernel=/boot/vmlinuz-6.5.12-100.fc37.x86_64
 args="%s"
@@ -168,16 +179,40 @@ root=UUID=65c70529-e9ad-4778-9001-18fe8c525285
 initrd=/boot/initramfs-6.5.12-100.fc37.x86_64.img $tuned_initrd
 title=Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)
 id=c44543d15b2c4e898912c2497f734e67-6.5.12-100.fc37.x86_64
-""" % changed_args
+"""
+    % changed_args
+)
+
+KERNEL_TABLE = bootloader_settings.get_kernel_table(FACTS)
 
 kernels_keys = ["kernel_index", "kernel_path", "kernel_title", "DEFAULT", "ALL"]
 
 
+def kernel_facts(kernel_info):
+    """Get a fresh in-memory boot model for grubby --info output"""
+    return bootloader_settings.get_facts(kernel_info, "0")
+
+
+def plan_mod_boot_args(bootloader_setting, kernel_info):
+    """Plan bootloader_setting for kernels in kernel_info and get grubby commands"""
+    bootloader_facts = kernel_facts(kernel_info)
+    plan = bootloader_settings.new_plan(bootloader_facts)
+    bootloader_settings.mod_boot_args(
+        plan,
+        bootloader_setting,
+        bootloader_settings.get_kernel_facts(
+            bootloader_settings.get_kernel_table(bootloader_facts),
+            bootloader_setting["kernel"],
+        ),
+    )
+    return bootloader_settings.get_plan_commands(bootloader_settings.export_plan(plan))
+
+
 class InputValidator(unittest.TestCase):
     """test functions that process bootloader_settings argument"""
 
     mock_module = MagicMock(
-        run_command=MagicMock(return_value=("test_rc", "test_stdout", "test_err")),
+        run_command=MagicMock(return_value=(0, "test_stdout", "test_err")),
         fail_json=MagicMock(side_effect=SystemExit),
         check_mode=False,
     )
@@ -187,6 +222,7 @@ class InputValidator(unittest.TestCase):
 
     def reset_vars(self):
         self.mock_module.run_command.reset_mock()
+        self.mock_module.run_command.return_value = (0, "test_stdout", "test_err")
         self.mock_module.fail_json.reset_mock()
         self.mock_module.check_mode = False
         self.result = dict(changed=False, actions=list())
@@ -210,7 +246,7 @@ class InputValidator(unittest.TestCase):
     def test_validate_kernels(self):
         self.reset_vars()
         self.kernel_action, self.kernel = bootloader_settings.validate_kernels(
-            self.mock_module, SETTINGS[0], FACTS
+            self.mock_module, SETTINGS[0], KERNEL_TABLE
         )
         self.mock_module.fail_json.assert_not_called()
         self.assertEqual(self.kernel_action, "modify")
@@ -218,7 +254,7 @@ class InputValidator(unittest.TestCase):
         self.reset_vars()
 
         self.kernel_action, self.kernel = bootloader_settings.validate_kernels(
-            self.mock_module, SETTINGS[1], FACTS
+            self.mock_module, SETTINGS[1], KERNEL_TABLE
         )
         self.mock_module.fail_json.assert_not_called()
         self.assertEqual(self.kernel_action, "modify")
@@ -226,14 +262,14 @@ class InputValidator(unittest.TestCase):
         self.reset_vars()
 
         err = "kernel INCORRECT_STRING is of type str, it must be one of 'DEFAULT, ALL'"
-        cmd_args = SETTINGS[2], FACTS
+        cmd_args = SETTINGS[2], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
         self.reset_vars()
 
         self.kernel_action, self.kernel = bootloader_settings.validate_kernels(
-            self.mock_module, SETTINGS[3], FACTS
+            self.mock_module, SETTINGS[3], KERNEL_TABLE
         )
         self.mock_module.fail_json.assert_not_called()
         self.assertEqual(self.kernel_action, "modify")
@@ -241,7 +277,7 @@ class InputValidator(unittest.TestCase):
         self.reset_vars()
 
         err = "kernel value in 'index: [0, 1]' must be of type str or int"
-        cmd_args = SETTINGS[4], FACTS
+        cmd_args = SETTINGS[4], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
@@ -249,7 +285,7 @@ class InputValidator(unittest.TestCase):
 
         # initrd can be provided ONLY when creating a self.kernel
         err = "kernel key in 'kernel_index: [0, 1]' must be one of 'path, index, title, initrd'"
-        cmd_args = SETTINGS[5], FACTS
+        cmd_args = SETTINGS[5], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
@@ -259,7 +295,7 @@ class InputValidator(unittest.TestCase):
             "A kernel with provided ['path'] already exists and its other fields are different "
             + "{'title': ('Fedora Linux', 'Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)')}"
         )
-        cmd_args = SETTINGS[6], FACTS
+        cmd_args = SETTINGS[6], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
@@ -268,14 +304,14 @@ class InputValidator(unittest.TestCase):
         err = (
             "To create a kernel, you must provide 3 kernel keys - 'path, title, initrd'"
         )
-        cmd_args = SETTINGS[7], FACTS
+        cmd_args = SETTINGS[7], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
         self.reset_vars()
 
         self.kernel_action, self.kernel = bootloader_settings.validate_kernels(
-            self.mock_module, SETTINGS[8], FACTS
+            self.mock_module, SETTINGS[8], KERNEL_TABLE
         )
         self.mock_module.fail_json.assert_not_called()
         self.assertEqual(self.kernel_action, "create")
@@ -286,48 +322,110 @@ class InputValidator(unittest.TestCase):
         self.reset_vars()
 
         err = "You can use 'initrd' as a kernel key only when you must create a kernel. To modify or remove an existing kernel, use one of path, title, index"
-        cmd_args = SETTINGS[9], FACTS
+        cmd_args = SETTINGS[9], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
         self.reset_vars()
 
         err = "State must be one of 'present, absent'"
-        cmd_args = SETTINGS[10], FACTS
+        cmd_args = SETTINGS[10], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
         self.reset_vars()
 
         err = "kernel value in [{'initrd': '/boot/initramfs-6.6.img'}] must be of type str or dict"
-        cmd_args = SETTINGS[11], FACTS
+        cmd_args = SETTINGS[11], KERNEL_TABLE
         self.assert_error_msg(err, *cmd_args)
         self.assertIsNone(self.kernel_action)
         self.assertIsNone(self.kernel)
         self.reset_vars()
 
         self.kernel_action, self.kernel = bootloader_settings.validate_kernels(
-            self.mock_module, SETTINGS[12], FACTS
+            self.mock_module, SETTINGS[12], KERNEL_TABLE
         )
         self.mock_module.fail_json.assert_not_called()
         self.assertEqual(self.kernel_action, "modify")
         self.reset_vars()
 
+    def test_get_kernel_table(self):
+        """Test that kernels are looked up by key without scanning the facts"""
+        self.assertEqual(
+            KERNEL_TABLE["path"]["/boot/vmlinuz-6.5.7-100.fc37.x86_64"], (2,)
+        )
+        self.assertEqual(KERNEL_TABLE["path"]["non linux entry"], (4,))
+        self.assertEqual(KERNEL_TABLE["index"]["3"], (3,))
+        self.assertEqual(KERNEL_TABLE["id"][FACTS[1]["id"]], (1,))
+        self.assertEqual(KERNEL_TABLE["title"][FACTS[0]["title"]], (0,))
+        self.assertEqual(KERNEL_TABLE["all"], tuple(FACTS[:4]))
+        self.assertEqual(KERNEL_TABLE["default"], (FACTS[2],))
+        self.assertEqual(
+            bootloader_settings.get_kernel_facts(KERNEL_TABLE, {"index": 3}),
+            [FACTS[3]],
+        )
+        self.assertEqual(
+            bootloader_settings.get_kernel_facts(
+                KERNEL_TABLE, {"path": "/boot/vmlinuz-missing"}
+            ),
+            [],
+        )
+        self.assertEqual(
+            bootloader_settings.find_kernel_candidates(
+                KERNEL_TABLE,
+                {
+                    "path": FACTS[3]["kernel"],
+                    "title": FACTS[1]["title"],
+                    "initrd": "/boot/initramfs-missing.img",
+                },
+            ),
+            [FACTS[1], FACTS[3]],
+        )
+
     def test_add_kernel(self):
-        self.reset_vars()
         self.kernel = bootloader_settings.get_create_kernel(SETTINGS[8]["kernel"])
-        bootloader_settings.add_kernel(
-            self.mock_module, self.result, SETTINGS[8], self.kernel
-        )
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.add_kernel(plan, SETTINGS[8], self.kernel, bootloader_facts)
         expected_cmd = (
             "grubby --initrd=/boot/initramfs-6.6.img --add-kernel=/boot/vmlinuz-6 --title='Fedora Linux' "
             + "--args='arg_with_str_value=test_value arg_with_int_value=1 arg_without_val arg_with_str_value_absent=test_value "
             + "arg_with_int_value_absent=1 arg_without_val_absent' --copy-default"
         )
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [expected_cmd],
+        )
+        # The created kernel copies args of the default kernel
+        self.assertEqual(len(bootloader_facts), len(FACTS) + 1)
+        self.assertEqual(bootloader_facts[-1]["kernel"], "/boot/vmlinuz-6")
+        self.assertEqual(
+            bootloader_facts[-1]["args"],
+            FACTS[2]["args"]
+            + " arg_with_str_value=test_value arg_with_int_value=1 arg_without_val"
+            + " arg_with_str_value_absent=test_value arg_with_int_value_absent=1"
+            + " arg_without_val_absent",
+        )
+        self.assertFalse(bootloader_facts[-1]["default"])
+
+        # Args planned for the created kernel are written after copying
+        # the default args
+        bootloader_settings.mod_boot_args(
+            plan,
+            {"options": [{"name": "quiet", "state": "absent"}]},
+            [bootloader_facts[-1]],
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [
+                expected_cmd,
+                "grubby --update-kernel=/boot/vmlinuz-6 --remove-args=quiet",
+            ],
+        )
 
         # Test adding kernel with default=True (covers --make-default code path)
         kernel_setting_with_default = {
@@ -346,17 +444,37 @@ class InputValidator(unittest.TestCase):
         test_kernel = bootloader_settings.get_create_kernel(
             kernel_setting_with_default["kernel"]
         )
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
         bootloader_settings.add_kernel(
-            self.mock_module, self.result, kernel_setting_with_default, test_kernel
+            plan, kernel_setting_with_default, test_kernel, bootloader_facts
         )
         expected_cmd_with_default = (
             "grubby --initrd=/boot/initramfs-test.img --add-kernel=/boot/vmlinuz-test --title='Test Kernel' "
             + "--args='console=tty0 quiet' --make-default"
         )
-        self.mock_module.run_command.assert_called_once_with(expected_cmd_with_default)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd_with_default)
-        self.reset_vars()
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [expected_cmd_with_default],
+        )
+        self.assertEqual(
+            [fact["kernel"] for fact in bootloader_facts if fact["default"]],
+            ["/boot/vmlinuz-test"],
+        )
+        self.assertEqual(bootloader_facts[-1]["args"], "console=tty0 quiet")
+
+        # Args planned for the created kernel are added with the kernel
+        bootloader_settings.mod_boot_args(
+            plan, {"options": [{"name": "debug"}]}, [bootloader_facts[-1]]
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [expected_cmd_with_default.replace("quiet'", "quiet debug'")],
+        )
 
         # Test adding kernel with both copy_default and make-default
         kernel_setting_both = {
@@ -375,17 +493,18 @@ class InputValidator(unittest.TestCase):
         test_kernel_both = bootloader_settings.get_create_kernel(
             kernel_setting_both["kernel"]
         )
-        bootloader_settings.add_kernel(
-            self.mock_module, self.result, kernel_setting_both, test_kernel_both
-        )
+        plan = bootloader_settings.new_plan([])
+        bootloader_settings.add_kernel(plan, kernel_setting_both, test_kernel_both, [])
         expected_cmd_both = (
             "grubby --initrd=/boot/initramfs-test-both.img --add-kernel=/boot/vmlinuz-test-both --title='Test Kernel Both' "
             + "--args=console=tty0 --copy-default --make-default"
         )
-        self.mock_module.run_command.assert_called_once_with(expected_cmd_both)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd_both)
-        self.reset_vars()
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [expected_cmd_both],
+        )
 
         # Test adding kernel with no options but default=True
         kernel_setting_no_options = {
@@ -400,61 +519,161 @@ class InputValidator(unittest.TestCase):
         test_kernel_no_options = bootloader_settings.get_create_kernel(
             kernel_setting_no_options["kernel"]
         )
+        plan = bootloader_settings.new_plan([])
         bootloader_settings.add_kernel(
-            self.mock_module,
-            self.result,
-            kernel_setting_no_options,
-            test_kernel_no_options,
+            plan, kernel_setting_no_options, test_kernel_no_options, []
         )
         expected_cmd_no_options = (
             "grubby --initrd=/boot/initramfs-test-no-options.img --add-kernel=/boot/vmlinuz-test-no-options --title='Test Kernel No Options' "
             + "--make-default"
         )
-        self.mock_module.run_command.assert_called_once_with(expected_cmd_no_options)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd_no_options)
-        self.reset_vars()
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [expected_cmd_no_options],
+        )
 
     def test_rm_kernel(self):
-        self.reset_vars()
         self.kernel = bootloader_settings.get_single_kernel(SETTINGS[3]["kernel"])
         self.assertEqual(
             self.kernel,
             "1",
         )
 
-        bootloader_settings.rm_kernel(self.mock_module, self.result, self.kernel)
-        expected_cmd = "grubby --remove-kernel=1"
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.rm_kernel(
+            plan,
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts),
+                SETTINGS[3]["kernel"],
+            ),
+            bootloader_facts,
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --remove-kernel=1"],
+        )
+        # Remaining kernels are renumbered like grubby does
+        self.assertEqual(
+            [(fact["index"], fact["kernel"]) for fact in bootloader_facts],
+            [
+                ("0", FACTS[0]["kernel"]),
+                ("1", FACTS[2]["kernel"]),
+                ("2", FACTS[3]["kernel"]),
+                ("3", FACTS[4]["kernel"]),
+            ],
+        )
+
+        # Kernels are removed from the highest snapshot index
+        bootloader_settings.rm_kernel(
+            plan,
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts), {"index": 1}
+            ),
+            bootloader_facts,
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --remove-kernel=2", "grubby --remove-kernel=1"],
+        )
+
+        # Removing a kernel that does not exist does nothing
+        plan = bootloader_settings.new_plan([])
+        bootloader_settings.rm_kernel(plan, [], [])
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [],
+        )
+
+        # Removing a kernel created in the same plan drops the creation
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.add_kernel(
+            plan,
+            SETTINGS[8],
+            bootloader_settings.get_create_kernel(SETTINGS[8]["kernel"]),
+            bootloader_facts,
+        )
+        bootloader_settings.rm_kernel(
+            plan,
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts),
+                {"path": "/boot/vmlinuz-6"},
+            ),
+            bootloader_facts,
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [],
+        )
+        self.assertEqual(bootloader_facts, FACTS)
 
     def test_get_boot_args(self):
-        bootloader_args = bootloader_settings.get_boot_args(INFO)
+        bootloader_args = bootloader_settings.get_boot_args(kernel_facts(INFO))
         self.assertEqual(
             bootloader_args,
             "arg_with_str_value_absent=test_value arg_with_int_value_absent=1 arg_without_val_absent",
         )
-        bootloader_args = bootloader_settings.get_boot_args(INFO_RHEL7)
+        bootloader_args = bootloader_settings.get_boot_args(kernel_facts(INFO_RHEL7))
         self.assertEqual(
             bootloader_args,
             "arg_with_str_value_absent=test_value arg_with_int_value_absent=1 arg_without_val_absent",
         )
-        bootloader_args = bootloader_settings.get_boot_args("")
+        bootloader_args = bootloader_settings.get_boot_args([])
         self.assertEqual(bootloader_args, "")
 
-    def test_rm_boot_args(self):
-        self.reset_vars()
-        bootloader_settings.rm_boot_args(self.mock_module, self.result, INFO, "0")
-        expected_cmd = (
-            "grubby --update-kernel=0 --remove-args="
-            + "'arg_with_str_value_absent=test_value arg_with_int_value_absent=1 arg_without_val_absent'"
+    def test_replace_boot_args(self):
+        """Test that previous: replaced changes only the args that differ"""
+        bootloader_facts = kernel_facts(INFO_SAME_ARGS)
+        bootloader_facts[0]["args"] = "ro quiet rhgb console=tty0"
+        options = [
+            {"previous": "replaced"},
+            {"name": "ro"},
+            {"name": "quiet"},
+            {"name": "debug"},
+            {"name": "console", "value": "ttyS0"},
+        ]
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.replace_boot_args(plan, options, bootloader_facts)
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [
+                "grubby --update-kernel=0 --remove-args='rhgb console=tty0' "
+                + "--args='console=ttyS0 debug'"
+            ],
         )
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
+        self.assertEqual(bootloader_facts[0]["args"], "ro quiet console=ttyS0 debug")
+
+        # Kernels with the desired args in another order are not changed
+        bootloader_facts[0]["args"] = "debug console=ttyS0 quiet ro"
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.replace_boot_args(plan, options, bootloader_facts)
+        self.assertEqual(plan["kernels"], [])
+
+        # Replacing with no args removes all args
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.replace_boot_args(
+            plan, [{"previous": "replaced"}], bootloader_facts
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --update-kernel=0 --remove-args='debug console=ttyS0 quiet ro'"],
+        )
+        self.assertEqual(bootloader_facts[0]["args"], "")
 
     def test_get_duplicate_present_option_names(self):
         """Test get_duplicate_present_option_names with mixed option entries"""
@@ -499,10 +718,14 @@ class InputValidator(unittest.TestCase):
             set(),
         )
         self.assertEqual(
-            bootloader_settings.find_boot_arg_tokens(
-                "ro console=tty0 console=ttyS0 quiet", "console"
+            bootloader_settings.get_boot_args_delta(
+                duplicate_console_setting["options"],
+                "ro console=ttyS0 quiet console=tty0",
+            ),
+            (
+                ["console=ttyS0", "console=tty0"],
+                ["console=tty0", "console=ttyS0"],
             ),
-            ["console=tty0", "console=ttyS0"],
         )
 
         info_empty_args = """
@@ -511,17 +734,10 @@ kernel="/boot/vmlinuz-test"
 args=""
 title="Fedora Linux"
 """
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            duplicate_console_setting,
-            "ALL",
-            info_empty_args,
-        )
-        self.mock_module.run_command.assert_called_once_with(
-            "grubby --update-kernel=ALL --args='console=tty0 console=ttyS0'"
+        self.assertEqual(
+            plan_mod_boot_args(duplicate_console_setting, info_empty_args),
+            ["grubby --update-kernel=0 --args='console=tty0 console=ttyS0'"],
         )
-        self.reset_vars()
 
         info_one_console = """
 index=0
@@ -529,19 +745,14 @@ kernel="/boot/vmlinuz-test"
 args="ro console=tty0 rhgb quiet"
 title="Fedora Linux"
 """
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            duplicate_console_setting,
-            "ALL",
-            info_one_console,
-        )
-        self.mock_module.run_command.assert_called_once_with(
-            "grubby --update-kernel=ALL "
-            + "--remove-args=console=tty0 "
-            + "--args='console=tty0 console=ttyS0'"
+        self.assertEqual(
+            plan_mod_boot_args(duplicate_console_setting, info_one_console),
+            [
+                "grubby --update-kernel=0 "
+                + "--remove-args=console=tty0 "
+                + "--args='console=tty0 console=ttyS0'"
+            ],
         )
-        self.reset_vars()
 
         info_both_consoles = """
 index=0
@@ -549,15 +760,9 @@ kernel="/boot/vmlinuz-test"
 args="ro console=tty0 console=ttyS0 rhgb quiet"
 title="Fedora Linux"
 """
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            duplicate_console_setting,
-            "ALL",
-            info_both_consoles,
+        self.assertEqual(
+            plan_mod_boot_args(duplicate_console_setting, info_both_consoles), []
         )
-        self.mock_module.run_command.assert_not_called()
-        self.reset_vars()
 
         duplicate_same_value_setting = {
             "kernel": "ALL",
@@ -566,115 +771,92 @@ title="Fedora Linux"
                 {"name": "console", "value": "tty0"},
             ],
         }
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            duplicate_same_value_setting,
-            "ALL",
-            info_empty_args,
-        )
-        self.mock_module.run_command.assert_called_once_with(
-            "grubby --update-kernel=ALL --args=console=tty0"
+        self.assertEqual(
+            plan_mod_boot_args(duplicate_same_value_setting, info_empty_args),
+            ["grubby --update-kernel=0 --args=console=tty0"],
         )
-        self.reset_vars()
-
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            duplicate_same_value_setting,
-            "ALL",
-            info_one_console,
+        self.assertEqual(
+            plan_mod_boot_args(duplicate_same_value_setting, info_one_console), []
         )
-        self.mock_module.run_command.assert_not_called()
-        self.reset_vars()
 
     def test_mod_boot_args(self):
-        self.reset_vars()
-        args = (
-            "--remove-args='arg_with_str_value_absent=test_value arg_with_int_value_absent=1 arg_without_val_absent' "
+        expected_cmd = (
+            "grubby --update-kernel=0 "
+            + "--remove-args='arg_with_str_value_absent=test_value arg_with_int_value_absent=1 arg_without_val_absent' "
             + "--args='arg_with_str_value=test_value arg_with_int_value=1 arg_without_val'"
         )
 
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            str(KERNELS[1]["kernel"]["kernel_index"]),
-            INFO,
-        )
-        expected_cmd = "grubby --update-kernel=2 " + args
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
+        # All ways to select the kernel resolve to the same kernel entry
+        for kernel in [
+            {"index": 0},
+            {"path": "/boot/vmlinuz-6.5.12-100.fc37.x86_64"},
+            {"title": "Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)"},
+            "DEFAULT",
+            "ALL",
+            SETTINGS[12]["kernel"],
+        ]:
+            bootloader_setting = dict(SETTINGS[12], kernel=kernel)
+            self.assertEqual(
+                plan_mod_boot_args(bootloader_setting, INFO), [expected_cmd]
+            )
 
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            KERNELS[3]["kernel"]["kernel_path"],
-            INFO,
-        )
-        expected_cmd = "grubby --update-kernel=/path/3 " + args
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
+        self.assertEqual(plan_mod_boot_args(SETTINGS[12], INFO_SAME_ARGS), [])
 
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            bootloader_settings.escapeval(
-                "TITLE=" + KERNELS[5]["kernel"]["kernel_title"]
+        # Kernels that do not exist are not modified
+        self.assertEqual(
+            plan_mod_boot_args(
+                dict(
+                    SETTINGS[12], kernel={"path": KERNELS[3]["kernel"]["kernel_path"]}
+                ),
+                INFO,
             ),
-            INFO,
-        )
-        expected_cmd = (
-            "grubby --update-kernel='TITLE=Fedora Linux (1.1.11-300.fc37.x86_64) 37 (Workstation Edition)' "
-            + args
+            [],
         )
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
 
+        # Each kernel is compared with its own args
+        bootloader_facts = copy.deepcopy(FACTS)
+        bootloader_facts[1]["args"] += " debug"
+        plan = bootloader_settings.new_plan(bootloader_facts)
         bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            KERNELS[6]["kernel"],
-            INFO,
+            plan,
+            {"kernel": "ALL", "options": [{"name": "debug", "state": "absent"}]},
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts), "ALL"
+            ),
         )
-        expected_cmd = "grubby --update-kernel=DEFAULT " + args
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
-
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            KERNELS[7]["kernel"],
-            INFO,
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --update-kernel=1 --remove-args=debug"],
         )
-        expected_cmd = "grubby --update-kernel=ALL " + args
-        self.mock_module.run_command.assert_called_once_with(expected_cmd)
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(self.result["actions"][0], expected_cmd)
-        self.reset_vars()
 
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            str(KERNELS[1]["kernel"]["kernel_index"]),
-            INFO_SAME_ARGS,
+        # Changes of the same kernel are merged into one command
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        for bootloader_setting in [
+            {"kernel": {"index": 1}, "options": [{"name": "debug"}]},
+            {"kernel": {"index": 1}, "options": [{"name": "rhgb", "state": "absent"}]},
+            {
+                "kernel": {"path": "/boot/vmlinuz-6.5.10-100.fc37.x86_64"},
+                "options": [{"name": "console", "value": "tty0"}],
+            },
+            {"kernel": {"index": 1}, "options": [{"name": "debug", "state": "absent"}]},
+        ]:
+            bootloader_settings.mod_boot_args(
+                plan,
+                bootloader_setting,
+                bootloader_settings.get_kernel_facts(
+                    bootloader_settings.get_kernel_table(bootloader_facts),
+                    bootloader_setting["kernel"],
+                ),
+            )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --update-kernel=1 --remove-args=rhgb --args=console=tty0"],
         )
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["actions"], [])
-        self.reset_vars()
 
     def test_validate_default_kernel(self):
         """Test validate_default_kernel function"""
@@ -793,238 +975,246 @@ title="Fedora Linux"
             )
         self.reset_vars()
 
-    def test_get_default_kernel(self):
-        """Test get_default_kernel function"""
-        self.reset_vars()
-
-        # Test getting default kernel by kernel (path)
-        self.mock_module.run_command.return_value = ("0", "/boot/vmlinuz-test", "")
-        result = bootloader_settings.get_default_kernel(self.mock_module, "kernel")
-        self.assertEqual(result, "/boot/vmlinuz-test")
-        self.mock_module.run_command.assert_called_once_with("grubby --default-kernel")
-        self.reset_vars()
-
-        # Test getting default kernel by title
-        self.mock_module.run_command.return_value = ("0", "Test Kernel Title", "")
-        result = bootloader_settings.get_default_kernel(self.mock_module, "title")
-        self.assertEqual(result, "Test Kernel Title")
-        self.mock_module.run_command.assert_called_once_with("grubby --default-title")
-        self.reset_vars()
-
-        # Test getting default kernel by index
-        self.mock_module.run_command.return_value = ("0", "2", "")
-        result = bootloader_settings.get_default_kernel(self.mock_module, "index")
-        self.assertEqual(result, "2")
-        self.mock_module.run_command.assert_called_once_with("grubby --default-index")
-        self.reset_vars()
-
     def test_mod_default_kernel(self):
         """Test mod_default_kernel function"""
-        self.reset_vars()
-
-        # Mock kernel info with quoted kernel path
-        kernel_info_with_kernel = '''index=0
-kernel="/boot/vmlinuz-6.5.12-100.fc37.x86_64"
-args="ro rootflags=subvol=root rhgb quiet"
-root="UUID=65c70529-e9ad-4778-9001-18fe8c525285"
-initrd="/boot/initramfs-6.5.12-100.fc37.x86_64.img"
-title="Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)"
-id="c44543d15b2c4e898912c2497f734e67-6.5.12-100.fc37.x86_64"'''
-
         # Test setting kernel as default when it's not currently default
         bootloader_setting = {
             "kernel": {"path": "/boot/vmlinuz-6.5.12-100.fc37.x86_64"},
             "default": True,
         }
-
-        # Mock current default kernel to be different
-        self.mock_module.run_command.return_value = ("0", "/boot/vmlinuz-different", "")
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
 
         bootloader_settings.mod_default_kernel(
-            self.mock_module, self.result, bootloader_setting, kernel_info_with_kernel
+            plan,
+            bootloader_setting,
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts),
+                bootloader_setting["kernel"],
+            ),
+            bootloader_facts,
         )
 
-        self.assertEqual(self.mock_module.run_command.call_count, 2)
-        self.mock_module.run_command.assert_any_call("grubby --default-kernel")
-        self.mock_module.run_command.assert_any_call(
-            "grubby --set-default=/boot/vmlinuz-6.5.12-100.fc37.x86_64"
+        # The current default comes from the in-memory boot model
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --set-default=/boot/vmlinuz-6.5.12-100.fc37.x86_64"],
         )
-        self.assertEqual(self.result["changed"], False)
         self.assertEqual(
-            self.result["actions"][0],
-            "grubby --set-default=/boot/vmlinuz-6.5.12-100.fc37.x86_64",
+            [fact["index"] for fact in bootloader_facts if fact["default"]], ["0"]
         )
-        self.reset_vars()
 
         # Test when kernel is already default - should not change anything
-        self.mock_module.run_command.return_value = (
-            "0",
-            "/boot/vmlinuz-6.5.12-100.fc37.x86_64",
-            "",
-        )
-
+        plan = bootloader_settings.new_plan(bootloader_facts)
         bootloader_settings.mod_default_kernel(
-            self.mock_module, self.result, bootloader_setting, kernel_info_with_kernel
+            plan,
+            bootloader_setting,
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts),
+                bootloader_setting["kernel"],
+            ),
+            bootloader_facts,
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [],
         )
-
-        # Should only call once to get current default, not call set-default
-        self.assertEqual(self.mock_module.run_command.call_count, 1)
-        self.mock_module.run_command.assert_called_with("grubby --default-kernel")
-        self.assertEqual(self.result["actions"], [])
-        self.reset_vars()
 
         # Test when default is False - should not change anything
         bootloader_setting_no_default = {
             "kernel": {"path": "/boot/vmlinuz-6.5.12-100.fc37.x86_64"},
             "default": False,
         }
-
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
         bootloader_settings.mod_default_kernel(
-            self.mock_module,
-            self.result,
-            bootloader_setting_no_default,
-            kernel_info_with_kernel,
+            plan, bootloader_setting_no_default, [bootloader_facts[0]], bootloader_facts
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [],
         )
-
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["actions"], [])
-        self.reset_vars()
 
         # Test when kernel info doesn't have kernel field
         kernel_info_no_kernel = '''index=0
 args="ro rootflags=subvol=root rhgb quiet"
 root="UUID=65c70529-e9ad-4778-9001-18fe8c525285"'''
-
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
         bootloader_settings.mod_default_kernel(
-            self.mock_module, self.result, bootloader_setting, kernel_info_no_kernel
+            plan,
+            bootloader_setting,
+            kernel_facts(kernel_info_no_kernel),
+            bootloader_facts,
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [],
         )
 
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["actions"], [])
+        # The default kernel is not set when it is removed afterwards
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.mod_default_kernel(
+            plan, bootloader_setting, [bootloader_facts[0]], bootloader_facts
+        )
+        bootloader_settings.rm_kernel(plan, [bootloader_facts[0]], bootloader_facts)
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --remove-kernel=0"],
+        )
         self.reset_vars()
 
-        # Test invalid type parameter
-        try:
-            bootloader_settings.get_default_kernel(self.mock_module, "invalid")
-        except SystemExit:
-            self.mock_module.fail_json.assert_called_once_with(
-                msg="Type must be one of 'kernel', 'title', or 'index'"
-            )
-        self.reset_vars()
+    def test_get_update_commands(self):
+        """Test that kernels with the same args delta are updated in bulk"""
+        bootloader_facts = copy.deepcopy(FACTS)
+        bootloader_facts[1]["args"] += " debug"
+        setting = {"kernel": "ALL", "options": [{"name": "debug"}]}
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.mod_boot_args(plan, setting, bootloader_facts[:4])
+        # Kernel 1 already has debug, so it is not updated
+        self.assertEqual(
+            bootloader_settings.get_update_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [
+                "grubby --update-kernel=0 --args=debug",
+                "grubby --update-kernel=2 --args=debug",
+                "grubby --update-kernel=3 --args=debug",
+            ],
+        )
+        # Kernel 1 is removed, so all remaining kernels get the same args
+        bootloader_settings.rm_kernel(plan, [bootloader_facts[1]], bootloader_facts)
+        self.assertEqual(
+            bootloader_settings.get_update_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --update-kernel=ALL --args=debug"],
+        )
+
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.mod_boot_args(plan, setting, bootloader_facts[:3])
+        bootloader_settings.mod_boot_args(
+            plan,
+            {"kernel": {"index": 3}, "options": [{"name": "quiet", "state": "absent"}]},
+            bootloader_facts[3:4],
+        )
+        self.assertEqual(
+            bootloader_settings.get_update_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [
+                "grubby --update-kernel=0 --args=debug",
+                "grubby --update-kernel=1 --args=debug",
+                "grubby --update-kernel=2 --args=debug",
+                "grubby --update-kernel=3 --remove-args=quiet",
+            ],
+        )
+        bootloader_settings.mod_boot_args(plan, setting, bootloader_facts[3:4])
+        self.assertEqual(
+            bootloader_settings.get_update_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [
+                "grubby --update-kernel=0 --args=debug",
+                "grubby --update-kernel=1 --args=debug",
+                "grubby --update-kernel=2 --args=debug",
+                "grubby --update-kernel=3 --remove-args=quiet --args=debug",
+            ],
+        )
 
     def test_check_mode_skips_write_commands_only(self):
         """Test that check mode skips write grubby commands but runs reads"""
         self.reset_vars()
-        self.mock_module.check_mode = True
-
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
         bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
+            plan,
             SETTINGS[12],
-            KERNELS[7]["kernel"],
-            INFO,
-        )
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(len(self.result["actions"]), 1)
-        self.assertTrue(
-            self.result["actions"][0].startswith("grubby --update-kernel=ALL")
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts), "ALL"
+            ),
         )
-        self.reset_vars()
-
-        self.mock_module.check_mode = True
         bootloader_settings.add_kernel(
-            self.mock_module,
-            self.result,
+            plan,
             SETTINGS[8],
             bootloader_settings.get_create_kernel(SETTINGS[8]["kernel"]),
+            bootloader_facts,
         )
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(len(self.result["actions"]), 1)
-        self.reset_vars()
-
-        self.mock_module.check_mode = True
         bootloader_settings.rm_kernel(
-            self.mock_module,
-            self.result,
-            bootloader_settings.get_single_kernel(SETTINGS[3]["kernel"]),
+            plan,
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts),
+                SETTINGS[3]["kernel"],
+            ),
+            bootloader_facts,
         )
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(len(self.result["actions"]), 1)
-        self.reset_vars()
-
-        self.mock_module.check_mode = True
-        bootloader_settings.rm_boot_args(self.mock_module, self.result, INFO, "0")
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["changed"], False)
-        self.assertEqual(len(self.result["actions"]), 1)
-        self.reset_vars()
-
-        kernel_info_with_kernel = '''index=0
-kernel="/boot/vmlinuz-6.5.12-100.fc37.x86_64"
-args="ro rootflags=subvol=root rhgb quiet"
-root="UUID=65c70529-e9ad-4778-9001-18fe8c525285"
-initrd="/boot/initramfs-6.5.12-100.fc37.x86_64.img"
-title="Fedora Linux (6.5.12-100.fc37.x86_64) 37 (Workstation Edition)"
-id="c44543d15b2c4e898912c2497f734e67-6.5.12-100.fc37.x86_64"'''
-        bootloader_setting = {
-            "kernel": {"path": "/boot/vmlinuz-6.5.12-100.fc37.x86_64"},
-            "default": True,
-        }
-        self.mock_module.check_mode = True
-        self.mock_module.run_command.return_value = ("0", "/boot/vmlinuz-different", "")
         bootloader_settings.mod_default_kernel(
-            self.mock_module, self.result, bootloader_setting, kernel_info_with_kernel
+            plan,
+            {"kernel": {"index": 0}, "default": True},
+            bootloader_settings.get_kernel_facts(
+                bootloader_settings.get_kernel_table(bootloader_facts), {"index": 0}
+            ),
+            bootloader_facts,
+        )
+        commands = bootloader_settings.get_plan_commands(
+            bootloader_settings.export_plan(plan)
+        )
+        self.assertEqual(
+            [command.split("=")[0] for command in commands],
+            [
+                # All kernels get the same args, index 1 is removed afterwards
+                "grubby --update-kernel",
+                "grubby --remove-kernel",
+                "grubby --initrd",
+                "grubby --set-default",
+            ],
         )
-        self.mock_module.run_command.assert_called_once_with("grubby --default-kernel")
-        self.assertEqual(len(self.result["actions"]), 1)
-        self.assertTrue(self.result["actions"][0].startswith("grubby --set-default="))
-        self.reset_vars()
 
         self.mock_module.check_mode = True
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            SETTINGS[12],
-            str(KERNELS[1]["kernel"]["kernel_index"]),
-            INFO_SAME_ARGS,
+        bootloader_settings.apply_plan(
+            self.mock_module, self.result, bootloader_settings.export_plan(plan)
         )
         self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["actions"], [])
+        self.assertEqual(self.result["changed"], False)
+        self.assertEqual(self.result["actions"], commands)
         self.reset_vars()
 
-        self.mock_module.check_mode = True
-        self.mock_module.run_command.return_value = ("0", "2", "")
-        bootloader_settings.get_default_kernel(self.mock_module, "index")
-        self.mock_module.run_command.assert_called_once_with("grubby --default-index")
+        bootloader_settings.apply_plan(
+            self.mock_module, self.result, bootloader_settings.export_plan(plan)
+        )
+        self.assertEqual(
+            [call[0][0] for call in self.mock_module.run_command.call_args_list],
+            commands,
+        )
+        self.assertEqual(self.result["actions"], commands)
         self.reset_vars()
 
-        self.mock_module.check_mode = True
-        duplicate_console_setting = {
-            "kernel": "ALL",
-            "options": [{"name": "console", "value": "ttyS0"}],
-        }
-        info_without_console = """
+    def test_quoted_value_round_trip(self):
+        """Test that an arg with a quoted value read from grubby is not planned again"""
+        kernel_info = """
 index=0
 kernel="/boot/vmlinuz-test"
-args="ro rhgb quiet"
-title="Fedora Linux"
+args="ro a="x y""
 """
-        bootloader_settings.mod_boot_args(
-            self.mock_module,
-            self.result,
-            duplicate_console_setting,
-            "ALL",
-            info_without_console,
-        )
-        self.mock_module.run_command.assert_not_called()
+        self.assertEqual(kernel_facts(kernel_info)[0]["args"], 'ro a="x y"')
         self.assertEqual(
-            self.result["actions"],
-            ["grubby --update-kernel=ALL --args=console=ttyS0"],
+            plan_mod_boot_args(
+                {"kernel": "ALL", "options": [{"name": "a", "value": "x y"}]},
+                kernel_info,
+            ),
+            [],
         )
-        self.reset_vars()
 
     def test_apply_command_records_action(self):
         """Test that apply_command records commands but does not set changed"""
@@ -1046,32 +1236,78 @@ title="Fedora Linux"
         self.mock_module.run_command.assert_not_called()
         self.reset_vars()
 
-    def test_rm_boot_args_empty(self):
-        """Test that rm_boot_args does nothing when there are no args"""
+        # A failed write stops the run with the result so far
+        self.result["actions"].append("grubby --first")
+        self.mock_module.run_command.return_value = (1, "out", "err")
+        with self.assertRaises(SystemExit):
+            bootloader_settings.apply_command(
+                self.mock_module, self.result, "grubby --test"
+            )
+        self.mock_module.fail_json.assert_called_once_with(
+            msg="Command 'grubby --test' failed with rc 1",
+            rc=1,
+            stdout="out",
+            stderr="err",
+            changed=True,
+            actions=["grubby --first", "grubby --test"],
+        )
         self.reset_vars()
+
+    def test_replace_boot_args_empty(self):
+        """Test that previous: replaced only adds args when there are no args"""
         kernel_info_empty = """
 index=0
 kernel="/boot/vmlinuz-test"
 args=""
 title="Fedora Linux"
 """
-        bootloader_settings.rm_boot_args(
-            self.mock_module, self.result, kernel_info_empty, "0"
+        bootloader_facts = kernel_facts(kernel_info_empty)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.replace_boot_args(
+            plan, [{"previous": "replaced"}], bootloader_facts
+        )
+        self.assertEqual(plan["kernels"], [])
+        bootloader_settings.replace_boot_args(
+            plan, [{"previous": "replaced"}, {"name": "quiet"}], bootloader_facts
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            ["grubby --update-kernel=0 --args=quiet"],
+        )
+
+    def test_get_boot_args_delta_tokens(self):
+        """Test that args are compared as tokens, not as regular expressions"""
+        self.assertEqual(
+            bootloader_settings.get_boot_args_delta(
+                [
+                    {"name": "$tuned_params", "state": "absent"},
+                    {"name": "dyndbg", "value": "file x.c +p"},
+                    {"name": "ro"},
+                ],
+                'ro dyndbg="file x.c +p" $tuned_params',
+            ),
+            (["$tuned_params"], []),
+        )
+        self.assertEqual(
+            bootloader_settings.get_boot_args_delta(
+                [{"name": "r.", "state": "absent"}, {"name": "quiet"}],
+                "ro quiet=1",
+            ),
+            ([], ["quiet"]),
         )
-        self.mock_module.run_command.assert_not_called()
-        self.assertEqual(self.result["actions"], [])
-        self.reset_vars()
 
-    def test_get_replaced_args(self):
-        """Test get_replaced_args builds correct sorted token list"""
+    def test_get_replacement_args(self):
+        """Test get_replacement_args builds the token list in option order"""
         options = [
             {"previous": "replaced"},
             {"name": "quiet"},
             {"name": "console", "value": "tty0"},
             {"name": "debug", "state": "absent"},
         ]
-        result = bootloader_settings.get_replaced_args(options)
-        self.assertEqual(result, ["console=tty0", "quiet"])
+        result = bootloader_settings.get_replacement_args(options)
+        self.assertEqual(result, ["quiet", "console=tty0"])
 
         options_dup = [
             {"previous": "replaced"},
@@ -1079,11 +1315,11 @@ title="Fedora Linux"
             {"name": "console", "value": "ttyS0"},
             {"name": "quiet"},
         ]
-        result = bootloader_settings.get_replaced_args(options_dup)
+        result = bootloader_settings.get_replacement_args(options_dup)
         self.assertEqual(result, ["console=tty0", "console=ttyS0", "quiet"])
 
         options_empty = [{"previous": "replaced"}]
-        result = bootloader_settings.get_replaced_args(options_empty)
+        result = bootloader_settings.get_replacement_args(options_empty)
         self.assertEqual(result, [])
 
     def test_needs_replacement(self):
@@ -1101,7 +1337,9 @@ args="quiet console=tty0"
 title="Fedora Linux"
 """
         self.assertFalse(
-            bootloader_settings.needs_replacement(options, kernel_info_match)
+            bootloader_settings.needs_replacement(
+                options, kernel_facts(kernel_info_match)[0]["args"]
+            )
         )
 
         kernel_info_reordered = """
@@ -1111,7 +1349,9 @@ args="console=tty0 quiet"
 title="Fedora Linux"
 """
         self.assertFalse(
-            bootloader_settings.needs_replacement(options, kernel_info_reordered)
+            bootloader_settings.needs_replacement(
+                options, kernel_facts(kernel_info_reordered)[0]["args"]
+            )
         )
 
         kernel_info_extra = """
@@ -1121,7 +1361,9 @@ args="quiet console=tty0 extra"
 title="Fedora Linux"
 """
         self.assertTrue(
-            bootloader_settings.needs_replacement(options, kernel_info_extra)
+            bootloader_settings.needs_replacement(
+                options, kernel_facts(kernel_info_extra)[0]["args"]
+            )
         )
 
         kernel_info_missing = """
@@ -1131,7 +1373,9 @@ args="quiet"
 title="Fedora Linux"
 """
         self.assertTrue(
-            bootloader_settings.needs_replacement(options, kernel_info_missing)
+            bootloader_settings.needs_replacement(
+                options, kernel_facts(kernel_info_missing)[0]["args"]
+            )
         )
 
         kernel_info_empty = """
@@ -1141,7 +1385,9 @@ args=""
 title="Fedora Linux"
 """
         self.assertTrue(
-            bootloader_settings.needs_replacement(options, kernel_info_empty)
+            bootloader_settings.needs_replacement(
+                options, kernel_facts(kernel_info_empty)[0]["args"]
+            )
         )
 
         options_all_absent = [
@@ -1149,7 +1395,9 @@ title="Fedora Linux"
             {"name": "debug", "state": "absent"},
         ]
         self.assertFalse(
-            bootloader_settings.needs_replacement(options_all_absent, kernel_info_empty)
+            bootloader_settings.needs_replacement(
+                options_all_absent, kernel_facts(kernel_info_empty)[0]["args"]
+            )
         )
 
         options_with_absent = [
@@ -1165,6 +1413,726 @@ title="Fedora Linux"
 """
         self.assertTrue(
             bootloader_settings.needs_replacement(
-                options_with_absent, kernel_info_with_debug
+                options_with_absent, kernel_facts(kernel_info_with_debug)[0]["args"]
             )
         )
+
+    def test_get_boot_snapshot(self):
+        """Test that the boot model is read with a single grubby --info=ALL"""
+        self.reset_vars()
+        outputs = {
+            "grubby --info=ALL": (0, INFO_SAME_ARGS, ""),
+            "grubby --default-index": (0, "0\n", ""),
+        }
+        self.mock_module.run_command.side_effect = lambda cmd, **kwargs: outputs[cmd]
+        with patch.object(bootloader_settings, "get_bls_facts", return_value=None):
+            snapshot = bootloader_settings.get_boot_snapshot(self.mock_module)
+        self.assertEqual(snapshot, (kernel_facts(INFO_SAME_ARGS), True))
+        # Both reads run at the same time in any order
+        self.assertEqual(
+            sorted(call[0][0] for call in self.mock_module.run_command.call_args_list),
+            sorted(outputs),
+        )
+        self.mock_module.run_command.side_effect = None
+        self.reset_vars()
+
+    def test_get_boot_snapshot_bls(self):
+        """Test that plain BLS entries are read without running grubby"""
+        self.reset_vars()
+        bls_facts = kernel_facts(INFO_SAME_ARGS)
+        with patch.object(bootloader_settings, "get_bls_facts", return_value=bls_facts):
+            snapshot = bootloader_settings.get_boot_snapshot(self.mock_module)
+        self.assertEqual(snapshot, (bls_facts, False))
+        self.mock_module.run_command.assert_not_called()
+        self.reset_vars()
+
+    def test_update_args(self):
+        """Test that update_args follows grubby semantics"""
+        self.assertEqual(
+            bootloader_settings.update_args(
+                "ro quiet console=tty0 rhgb", ["quiet"], ["console=ttyS0"]
+            ),
+            "ro rhgb console=ttyS0",
+        )
+        self.assertEqual(
+            bootloader_settings.update_args("ro debug=1 quiet", ["debug"], []),
+            "ro quiet",
+        )
+        self.assertEqual(
+            bootloader_settings.update_args("ro debug=1 quiet", ["debug=2"], []),
+            "ro debug=1 quiet",
+        )
+        self.assertEqual(
+            bootloader_settings.update_args(
+                "ro console=tty0 quiet", [], ["console=tty0", "console=ttyS0"]
+            ),
+            "ro quiet console=tty0 console=ttyS0",
+        )
+        self.assertEqual(bootloader_settings.update_args("", [], ["quiet"]), "quiet")
+
+    def test_apply_plan_bls(self):
+        """Test that the bls backend writes changed entries and grubenv only"""
+        self.reset_vars()
+        tmpdir = tempfile.mkdtemp()
+        entries = {}
+        for fact in FACTS[:4]:
+            entries[fact["id"]] = os.path.join(tmpdir, fact["id"] + ".conf")
+            with open(entries[fact["id"]], "w") as entry_fd:
+                entry_fd.write(
+                    "title %s\nlinux %s\noptions root=%s %s\n"
+                    % (fact["title"], fact["kernel"], fact["root"], fact["args"])
+                )
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.mod_boot_args(
+            plan,
+            {
+                "kernel": "ALL",
+                "options": [{"name": "debug"}, {"name": "quiet", "state": "absent"}],
+            },
+            bootloader_facts[:2],
+        )
+        bootloader_settings.mod_default_kernel(
+            plan,
+            {"kernel": {"index": 1}, "default": True},
+            [bootloader_facts[1]],
+            bootloader_facts,
+        )
+        bootloader_settings.rm_kernel(plan, [bootloader_facts[2]], bootloader_facts)
+        grubenv = os.path.join(tmpdir, "grubenv")
+        block = b"# GRUB Environment Block\nsaved_entry=%s\n" % FACTS[2]["id"].encode()
+        with open(grubenv, "wb") as grubenv_fd:
+            grubenv_fd.write(block + b"#" * (1024 - len(block)))
+        self.mock_module.params = {"write_backend": "bls"}
+        try:
+            with patch.multiple(
+                bootloader_settings,
+                BLS_ENTRIES_DIR=tmpdir,
+                DEFAULT_GRUB=os.path.join(tmpdir, "grub"),
+                GRUBENV=grubenv,
+            ):
+                self.mock_module.check_mode = True
+                bootloader_settings.apply_plan(
+                    self.mock_module, self.result, bootloader_settings.export_plan(plan)
+                )
+                actions = [
+                    "write "
+                    + entries[FACTS[0]["id"]]
+                    + " --remove-args=quiet --args=debug",
+                    "write "
+                    + entries[FACTS[1]["id"]]
+                    + " --remove-args=quiet --args=debug",
+                    "write " + grubenv + " saved_entry=" + FACTS[1]["id"],
+                    "grubby --remove-kernel=2",
+                ]
+                self.assertEqual(self.result["actions"], actions)
+                with open(entries[FACTS[0]["id"]]) as entry_fd:
+                    self.assertNotIn("debug", entry_fd.read())
+                with open(grubenv, "rb") as grubenv_fd:
+                    self.assertIn(FACTS[2]["id"].encode(), grubenv_fd.read())
+                self.reset_vars()
+
+                bootloader_settings.apply_plan(
+                    self.mock_module, self.result, bootloader_settings.export_plan(plan)
+                )
+                self.assertEqual(self.result["actions"], actions)
+                self.mock_module.run_command.assert_called_once_with(
+                    "grubby --remove-kernel=2"
+                )
+                with open(entries[FACTS[1]["id"]]) as entry_fd:
+                    self.assertEqual(
+                        entry_fd.read().splitlines()[-1],
+                        "options root=%s ro rootflags=subvol=root "
+                        "rd.luks.uuid=luks-9da1fdf5-14ac-49fd-a388-8b1ee48f3df1 "
+                        "rhgb $tuned_params debug" % FACTS[1]["root"],
+                    )
+                self.assertEqual(
+                    bootloader_settings.read_grubenv(grubenv)["saved_entry"],
+                    FACTS[1]["id"],
+                )
+                self.assertEqual(os.path.getsize(grubenv), 1024)
+                self.reset_vars()
+
+                # Kernels without BLS entries are updated with grubby
+                os.unlink(entries[FACTS[0]["id"]])
+                bootloader_settings.apply_plan(
+                    self.mock_module, self.result, bootloader_settings.export_plan(plan)
+                )
+                self.assertEqual(
+                    self.result["actions"],
+                    ["write " + grubenv + " saved_entry=" + FACTS[1]["id"]]
+                    + bootloader_settings.get_plan_commands(
+                        bootloader_settings.export_plan(plan), True, False
+                    ),
+                )
+                self.reset_vars()
+
+                # The default kernel is set with grubby without a valid grubenv
+                with open(grubenv, "wb") as grubenv_fd:
+                    grubenv_fd.write(b"saved_entry=0\n")
+                bootloader_settings.apply_plan(
+                    self.mock_module, self.result, bootloader_settings.export_plan(plan)
+                )
+                self.assertEqual(
+                    self.result["actions"],
+                    bootloader_settings.get_plan_commands(
+                        bootloader_settings.export_plan(plan)
+                    ),
+                )
+        finally:
+            shutil.rmtree(tmpdir)
+        self.reset_vars()
+
+    def test_check_mode_end_state(self):
+        """Test that check mode predicts the end state of settings that build on each other"""
+        self.reset_vars()
+        self.mock_module.check_mode = True
+        self.mock_module.params = {
+            "write_backend": "grubby",
+            "bootloader_settings": [
+                dict(SETTINGS[8], options=[{"name": "quiet"}]),
+                # Sees the kernel created by the previous setting
+                {
+                    "kernel": {"path": "/boot/vmlinuz-6"},
+                    "options": [{"name": "debug"}],
+                    "default": True,
+                },
+                {"kernel": {"index": 3}, "state": "absent"},
+                {"kernel": "ALL", "options": [{"name": "rhgb", "state": "absent"}]},
+            ],
+        }
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.process_bootloader_settings(
+            self.mock_module, bootloader_facts
+        )
+        bootloader_settings.apply_plan(
+            self.mock_module, self.result, bootloader_settings.export_plan(plan)
+        )
+        self.mock_module.run_command.assert_not_called()
+        self.assertEqual(
+            self.result["actions"],
+            [
+                # Kernel 3 is removed and the new kernel is created without rhgb
+                "grubby --update-kernel=ALL --remove-args=rhgb",
+                "grubby --remove-kernel=3",
+                "grubby --initrd=/boot/initramfs-6.6.img --add-kernel=/boot/vmlinuz-6 "
+                + "--title='Fedora Linux' --args='quiet debug'",
+                "grubby --set-default=/boot/vmlinuz-6",
+            ],
+        )
+        self.assertEqual(
+            [
+                (fact.get("index"), fact["kernel"], fact.get("args"), fact["default"])
+                for fact in bootloader_settings.get_end_state(bootloader_facts)
+            ],
+            [
+                ("0", FACTS[0]["kernel"], FACTS[0]["args"].replace(" rhgb", ""), False),
+                ("1", FACTS[1]["kernel"], FACTS[1]["args"].replace(" rhgb", ""), False),
+                ("2", FACTS[2]["kernel"], FACTS[2]["args"].replace(" rhgb", ""), False),
+                ("3", FACTS[4]["kernel"], None, False),
+                (None, "/boot/vmlinuz-6", "quiet debug", True),
+            ],
+        )
+        self.reset_vars()
+
+    def test_get_diff(self):
+        """Test that the diff lists changed, removed and created kernels only"""
+        self.reset_vars()
+        self.mock_module.params = {
+            "bootloader_settings": [
+                {"kernel": {"index": 0}, "options": [{"name": "debug"}]},
+                {"kernel": {"index": 1}, "default": True},
+                {"kernel": {"index": 3}, "state": "absent"},
+                dict(SETTINGS[8], options=[{"name": "quiet"}]),
+            ]
+        }
+        bootloader_facts = copy.deepcopy(FACTS)
+        snapshot = [(fact, dict(fact)) for fact in bootloader_facts]
+        bootloader_settings.process_bootloader_settings(
+            self.mock_module, bootloader_facts
+        )
+        self.assertEqual(
+            bootloader_settings.get_diff(snapshot, bootloader_facts),
+            {
+                "before": {
+                    FACTS[0]["id"]: {
+                        "args": FACTS[0]["args"],
+                        "default": False,
+                        "title": FACTS[0]["title"],
+                    },
+                    FACTS[1]["id"]: {
+                        "args": FACTS[1]["args"],
+                        "default": False,
+                        "title": FACTS[1]["title"],
+                    },
+                    FACTS[2]["id"]: {
+                        "args": FACTS[2]["args"],
+                        "default": True,
+                        "title": FACTS[2]["title"],
+                    },
+                    FACTS[3]["id"]: {
+                        "args": FACTS[3]["args"],
+                        "default": False,
+                        "title": FACTS[3]["title"],
+                    },
+                },
+                "after": {
+                    FACTS[0]["id"]: {
+                        "args": FACTS[0]["args"] + " debug",
+                        "default": False,
+                        "title": FACTS[0]["title"],
+                    },
+                    FACTS[1]["id"]: {
+                        "args": FACTS[1]["args"],
+                        "default": True,
+                        "title": FACTS[1]["title"],
+                    },
+                    FACTS[2]["id"]: {
+                        "args": FACTS[2]["args"],
+                        "default": False,
+                        "title": FACTS[2]["title"],
+                    },
+                    "/boot/vmlinuz-6": {
+                        "args": "quiet",
+                        "default": False,
+                        "title": "Fedora Linux",
+                    },
+                },
+            },
+        )
+        self.mock_module.run_command.assert_not_called()
+        self.reset_vars()
+
+    def test_lock_boot_config(self):
+        """Test that the module fails when another process holds the lock"""
+        self.reset_vars()
+        tmpdir = tempfile.mkdtemp()
+        lock_file = os.path.join(tmpdir, "bootloader.lock")
+        self.mock_module.params = {"lock_file": lock_file, "lock_timeout": 0}
+        try:
+            lock_fd = bootloader_settings.lock_boot_config(self.mock_module)
+            with self.assertRaises(SystemExit):
+                bootloader_settings.lock_boot_config(self.mock_module)
+            self.mock_module.fail_json.assert_called_once_with(
+                msg="Another process held the lock %s for more than 0 seconds"
+                % lock_file
+            )
+            bootloader_settings.release_lock(lock_fd)
+            self.reset_vars()
+
+            # Check mode does not create the lock file or its directory
+            lock_file = os.path.join(tmpdir, "run", "bootloader.lock")
+            self.mock_module.params["lock_file"] = lock_file
+            self.mock_module.check_mode = True
+            self.assertIsNone(bootloader_settings.lock_boot_config(self.mock_module))
+            self.assertFalse(os.path.exists(os.path.dirname(lock_file)))
+        finally:
+            shutil.rmtree(tmpdir)
+        self.reset_vars()
+
+    def test_state_file(self):
+        """Test that a run is skipped when settings and boot config are the same"""
+        self.reset_vars()
+        tmpdir = tempfile.mkdtemp()
+        state_file = os.path.join(tmpdir, "state.json")
+        self.mock_module.params = {
+            "bootloader_settings": SETTINGS[:1],
+            "plan_only": False,
+            "plan_file": None,
+            "state_file": state_file,
+        }
+        fingerprint = {"files": {"/boot/grub2/grubenv": [1, 2, 3]}}
+        settings_hash = bootloader_settings.get_data_hash(SETTINGS[:1])
+        try:
+            with patch.object(
+                bootloader_settings, "get_boot_fingerprint", return_value=fingerprint
+            ):
+                self.assertEqual(
+                    bootloader_settings.get_state_file(self.mock_module), state_file
+                )
+                self.assertFalse(
+                    bootloader_settings.is_state_unchanged(state_file, settings_hash)
+                )
+                bootloader_settings.write_state(
+                    self.mock_module, state_file, settings_hash
+                )
+                self.assertTrue(
+                    bootloader_settings.is_state_unchanged(state_file, settings_hash)
+                )
+                self.assertFalse(
+                    bootloader_settings.is_state_unchanged(
+                        state_file, bootloader_settings.get_data_hash(SETTINGS[:2])
+                    )
+                )
+                fingerprint["files"]["/boot/grub2/grubenv"] = [4, 2, 3]
+                self.assertFalse(
+                    bootloader_settings.is_state_unchanged(state_file, settings_hash)
+                )
+        finally:
+            shutil.rmtree(tmpdir)
+        self.mock_module.params["plan_only"] = True
+        self.assertIsNone(bootloader_settings.get_state_file(self.mock_module))
+        self.mock_module.run_command.assert_not_called()
+        self.reset_vars()
+
+    def test_export_plan(self):
+        """Test that the plan lists the args of each changed kernel"""
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        setting = {"kernel": "ALL", "options": [{"name": "quiet", "state": "absent"}]}
+        bootloader_settings.mod_boot_args(plan, setting, bootloader_facts[:1])
+        bootloader_settings.mod_boot_args(
+            plan,
+            {"kernel": {"index": 1}, "options": [{"name": "debug"}]},
+            [bootloader_facts[1]],
+        )
+        bootloader_settings.mod_boot_args(
+            plan,
+            {"kernel": {"index": 1}, "options": [{"name": "debug", "state": "absent"}]},
+            [bootloader_facts[1]],
+        )
+        bootloader_settings.rm_kernel(plan, [bootloader_facts[3]], bootloader_facts)
+        bootloader_settings.add_kernel(
+            plan,
+            dict(SETTINGS[8], options=[{"name": "debug"}], default=True),
+            bootloader_settings.get_create_kernel(SETTINGS[8]["kernel"]),
+            bootloader_facts,
+        )
+        self.assertEqual(
+            bootloader_settings.export_plan(plan),
+            {
+                "version": 2,
+                "all": ["0", "1", "2", "3"],
+                "kernels": [
+                    {
+                        "action": "modify",
+                        "index": "0",
+                        "target": "0",
+                        "kernel": FACTS[0]["kernel"],
+                        "id": FACTS[0]["id"],
+                        "title": FACTS[0]["title"],
+                        "current_args": FACTS[0]["args"],
+                        "desired_args": FACTS[0]["args"][: -len(" quiet")],
+                        "remove_args": ["quiet"],
+                        "add_args": [],
+                    },
+                    # Kernel 1 has its args back, it is not changed
+                    {
+                        "action": "remove",
+                        "index": "3",
+                        "target": "3",
+                        "kernel": FACTS[3]["kernel"],
+                        "id": FACTS[3]["id"],
+                        "title": FACTS[3]["title"],
+                        "current_args": FACTS[3]["args"],
+                    },
+                    {
+                        "action": "create",
+                        "kernel": "/boot/vmlinuz-6",
+                        "title": "Fedora Linux",
+                        "initrd": "/boot/initramfs-6.6.img",
+                        "args": "debug",
+                        "copy_default": False,
+                        "make_default": True,
+                        "set_default_before": None,
+                        "desired_args": "debug",
+                        "remove_args": [],
+                        "add_args": [],
+                    },
+                ],
+                # The created kernel is made the default with --make-default
+                "default": None,
+            },
+        )
+
+    def test_copy_default_after_set_default(self):
+        """Test that the default kernel is set before a kernel copies its args"""
+        self.reset_vars()
+        self.mock_module.check_mode = True
+        create_setting = {
+            "kernel": {
+                "path": "/boot/vmlinuz-9",
+                "title": "K9",
+                "initrd": "/boot/initramfs-9.img",
+            },
+            "options": [{"name": "a"}, {"copy_default": True}],
+        }
+        self.mock_module.params = {
+            "write_backend": "grubby",
+            "bootloader_settings": [
+                {"kernel": {"path": FACTS[0]["kernel"]}, "default": True},
+                create_setting,
+            ],
+        }
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.export_plan(
+            bootloader_settings.process_bootloader_settings(
+                self.mock_module, bootloader_facts
+            )
+        )
+        self.assertEqual(bootloader_facts[-1]["args"], FACTS[0]["args"] + " a")
+        create_cmd = (
+            "grubby --initrd=/boot/initramfs-9.img --add-kernel=/boot/vmlinuz-9 "
+            + "--title=K9 --args=a --copy-default"
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(plan),
+            ["grubby --set-default=" + FACTS[0]["kernel"], create_cmd],
+        )
+
+        # A later default kernel is still set at the end
+        self.mock_module.params["bootloader_settings"].append(
+            {"kernel": {"path": FACTS[1]["kernel"]}, "default": True}
+        )
+        plan = bootloader_settings.export_plan(
+            bootloader_settings.process_bootloader_settings(
+                self.mock_module, copy.deepcopy(FACTS)
+            )
+        )
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(plan),
+            [
+                "grubby --set-default=" + FACTS[0]["kernel"],
+                create_cmd,
+                "grubby --set-default=" + FACTS[1]["kernel"],
+            ],
+        )
+        self.assertIsNone(bootloader_settings.get_saved_entry_block(plan))
+        self.reset_vars()
+
+    def test_bls_kernel_targets(self):
+        """Test that grubby writes do not use the indexes of BLS entries"""
+        self.reset_vars()
+        bootloader_facts = copy.deepcopy(FACTS[:4])
+        # Kernel 1 and 3 share a path, so grubby has to tell their index
+        bootloader_facts[3]["kernel"] = FACTS[1]["kernel"]
+        plan = bootloader_settings.new_plan(bootloader_facts, grubby_indexes=False)
+        bootloader_settings.mod_boot_args(
+            plan, {"options": [{"name": "debug"}]}, bootloader_facts[:1]
+        )
+        bootloader_settings.mod_boot_args(
+            plan, {"options": [{"name": "nomodeset"}]}, bootloader_facts[1:2]
+        )
+        bootloader_settings.rm_kernel(
+            plan, [bootloader_facts[2], bootloader_facts[3]], bootloader_facts
+        )
+        plan = bootloader_settings.export_plan(plan)
+        self.assertEqual(
+            [kernel["target"] for kernel in plan["kernels"]],
+            [FACTS[0]["kernel"], None, FACTS[2]["kernel"], None],
+        )
+
+        # grubby orders the kernels with the same path the other way round
+        grubby_facts = copy.deepcopy(bootloader_facts[:2]) + [
+            dict(FACTS[1], index="1", id=FACTS[3]["id"]),
+            dict(FACTS[2], index="2"),
+            dict(FACTS[1], index="3"),
+        ]
+        grubby_facts[1] = dict(FACTS[0], index="0")
+        info = "".join(
+            "index=%s\nkernel=%s\nid=%s\n" % (fact["index"], fact["kernel"], fact["id"])
+            for fact in grubby_facts[1:]
+        )
+        self.mock_module.run_command.return_value = (0, info, "")
+        bootloader_settings.resolve_kernel_targets(self.mock_module, plan)
+        self.mock_module.run_command.assert_called_once_with("grubby --info=ALL")
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(plan),
+            [
+                "grubby --update-kernel=" + FACTS[0]["kernel"] + " --args=debug",
+                "grubby --update-kernel=3 --args=nomodeset",
+                "grubby --remove-kernel=1",
+                "grubby --remove-kernel=" + FACTS[2]["kernel"],
+            ],
+        )
+        self.reset_vars()
+
+    def test_verify_plan(self):
+        """Test that a plan from a file follows kernels to their current index"""
+        self.reset_vars()
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.mod_boot_args(
+            plan, {"options": [{"name": "debug"}]}, bootloader_facts[1:2]
+        )
+        bootloader_settings.rm_kernel(plan, bootloader_facts[3:4], bootloader_facts)
+        plan = bootloader_settings.export_plan(plan)
+
+        # A kernel installed after computing the plan shifts the indexes
+        new_kernel = dict(FACTS[0], kernel="/boot/vmlinuz-6.6.2", id="new")
+        current_facts = [
+            dict(fact, index=str(index))
+            for index, fact in enumerate([new_kernel] + copy.deepcopy(FACTS))
+        ]
+        with patch.object(
+            bootloader_settings,
+            "get_boot_snapshot",
+            return_value=(current_facts, True),
+        ):
+            bootloader_settings.verify_plan(self.mock_module, plan)
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(plan),
+            [
+                "grubby --update-kernel=2 --args=debug",
+                "grubby --remove-kernel=4",
+            ],
+        )
+
+        current_facts[2]["args"] += " quiet"
+        with patch.object(
+            bootloader_settings,
+            "get_boot_snapshot",
+            return_value=(current_facts, True),
+        ):
+            with self.assertRaises(SystemExit):
+                bootloader_settings.verify_plan(self.mock_module, plan)
+        self.mock_module.fail_json.assert_called_once_with(
+            msg="Kernel %s changed since the plan was computed" % FACTS[1]["id"]
+        )
+        self.reset_vars()
+
+    def test_verify_plan_create_default(self):
+        """Test that created kernels must be new and the default kernel must exist"""
+        self.reset_vars()
+        created = {"action": "create", "kernel": "/boot/vmlinuz-6.6.2"}
+        plan = {
+            "all": [],
+            "kernels": [created],
+            "default": {"kernel": created["kernel"]},
+        }
+        with patch.object(
+            bootloader_settings,
+            "get_boot_snapshot",
+            return_value=(copy.deepcopy(FACTS), True),
+        ):
+            bootloader_settings.verify_plan(self.mock_module, plan)
+            self.mock_module.fail_json.assert_not_called()
+
+            created["kernel"] = FACTS[1]["kernel"]
+            with self.assertRaises(SystemExit):
+                bootloader_settings.verify_plan(self.mock_module, plan)
+            self.mock_module.fail_json.assert_called_once_with(
+                msg="Kernel %s that the plan creates exists already"
+                % FACTS[1]["kernel"]
+            )
+            self.reset_vars()
+
+            plan["kernels"] = []
+            plan["default"] = {"kernel": FACTS[1]["kernel"], "id": "removed"}
+            with self.assertRaises(SystemExit):
+                bootloader_settings.verify_plan(self.mock_module, plan)
+            self.mock_module.fail_json.assert_called_once_with(
+                msg="Default kernel removed of the plan does not exist"
+            )
+        self.reset_vars()
+
+    def test_write_read_plan(self):
+        """Test that an exported plan is applied without reading grubby"""
+        self.reset_vars()
+        bootloader_facts = copy.deepcopy(FACTS)
+        plan = bootloader_settings.new_plan(bootloader_facts)
+        bootloader_settings.mod_boot_args(
+            plan,
+            {"kernel": "ALL", "options": [{"name": "debug"}]},
+            bootloader_facts[:4],
+        )
+        bootloader_settings.mod_default_kernel(
+            plan,
+            {"kernel": {"index": 0}, "default": True},
+            bootloader_facts[:1],
+            bootloader_facts,
+        )
+        exported = bootloader_settings.export_plan(plan)
+        tmpdir = tempfile.mkdtemp()
+        plan_file = os.path.join(tmpdir, "plan.json")
+        try:
+            bootloader_settings.write_plan(self.mock_module, plan_file, exported)
+            self.assertEqual(os.stat(plan_file).st_mode & 0o777, 0o600)
+            self.assertEqual(
+                bootloader_settings.read_plan(self.mock_module, plan_file), exported
+            )
+            self.mock_module.params = {"write_backend": "grubby"}
+            bootloader_settings.apply_plan(
+                self.mock_module,
+                self.result,
+                bootloader_settings.read_plan(self.mock_module, plan_file),
+            )
+            self.assertEqual(
+                [call[0][0] for call in self.mock_module.run_command.call_args_list],
+                [
+                    "grubby --update-kernel=ALL --args=debug",
+                    "grubby --set-default=" + FACTS[0]["kernel"],
+                ],
+            )
+            self.reset_vars()
+
+            with open(plan_file, "w") as plan_fd:
+                plan_fd.write('{"version": 0}')
+            with self.assertRaises(SystemExit):
+                bootloader_settings.read_plan(self.mock_module, plan_file)
+            self.mock_module.fail_json.assert_called_once_with(
+                msg="Plan %s is not a version 2 bootloader plan" % plan_file
+            )
+        finally:
+            shutil.rmtree(tmpdir)
+        self.reset_vars()
+
+    def test_process_bootloader_settings(self):
+        """Test that settings are planned against the in-memory boot model"""
+        self.reset_vars()
+        bootloader_facts = copy.deepcopy(FACTS)
+        self.mock_module.params = {
+            "bootloader_settings": [
+                {"kernel": {"index": 1}, "options": [{"name": "debug"}]},
+                # Sees debug added by the previous setting
+                {"kernel": {"index": 1}, "options": [{"name": "debug"}]},
+                {"kernel": {"index": 0}, "state": "absent"},
+                # Index 0 is now the kernel with snapshot index 1
+                {
+                    "kernel": {"index": 0},
+                    "options": [
+                        {"previous": "replaced"},
+                        {"name": "ro"},
+                        {"name": "debug"},
+                    ],
+                },
+                {"kernel": {"index": 0}, "default": True},
+            ]
+        }
+        plan = bootloader_settings.process_bootloader_settings(
+            self.mock_module, bootloader_facts
+        )
+        self.mock_module.run_command.assert_not_called()
+        self.assertEqual(
+            bootloader_settings.get_plan_commands(
+                bootloader_settings.export_plan(plan)
+            ),
+            [
+                "grubby --update-kernel=1 --remove-args='rootflags=subvol=root "
+                + "rd.luks.uuid=luks-9da1fdf5-14ac-49fd-a388-8b1ee48f3df1 rhgb quiet "
+                + "$tuned_params' --args=debug",
+                "grubby --remove-kernel=0",
+                "grubby --set-default=/boot/vmlinuz-6.5.10-100.fc37.x86_64",
+            ],
+        )
+        self.assertEqual(bootloader_facts[0]["args"], "ro debug")
+        self.assertEqual(
+            [fact["index"] for fact in bootloader_facts if fact["default"]], ["0"]
+        )
+        self.reset_vars()
+
+        # The last entry moved to index 3, index 4 does not exist anymore
+        self.mock_module.params = {
+            "bootloader_settings": [
+                {"kernel": {"index": 0}, "state": "absent"},
+                {"kernel": {"index": 4}, "options": [{"name": "quiet"}]},
+            ]
+        }
+        with self.assertRaises(SystemExit):
+            bootloader_settings.process_bootloader_settings(
+                self.mock_module, copy.deepcopy(FACTS)
+            )
+        self.mock_module.fail_json.assert_called_once_with(
+            msg="No kernel matches {'index': 4}"
+        )
+        self.reset_vars()
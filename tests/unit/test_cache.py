@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.cache module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ansible.module_utils.bootloader_lsr import bls, cache
+
+
+class FactsCache(unittest.TestCase):
+    """test caching facts between runs"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.entries_dir = os.path.join(self.tmpdir, "entries")
+        self.grubenv = os.path.join(self.tmpdir, "grubenv")
+        self.default_grub = os.path.join(self.tmpdir, "grub")
+        os.mkdir(self.entries_dir)
+        for version in ("6.5.7", "6.5.12"):
+            entry_path = os.path.join(self.entries_dir, "m-%s.conf" % version)
+            with open(entry_path, "w") as file_fd:
+                file_fd.write(
+                    "title %s\nlinux /vmlinuz-%s\noptions ro quiet\n"
+                    % (version, version)
+                )
+        with open(self.grubenv, "w") as file_fd:
+            file_fd.write("saved_entry=m-6.5.7\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_fingerprint(self):
+        return cache.get_boot_fingerprint(
+            self.entries_dir,
+            self.grubenv,
+            self.default_grub,
+            self.tmpdir,
+            (os.path.join(self.tmpdir, "grub.cfg"),),
+        )
+
+    def test_get_boot_fingerprint(self):
+        fingerprint = self.get_fingerprint()
+        self.assertEqual(
+            sorted(fingerprint["entries"]), ["m-6.5.12.conf", "m-6.5.7.conf"]
+        )
+        self.assertIsNone(fingerprint["files"][self.default_grub])
+        self.assertEqual(fingerprint, self.get_fingerprint())
+
+        entry_path = os.path.join(self.entries_dir, "m-6.5.7.conf")
+        with open(entry_path, "w") as file_fd:
+            file_fd.write("title 6.5.7\nlinux /vmlinuz-6.5.7\noptions ro\n")
+        self.assertNotEqual(fingerprint, self.get_fingerprint())
+        fingerprint = self.get_fingerprint()
+        with open(self.grubenv, "w") as file_fd:
+            file_fd.write("saved_entry=m-6.5.12\n")
+        self.assertNotEqual(fingerprint, self.get_fingerprint())
+        fingerprint = self.get_fingerprint()
+        os.unlink(entry_path)
+        self.assertNotEqual(fingerprint, self.get_fingerprint())
+
+    def test_get_data_hash(self):
+        self.assertEqual(
+            cache.get_data_hash([{"kernel": "ALL", "options": [{"name": "quiet"}]}]),
+            cache.get_data_hash([{"options": [{"name": "quiet"}], "kernel": "ALL"}]),
+        )
+        self.assertNotEqual(
+            cache.get_data_hash([{"kernel": "ALL"}]),
+            cache.get_data_hash([{"kernel": "DEFAULT"}]),
+        )
+
+    def test_read_write_cache(self):
+        cache_file = os.path.join(self.tmpdir, "cache", "facts.json")
+        self.assertEqual(cache.read_cache(cache_file), {})
+        fingerprint = self.get_fingerprint()
+        cache.write_cache(cache_file, {"fingerprint": fingerprint, "facts": []})
+        self.assertEqual(
+            cache.read_cache(cache_file),
+            {"version": cache.CACHE_VERSION, "fingerprint": fingerprint, "facts": []},
+        )
+        self.assertEqual(os.stat(cache_file).st_mode & 0o777, 0o600)
+        with open(cache_file, "w") as file_fd:
+            file_fd.write('{"version": 0}')
+        self.assertEqual(cache.read_cache(cache_file), {})
+        with open(cache_file, "w") as file_fd:
+            file_fd.write("not json")
+        self.assertEqual(cache.read_cache(cache_file), {})
+
+    def test_read_entries_cache(self):
+        entry_cache = {}
+        entries = bls.read_entries(self.entries_dir, entry_cache)
+        self.assertEqual([entry["id"] for entry in entries], ["m-6.5.12", "m-6.5.7"])
+        self.assertEqual(sorted(entry_cache), ["m-6.5.12", "m-6.5.7"])
+
+        # Unchanged entries are taken from the cache, changed ones are read
+        entry_cache["m-6.5.12"]["entry"]["options"] = "cached"
+        entry_cache["m-6.5.7"]["entry"]["options"] = "cached"
+        with open(os.path.join(self.entries_dir, "m-6.5.7.conf"), "w") as file_fd:
+            file_fd.write("title 6.5.7\nlinux /vmlinuz-6.5.7\noptions ro debug\n")
+        entries = bls.read_entries(self.entries_dir, entry_cache)
+        self.assertEqual(
+            [entry["options"] for entry in entries], ["cached", "ro debug"]
+        )
+        os.unlink(os.path.join(self.entries_dir, "m-6.5.12.conf"))
+        bls.read_entries(self.entries_dir, entry_cache)
+        self.assertEqual(sorted(entry_cache), ["m-6.5.7"])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.compact module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import copy
+import unittest
+
+from ansible.module_utils.bootloader_lsr import compact
+
+FACTS = [
+    {"args": "ro quiet", "index": "0", "root": "UUID=1"},
+    {"args": "ro", "index": "1", "root": "UUID=1"},
+    {"args": "ro quiet", "index": "2", "root": "UUID=1"},
+    {"index": "3"},
+]
+
+
+class Compact(unittest.TestCase):
+    """test storing repeated values of kernel facts once"""
+
+    def test_compact_facts(self):
+        facts = copy.deepcopy(FACTS)
+        compacted, tables = compact.compact_facts(facts)
+        self.assertEqual(facts, FACTS)
+        self.assertEqual(tables, {"args": ["ro quiet", "ro"], "root": ["UUID=1"]})
+        self.assertEqual(
+            compacted,
+            [
+                {"args_ref": 0, "index": "0", "root_ref": 0},
+                {"args_ref": 1, "index": "1", "root_ref": 0},
+                {"args_ref": 0, "index": "2", "root_ref": 0},
+                {"index": "3"},
+            ],
+        )
+        self.assertEqual(compact.expand_facts(compacted, tables), FACTS)
+
+    def test_compact_args_parsed(self):
+        facts = [
+            {"args_parsed": {"options": [{"name": "ro"}], "values": {"ro": [None]}}},
+            {"args_parsed": {"values": {"ro": [None]}, "options": [{"name": "ro"}]}},
+        ]
+        compacted, tables = compact.compact_facts(facts)
+        self.assertEqual(compacted, [{"args_parsed_ref": 0}, {"args_parsed_ref": 0}])
+        self.assertEqual(tables, {"args_parsed": [facts[0]["args_parsed"]]})
+        self.assertEqual(compact.expand_facts(compacted, tables), facts)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.facts_filter module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import unittest
+
+from ansible.module_utils.bootloader_lsr import facts_filter
+
+FACTS = [
+    {
+        "args": "ro quiet",
+        "default": False,
+        "id": "m-6.5.12",
+        "index": "0",
+        "kernel": "/boot/vmlinuz-6.5.12",
+        "title": "Fedora Linux (6.5.12)",
+    },
+    {
+        "args": "ro",
+        "default": True,
+        "id": "m-6.5.7",
+        "index": "1",
+        "kernel": "/boot/vmlinuz-6.5.7",
+        "title": "Fedora Linux (6.5.7)",
+    },
+    {
+        "args": "ro rescue",
+        "default": False,
+        "id": "m-0-rescue",
+        "index": "2",
+        "kernel": "/boot/vmlinuz-0-rescue",
+        "title": "Fedora Linux (0-rescue)",
+    },
+]
+
+
+class FactsFilter(unittest.TestCase):
+    """test selecting kernels and keys of kernel facts"""
+
+    def get_indexes(self, kernels):
+        return [
+            fact["index"] for fact in facts_filter.filter_facts(FACTS, kernels=kernels)
+        ]
+
+    def test_match_kernel(self):
+        self.assertEqual(self.get_indexes(None), ["0", "1", "2"])
+        self.assertEqual(self.get_indexes([]), [])
+        self.assertEqual(self.get_indexes(["DEFAULT"]), ["1"])
+        self.assertEqual(self.get_indexes(["2", "DEFAULT"]), ["1", "2"])
+        self.assertEqual(self.get_indexes(["/boot/vmlinuz-6.5.*"]), ["0", "1"])
+        self.assertEqual(self.get_indexes(["*(0-rescue)"]), ["2"])
+        self.assertEqual(self.get_indexes(["/boot/vmlinuz-7*"]), [])
+
+    def test_select_fields(self):
+        self.assertEqual(
+            facts_filter.filter_facts(FACTS, ["DEFAULT"], ["id", "root", "default"]),
+            [{"id": "m-6.5.7", "default": True}],
+        )
+        self.assertIs(facts_filter.select_fields(FACTS[0], None), FACTS[0])
+        self.assertTrue(facts_filter.needs_args(None))
+        self.assertTrue(facts_filter.needs_args(["id", "root"]))
+        self.assertFalse(facts_filter.needs_args(["id", "title"]))
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.generation module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import copy
+import unittest
+
+from ansible.module_utils.bootloader_lsr import generation
+
+FACTS = [
+    {"args": "ro quiet", "default": False, "id": "m-6.5.12", "index": "0"},
+    {"args": "ro", "default": True, "id": "m-6.5.7", "index": "1"},
+    {"args": "ro rescue", "default": False, "id": "m-0-rescue", "index": "2"},
+]
+
+
+class Generation(unittest.TestCase):
+    """test generation tokens of kernel facts"""
+
+    def test_get_facts_since(self):
+        since = generation.get_generation(FACTS)
+        self.assertEqual(generation.get_generation(copy.deepcopy(FACTS)), since)
+        self.assertEqual(generation.get_facts_since(FACTS, since), ([], []))
+
+        facts = copy.deepcopy(FACTS[:2])
+        facts[0]["args"] = "ro debug"
+        facts.append({"args": "ro", "default": False, "id": "m-6.6.1", "index": "2"})
+        self.assertNotEqual(generation.get_generation(facts), since)
+        self.assertEqual(
+            generation.get_facts_since(facts, since),
+            ([facts[0], facts[2]], ["m-0-rescue"]),
+        )
+
+    def test_read_generation(self):
+        for token in ("", "1", "1.not base64!", "2." + "e30=", "1.W10="):
+            self.assertIsNone(generation.read_generation(token))
+            self.assertIsNone(generation.get_facts_since(FACTS, token))
+        self.assertEqual(generation.read_generation("1.e30="), {})
+
+    def test_get_fact_keys(self):
+        facts = [
+            {"kernel": "/boot/vmlinuz"},
+            {"kernel": "/boot/vmlinuz"},
+            {"index": "2", "kernel": "/boot/vmlinuz"},
+        ]
+        self.assertEqual(
+            generation.get_fact_keys(facts), ["/boot/vmlinuz", "/boot/vmlinuz#2", "2"]
+        )
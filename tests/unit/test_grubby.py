@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.grubby module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import unittest
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+from ansible.module_utils.bootloader_lsr import grubby
+
+INFO = """Warning: not a grub2 system
+index=0
+kernel="/boot/vmlinuz-6.5.12"
+args="ro quiet"
+
+title="Fedora Linux (6.5.12)"
+extra="1"
+index=1
+non linux entry
+"""
+
+
+class GrubbyParser(unittest.TestCase):
+    """test parsing grubby --info output"""
+
+    def test_get_facts(self):
+        self.assertEqual(
+            grubby.get_facts(INFO, "1\n"),
+            [
+                {
+                    "index": "0",
+                    "kernel": "/boot/vmlinuz-6.5.12",
+                    "args": "ro quiet",
+                    "title": "Fedora Linux (6.5.12)",
+                    "extra": "1",
+                    "default": False,
+                },
+                {"index": "1", "kernel": "non linux entry", "default": True},
+            ],
+        )
+        self.assertEqual(grubby.get_facts("", ""), [])
+        self.assertEqual(grubby.get_facts("no kernels\n", "0"), [])
+
+    def test_grubby_entry(self):
+        entry = grubby.parse_grubby_info(INFO, "0")[0]
+        self.assertTrue(entry.default)
+        self.assertEqual(entry.args, "ro quiet")
+        self.assertIsNone(entry.root)
+        self.assertEqual(entry.extra, {"extra": "1"})
+        with self.assertRaises(AttributeError):
+            entry.unknown = "value"
+
+    def test_check_grubby_read(self):
+        module = MagicMock(fail_json=MagicMock(side_effect=SystemExit))
+        grubby.check_grubby_read(module, "grubby --info=ALL", (0, INFO, ""))
+        module.fail_json.assert_not_called()
+
+        with self.assertRaises(SystemExit):
+            grubby.check_grubby_read(
+                module, "grubby --info=ALL", (1, "", "grubby: no boot entries\n")
+            )
+        module.fail_json.assert_called_once_with(
+            msg="Command 'grubby --info=ALL' failed with rc 1: grubby: no boot entries",
+            rc=1,
+            stdout="",
+            stderr="grubby: no boot entries\n",
+        )
+
+        module.fail_json.reset_mock()
+        with self.assertRaises(SystemExit):
+            grubby.check_grubby_read(
+                module, "grubby --info=ALL", (1, "", "Permission denied"), changed=False
+            )
+        module.fail_json.assert_called_once_with(
+            msg="You must run this as sudo", changed=False
+        )
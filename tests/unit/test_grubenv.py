@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.grubenv module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ansible.module_utils.bootloader_lsr import grubenv
+
+VARIABLES = b"saved_entry=m-6.5.7\nkernelopts=root=UUID=65c7 ro quiet\nboot_success=1\n"
+
+
+def grubenv_block(variables):
+    block = grubenv.GRUBENV_HEADER + variables
+    return block + b"#" * (grubenv.GRUBENV_SIZE - len(block))
+
+
+class Grubenv(unittest.TestCase):
+    """test reading and writing the grub environment block"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.grubenv = os.path.join(self.tmpdir, "grubenv")
+        with open(self.grubenv, "wb") as grubenv_fd:
+            grubenv_fd.write(grubenv_block(VARIABLES))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_grubenv(self):
+        self.assertEqual(
+            grubenv.read_grubenv(self.grubenv),
+            {
+                "saved_entry": "m-6.5.7",
+                "kernelopts": "root=UUID=65c7 ro quiet",
+                "boot_success": "1",
+            },
+        )
+        self.assertEqual(grubenv.read_grubenv(self.grubenv + ".missing"), {})
+
+    def test_get_saved_entry_index(self):
+        entries = [{"id": "m-6.5.12", "title": "6.5.12"}, {"id": "m-6.5.7"}]
+        self.assertEqual(grubenv.get_saved_entry_index(entries, "m-6.5.7"), 1)
+        self.assertEqual(grubenv.get_saved_entry_index(entries, "6.5.12"), 0)
+        self.assertEqual(grubenv.get_saved_entry_index(entries, "1"), 1)
+        self.assertEqual(grubenv.get_saved_entry_index(entries, None), 0)
+        self.assertEqual(grubenv.get_saved_entry_index(entries, "missing"), 0)
+
+    def test_get_grubenv_block(self):
+        self.assertEqual(
+            grubenv.get_grubenv_block(self.grubenv, "saved_entry", "m-6.5.12"),
+            grubenv_block(VARIABLES.replace(b"m-6.5.7", b"m-6.5.12")),
+        )
+        self.assertEqual(
+            grubenv.get_grubenv_block(self.grubenv, "menu_auto_hide", "1"),
+            grubenv_block(VARIABLES + b"menu_auto_hide=1\n"),
+        )
+        with self.assertRaises(ValueError):
+            grubenv.get_grubenv_block(self.grubenv, "kernelopts", "x" * 1024)
+        with open(self.grubenv, "wb") as grubenv_fd:
+            grubenv_fd.write(VARIABLES)
+        with self.assertRaises(ValueError):
+            grubenv.get_grubenv_block(self.grubenv, "saved_entry", "m-6.5.12")
+
+    def test_write_grubenv_block(self):
+        link = os.path.join(self.tmpdir, "grubenv.link")
+        os.symlink(self.grubenv, link)
+        block = grubenv.get_grubenv_block(link, "saved_entry", "m-6.5.12")
+        grubenv.write_grubenv_block(link, block)
+        self.assertTrue(os.path.islink(link))
+        with open(self.grubenv, "rb") as grubenv_fd:
+            self.assertEqual(grubenv_fd.read(), block)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ["grubenv", "grubenv.link"])
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.instrument module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import threading
+import unittest
+
+try:
+    from unittest.mock import MagicMock, patch
+except ImportError:
+    from mock import MagicMock, patch
+
+from ansible.module_utils.bootloader_lsr import instrument
+
+
+class Instrumentation(unittest.TestCase):
+    """test counting and timing commands and phases"""
+
+    def test_instrumentation(self):
+        ticks = iter(range(100))
+        module = MagicMock(run_command=MagicMock(return_value=(0, "out", "")))
+        with patch.object(instrument, "timer", side_effect=lambda: next(ticks)):
+            instrumentation = instrument.Instrumentation()
+            with instrumentation.phase("parse"):
+                self.assertEqual(
+                    instrumentation.run_command(module, "grubby --info=ALL"),
+                    (0, "out", ""),
+                )
+                with instrumentation.phase("validate"):
+                    pass
+            with instrumentation.phase("apply"):
+                instrumentation.run_command(module, "grubby --args=quiet", write=True)
+            result = instrumentation.get_result()
+        module.run_command.assert_called_with("grubby --args=quiet")
+        self.assertEqual(result["reads"], 1)
+        self.assertEqual(result["writes"], 1)
+        self.assertEqual(
+            [(command["cmd"], command["write"]) for command in result["commands"]],
+            [("grubby --info=ALL", False), ("grubby --args=quiet", True)],
+        )
+        # Each call of the timer takes one tick, the ticks of nested phases
+        # and commands are not accounted to the enclosing phase
+        self.assertEqual(result["commands"][0]["time"], 3)
+        self.assertEqual(
+            result["phases"], {"parse": 5, "validate": 1, "apply": 4, "commands": 2}
+        )
+        self.assertEqual(result["total"], 15)
+
+    def test_start(self):
+        instrumentation = instrument.Instrumentation()
+        instrumentation.run_command(
+            MagicMock(run_command=MagicMock(return_value=(0, "", ""))), "grubby"
+        )
+        instrumentation.start()
+        self.assertEqual(instrumentation.get_result()["commands"], [])
+
+    def test_run_read_commands(self):
+        both_running = threading.Barrier(2) if hasattr(threading, "Barrier") else None
+
+        def run_command(cmd, handle_exceptions=True):
+            # Errors are failed in the caller rather than in the threads
+            self.assertFalse(handle_exceptions)
+            if both_running is not None:
+                # Fails with BrokenBarrierError unless both commands run at once
+                both_running.wait(timeout=5)
+            return (0, cmd.upper(), "")
+
+        module = MagicMock(run_command=MagicMock(side_effect=run_command))
+        instrumentation = instrument.Instrumentation()
+        self.assertEqual(
+            instrumentation.run_read_commands(module, ["a", "b"]),
+            [(0, "A", ""), (0, "B", "")],
+        )
+        result = instrumentation.get_result()
+        self.assertEqual(result["reads"], 2)
+        self.assertEqual(
+            sorted(command["cmd"] for command in result["commands"]), ["a", "b"]
+        )
+        self.assertEqual(list(result["phases"]), ["commands"])
+
+    def test_run_read_commands_error(self):
+        def run_command(cmd, handle_exceptions=True):
+            if cmd == "b":
+                raise SystemExit(1)
+            return (0, "", "")
+
+        module = MagicMock(run_command=MagicMock(side_effect=run_command))
+        instrumentation = instrument.Instrumentation()
+        with self.assertRaises(SystemExit):
+            instrumentation.run_read_commands(module, ["a", "b", "c"], max_workers=2)
+        self.assertEqual(module.run_command.call_count, 3)
+
+    def test_run_read_commands_start_error(self):
+        failed_in = []
+
+        def fail_json(**kwargs):
+            failed_in.append(threading.current_thread())
+            raise SystemExit(1)
+
+        def run_command(cmd, handle_exceptions=True):
+            raise OSError(2, "No such file or directory")
+
+        module = MagicMock(
+            run_command=MagicMock(side_effect=run_command),
+            fail_json=MagicMock(side_effect=fail_json),
+        )
+        instrumentation = instrument.Instrumentation()
+        with self.assertRaises(SystemExit):
+            instrumentation.run_read_commands(module, ["a", "b"])
+        self.assertEqual(module.run_command.call_count, 2)
+        self.assertEqual(failed_in, [threading.current_thread()])
+        self.assertEqual(module.fail_json.call_args[1]["rc"], 2)
+
+    def test_run_read_commands_without_handle_exceptions(self):
+        calls = []
+
+        class Module(object):
+            def run_command(self, cmd):
+                calls.append((cmd, threading.current_thread()))
+                return (0, "", "")
+
+        instrumentation = instrument.Instrumentation()
+        instrumentation.run_read_commands(Module(), ["a", "b"])
+        # Older Ansible fails the module from run_command(), so no threads
+        self.assertEqual(
+            calls,
+            [("a", threading.current_thread()), ("b", threading.current_thread())],
+        )
+
+    def test_run_read_commands_timeout(self):
+        failed_in = []
+
+        def fail_json(**kwargs):
+            failed_in.append(threading.current_thread())
+            raise SystemExit(1)
+
+        module = MagicMock(
+            run_command=MagicMock(return_value=(124, "", "")),
+            fail_json=MagicMock(side_effect=fail_json),
+        )
+        instrumentation = instrument.Instrumentation()
+        instrumentation.start(command_timeout=1)
+        with self.assertRaises(SystemExit):
+            instrumentation.run_read_commands(module, ["a", "b"])
+        self.assertEqual(module.run_command.call_count, 2)
+        # Only the calling thread fails the module, once
+        self.assertEqual(failed_in, [threading.current_thread()])
+
+    def test_command_timeout(self):
+        module = MagicMock(
+            run_command=MagicMock(return_value=(0, "", "")),
+            fail_json=MagicMock(side_effect=SystemExit),
+        )
+        instrumentation = instrument.Instrumentation()
+        instrumentation.start(command_timeout=30)
+        instrumentation.run_command(module, "grubby --info=ALL")
+        module.run_command.assert_called_once_with("timeout -k 5 30 grubby --info=ALL")
+
+        module.run_command.return_value = (124, "", "")
+        with self.assertRaises(SystemExit):
+            instrumentation.run_command(module, "grubby --args=quiet", write=True)
+        module.fail_json.assert_called_once_with(
+            msg="Command 'grubby --args=quiet' did not finish within 30 seconds",
+            rc=124,
+            stdout="",
+            stderr="",
+        )
+
+    def test_total_timeout(self):
+        module = MagicMock(
+            run_command=MagicMock(return_value=(0, "", "")),
+            fail_json=MagicMock(side_effect=SystemExit),
+        )
+        instrumentation = instrument.Instrumentation()
+        with patch.object(instrument, "timer", return_value=100):
+            instrumentation.start(command_timeout=30, total_timeout=60)
+        with patch.object(instrument, "timer", return_value=145.5):
+            instrumentation.run_command(module, "grubby --info=ALL")
+            self.assertEqual(
+                instrumentation.check_deadline(module, "writing grubenv"), 14.5
+            )
+        module.run_command.assert_called_once_with("timeout -k 5 15 grubby --info=ALL")
+        with patch.object(instrument, "timer", return_value=160):
+            with self.assertRaises(SystemExit):
+                instrumentation.check_deadline(module, "writing grubenv")
+        module.fail_json.assert_called_once_with(
+            msg="The module did not finish within 60 seconds, stopped before writing grubenv"
+        )
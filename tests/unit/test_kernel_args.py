@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.kernel_args module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import unittest
+
+from ansible.module_utils.bootloader_lsr.kernel_args import KernelArgs, tokenize_args
+
+
+class KernelArgsTest(unittest.TestCase):
+    """test tokenizing and diffing kernel arguments"""
+
+    def test_tokenize_args(self):
+        self.assertEqual(
+            tokenize_args(' ro  dyndbg="file x.c +p"\tquiet "a b" '),
+            ["ro", 'dyndbg="file x.c +p"', "quiet", '"a b"'],
+        )
+        self.assertEqual(tokenize_args(""), [])
+
+    def test_kernel_args(self):
+        args = KernelArgs.parse("ro console=tty0 quiet console=ttyS0 $tuned_params")
+        self.assertEqual(str(args), "ro console=tty0 quiet console=ttyS0 $tuned_params")
+        self.assertEqual(len(args), 5)
+        self.assertIn("console=tty0", args)
+        self.assertNotIn("console", args)
+        self.assertTrue(args.has_name("console"))
+        self.assertTrue(args.has_name("$tuned_params"))
+        self.assertFalse(args.has_name("con"))
+        self.assertEqual(args.get_tokens("console"), ["console=tty0", "console=ttyS0"])
+        self.assertEqual(
+            args, KernelArgs.parse("$tuned_params quiet console=ttyS0 ro console=tty0")
+        )
+        self.assertNotEqual(args, KernelArgs.parse("ro console=tty0 quiet"))
+        self.assertNotEqual(args, KernelArgs.parse(str(args) + " quiet"))
+
+    def test_get_delta(self):
+        args = KernelArgs.parse("ro console=tty0 quiet console=ttyS0")
+        self.assertEqual(args.get_delta(args), ([], []))
+        self.assertEqual(
+            args.get_delta(KernelArgs.parse("ro console=tty0 debug console=ttyS1")),
+            (
+                ["console=tty0", "console=ttyS0", "quiet"],
+                ["console=tty0", "console=ttyS1", "debug"],
+            ),
+        )
+        self.assertEqual(
+            KernelArgs.parse('a="x y" b').get_delta(KernelArgs.parse('a="x z" b')),
+            (['a="x y"'], ['a="x z"']),
+        )
+
+    def test_update(self):
+        args = KernelArgs.parse("ro quiet console=tty0 rhgb debug=1 quiet")
+        self.assertEqual(
+            str(args.update(["quiet"], ["console=ttyS0"])),
+            "ro rhgb debug=1 quiet console=ttyS0",
+        )
+        self.assertEqual(
+            str(args.update(["debug"], [])), "ro quiet console=tty0 rhgb quiet"
+        )
+        self.assertEqual(str(args.update(["debug=2"], [])), str(args))
+        self.assertEqual(
+            str(args.update([], ['debug="1 2"'])),
+            'ro quiet console=tty0 rhgb quiet debug="1 2"',
+        )
+        self.assertEqual(str(args), "ro quiet console=tty0 rhgb debug=1 quiet")
+
+    def test_get_parsed(self):
+        args = KernelArgs.parse('ro console=tty0 console=ttyS0,115200 x="a b" k=')
+        self.assertEqual(
+            args.get_parsed(),
+            {
+                "options": [
+                    {"name": "ro"},
+                    {"name": "console", "value": "tty0"},
+                    {"name": "console", "value": "ttyS0,115200"},
+                    {"name": "x", "value": '"a b"'},
+                    {"name": "k", "value": ""},
+                ],
+                "values": {
+                    "ro": [None],
+                    "console": ["tty0", "ttyS0,115200"],
+                    "x": ['"a b"'],
+                    "k": [""],
+                },
+            },
+        )
+        self.assertEqual(
+            KernelArgs.parse("").get_parsed(), {"options": [], "values": {}}
+        )
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.lock module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ansible.module_utils.bootloader_lsr import lock
+
+
+class HostLock(unittest.TestCase):
+    """test the host lock of the boot configuration"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.lock_file = os.path.join(self.tmpdir, "bootloader.lock")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_acquire_release(self):
+        lock_fd = lock.acquire_lock(self.lock_file, 0)
+        self.assertIsNotNone(lock_fd)
+        # flock locks of separate open files exclude each other
+        started = time.time()
+        self.assertIsNone(lock.acquire_lock(self.lock_file, 0.3))
+        self.assertGreaterEqual(time.time() - started, 0.3)
+        lock.release_lock(lock_fd)
+        self.assertTrue(lock_fd.closed)
+        lock_fd = lock.acquire_lock(self.lock_file, 0)
+        self.assertIsNotNone(lock_fd)
+        lock.release_lock(lock_fd)
+
+    def test_acquire_missing_dir(self):
+        lock_file = os.path.join(self.tmpdir, "run", "lock", "bootloader.lock")
+        lock_fd = lock.acquire_lock(lock_file, 0)
+        self.assertIsNotNone(lock_fd)
+        self.assertTrue(os.path.isfile(lock_file))
+        lock.release_lock(lock_fd)
+
+    def test_acquire_error(self):
+        # The directory cannot be created where a file is
+        with open(self.lock_file, "w"):
+            pass
+        with self.assertRaises((IOError, OSError)):
+            lock.acquire_lock(os.path.join(self.lock_file, "missing"), 0)
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.profiling module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest.mock import MagicMock
+except ImportError:
+    from mock import MagicMock
+
+from ansible.module_utils.bootloader_lsr import profiling
+
+
+def work():
+    return sorted(str(number) for number in range(1000))
+
+
+class Profiling(unittest.TestCase):
+    """test profiling a module run"""
+
+    def setUp(self):
+        self.module = MagicMock()
+        self.result = {}
+
+    def profile(self, environ):
+        profiler = profiling.start_profiler(environ)
+        work()
+        profiling.stop_profiler(self.module, profiler, self.result, environ)
+        return profiler
+
+    def test_disabled(self):
+        self.assertIsNone(self.profile({}))
+        self.assertEqual(self.result, {})
+
+    def test_top_entries(self):
+        self.profile({profiling.PROFILE_ENV: "3"})
+        self.assertEqual(len(self.result["profile"]), 3)
+        self.assertIn(
+            "work", [entry["function"][-5:-1] for entry in self.result["profile"]]
+        )
+        cumtimes = [entry["cumtime"] for entry in self.result["profile"]]
+        self.assertEqual(cumtimes, sorted(cumtimes, reverse=True))
+
+    def test_dump_stats(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "bootloader.pstats")
+        try:
+            self.profile({profiling.PROFILE_ENV: path})
+            self.assertEqual(self.result, {"profile_file": path})
+            self.assertTrue(pstats.Stats(path).stats)
+            self.result = {}
+            self.profile({profiling.PROFILE_ENV: os.path.join(path, "missing")})
+            self.assertEqual(self.result, {})
+            self.assertEqual(self.module.warn.call_count, 1)
+        finally:
+            shutil.rmtree(tmpdir)
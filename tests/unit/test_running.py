@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+# SPDX-License-Identifier: GPL-2.0-or-later
+#
+"""Unit tests for the bootloader_lsr.running module_utils"""
+
+from __future__ import absolute_import, division, print_function
+
+__metaclass__ = type
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ansible.module_utils.bootloader_lsr import running
+
+FACTS = [
+    {
+        "args": "ro quiet $tuned_params",
+        "default": False,
+        "id": "m-6.6.4",
+        "index": "0",
+        "kernel": "/boot/vmlinuz-6.6.4",
+        "root": "UUID=1",
+        "title": "Fedora Linux (6.6.4)",
+    },
+    {
+        "args": "ro quiet",
+        "default": True,
+        "id": "m-6.5.7",
+        "index": "1",
+        "kernel": "/boot/vmlinuz-6.5.7",
+        "root": "UUID=1",
+        "title": "Fedora Linux (6.5.7)",
+    },
+]
+
+
+class RunningKernel(unittest.TestCase):
+    """test comparing the running kernel with the configured default"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.proc_cmdline = os.path.join(self.tmpdir, "cmdline")
+        self.boot_id = os.path.join(self.tmpdir, "boot_id")
+        self.grubenv = os.path.join(self.tmpdir, "grubenv")
+        with open(self.boot_id, "w") as file_fd:
+            file_fd.write("5b4c5bc4\n")
+        with open(self.grubenv, "w") as file_fd:
+            file_fd.write("# GRUB Environment Block\ntuned_params=skew_tick=1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def get_running_facts(self, cmdline, facts=None, release="6.5.7"):
+        with open(self.proc_cmdline, "w") as file_fd:
+            file_fd.write(cmdline + "\n")
+        return running.get_running_facts(
+            FACTS if facts is None else facts,
+            self.proc_cmdline,
+            self.boot_id,
+            self.grubenv,
+            release,
+        )
+
+    def test_running_default(self):
+        facts = self.get_running_facts(
+            "BOOT_IMAGE=(hd0,gpt2)/vmlinuz-6.5.7 root=UUID=1 ro quiet"
+        )
+        self.assertEqual(
+            facts,
+            {
+                "cmdline": "BOOT_IMAGE=(hd0,gpt2)/vmlinuz-6.5.7 root=UUID=1 ro quiet",
+                "boot_id": "5b4c5bc4",
+                "release": "6.5.7",
+                "entry": {
+                    "index": "1",
+                    "id": "m-6.5.7",
+                    "kernel": "/boot/vmlinuz-6.5.7",
+                    "title": "Fedora Linux (6.5.7)",
+                },
+                "default": True,
+                "diff": {"running_only": [], "configured_only": []},
+                "drift": False,
+            },
+        )
+
+    def test_running_drift(self):
+        facts = self.get_running_facts("root=UUID=1 ro debug quiet quiet")
+        self.assertTrue(facts["default"])
+        self.assertEqual(
+            facts["diff"], {"running_only": ["debug", "quiet"], "configured_only": []}
+        )
+        self.assertTrue(facts["drift"])
+
+        facts = self.get_running_facts(
+            "BOOT_IMAGE=/vmlinuz-6.6.4 root=UUID=1 ro quiet", release="6.6.4"
+        )
+        self.assertEqual(facts["entry"]["index"], "0")
+        self.assertFalse(facts["default"])
+        self.assertEqual(facts["diff"]["running_only"], [])
+        self.assertTrue(facts["drift"])
+
+        default_facts = [dict(FACTS[0], default=True), dict(FACTS[1], default=False)]
+        facts = self.get_running_facts(
+            "BOOT_IMAGE=/vmlinuz-6.6.4 root=UUID=1 ro quiet", default_facts, "6.6.4"
+        )
+        self.assertEqual(facts["diff"]["configured_only"], ["skew_tick=1"])
+
+    def test_running_unknown(self):
+        facts = self.get_running_facts("ro", release="7.0.0")
+        self.assertIsNone(facts["entry"])
+        self.assertFalse(facts["default"])
+        self.assertIsNone(self.get_running_facts("ro", facts=[])["diff"])
+        os.unlink(self.proc_cmdline)
+        self.assertIsNone(
+            running.get_running_facts(FACTS, self.proc_cmdline, self.boot_id)
+        )
+
+    def test_expand_grub_variables(self):
+        self.assertEqual(
+            running.expand_grub_variables("ro $a ${b} $c", {"a": "x=1", "b": "y"}),
+            "ro x=1 y ",
+        )
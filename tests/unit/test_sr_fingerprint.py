@@ -326,6 +326,31 @@ class TestSrFingerprint(unittest.TestCase):
         self.assertIn("fingerprint", result)
         self.assertNotIn("jsonl_row", result)
 
+    def test_handle_fingerprint_instrumentation(self):
+        module = _FakeModule(
+            {
+                "status": "begin",
+                "write_log_file": False,
+                "max_log_size": 2000000,
+                "role_name": "systemd",
+                "role_path": "/usr/share/ansible/roles/linux-system-roles.systemd",
+                "ansible_play_hosts_all": ["host1"],
+                "distribution": "RedHat",
+                "distribution_version": "9.4",
+                "instrumentation": True,
+            },
+            check_mode=False,
+        )
+        with self.assertRaises(_ExitJsonException) as ctx:
+            sr_fingerprint._handle_fingerprint(module)
+        instrumentation = ctx.exception.kwargs["instrumentation"]
+        self.assertEqual(instrumentation["reads"], 0)
+        self.assertEqual(instrumentation["writes"], 0)
+        self.assertEqual(sorted(instrumentation["phases"]), ["collect", "log"])
+        self.assertGreaterEqual(
+            instrumentation["total"], sum(instrumentation["phases"].values())
+        )
+
     def test_handle_fingerprint_check_mode_with_log_file(self):
         log_path = os.path.join(tempfile.gettempdir(), "test_sr_fingerprint.jsonl")
         module = _FakeModule(